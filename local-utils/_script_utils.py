@@ -0,0 +1,69 @@
+"""Helpers shared by the scripts in `local-utils`, which import this module from the directory they are run from"""
+
+from pathlib import Path
+import importlib
+import importlib.util
+
+from plover import system
+from plover.config import DEFAULT_SYSTEM_NAME
+from plover.registry import registry
+
+
+DEFAULT_THEORY = "plover_hatchery.lib.theory_presets.amphitheory"
+
+
+def setup_plover():
+    registry.update()
+    system.setup(DEFAULT_SYSTEM_NAME)
+
+
+def percent(count: int, total: int):
+    return f"{count} ({count / total * 100:.2f}%)" if total > 0 else f"{count}"
+
+
+def load_theory(theory_spec: str):
+    """Loads the `theory` defined by a module, given either its import name or the path to its file"""
+
+    if theory_spec.endswith(".py"):
+        module_spec = importlib.util.spec_from_file_location(f"_loaded_theory_{Path(theory_spec).stem}", theory_spec)
+        if module_spec is None or module_spec.loader is None:
+            raise ValueError(f"cannot load a theory from {theory_spec}")
+
+        module = importlib.util.module_from_spec(module_spec)
+        module_spec.loader.exec_module(module)
+    else:
+        module = importlib.import_module(theory_spec)
+
+    return module.theory
+
+
+_worker_lookup = None
+_worker_translations: set[str] = set()
+
+
+def init_worker(hatchery_path: str, theory_spec: str=DEFAULT_THEORY):
+    """Builds the lookup of a theory over a Hatchery dictionary, for the functions a worker process runs to use through
+    `worker_lookup`"""
+
+    global _worker_lookup, _worker_translations
+
+    from plover_hatchery.lib.dictionary import read_hatchery_dictionary, all_entries
+
+    setup_plover()
+
+    theory = load_theory(theory_spec)
+    dictionary = read_hatchery_dictionary(hatchery_path)
+    _worker_lookup = theory.build_lookup(entry_lines=all_entries(dictionary), filename=hatchery_path)
+    _worker_translations = set(dictionary["entries"])
+
+
+def worker_lookup():
+    assert _worker_lookup is not None, "init_worker has not been called in this process"
+
+    return _worker_lookup
+
+
+def worker_translations():
+    """The translations of the Hatchery dictionary that `init_worker` built the lookup over"""
+
+    return _worker_translations
@@ -0,0 +1,272 @@
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from itertools import batched, groupby
+from pathlib import Path
+import argparse
+import heapq
+import json
+import os
+import tempfile
+import timeit
+
+from _script_utils import init_worker, percent, setup_plover, worker_lookup
+
+
+TRANSLATIONS_PER_JOB = 500
+"""How many translations of the Hatchery dictionary a worker process enumerates outlines for at a time"""
+
+MAX_MERGE_FAN_IN = 256
+"""How many sorted runs are merged at once. Any more are first merged into intermediate runs"""
+
+
+# Each record is one line, `outline<TAB>cost<TAB>translation as JSON`, so that sorting records as strings groups them by
+# outline. Outlines cannot contain tabs or newlines, and the JSON encoding escapes any in the translation
+
+def _format_record(outline: tuple[str, ...], cost: float, translation: str):
+    return f"{'/'.join(outline)}\t{cost!r}\t{json.dumps(translation, ensure_ascii=False)}\n"
+
+
+def _parse_record(line: str):
+    outline_steno, cost_str, translation_json = line.rstrip("\n").split("\t", 2)
+    return outline_steno, float(cost_str), json.loads(translation_json)
+
+
+def _record_outline(line: str):
+    return line.split("\t", 1)[0]
+
+
+def _write_run(lines: list[str], run_dir: Path):
+    lines.sort()
+
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=run_dir, suffix=".run", delete=False) as file:
+        file.writelines(lines)
+
+    return Path(file.name)
+
+
+def _merge_runs(run_paths: list[Path], run_dir: Path) -> Iterator[str]:
+    """Merges sorted runs into one sorted stream of records, deleting each run once it has been read"""
+
+    while len(run_paths) > MAX_MERGE_FAN_IN:
+        run_paths = [
+            _merge_runs_into_run(list(group), run_dir)
+            for group in batched(run_paths, MAX_MERGE_FAN_IN)
+        ]
+
+    files = [open(path, "r", encoding="utf-8") for path in run_paths]
+    try:
+        yield from heapq.merge(*files)
+    finally:
+        for file, path in zip(files, run_paths):
+            file.close()
+            path.unlink()
+
+
+def _merge_runs_into_run(run_paths: list[Path], run_dir: Path):
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=run_dir, suffix=".run", delete=False) as file:
+        file.writelines(_merge_runs(run_paths, run_dir))
+
+    return Path(file.name)
+
+
+@dataclass
+class _ShardResult:
+    run_paths: list[Path] = field(default_factory=list)
+    n_records: int = 0
+    n_translations_with_outlines: int = 0
+
+
+def _enumerate_shard(
+    translations: Iterable[str],
+    max_cost: float | None,
+    max_outlines: int | None,
+    records_per_run: int,
+    run_dir: Path,
+):
+    """Enumerates the outlines of some translations, spilling them to disk as sorted runs of records"""
+
+    lookup = worker_lookup()
+
+    result = _ShardResult()
+    lines: list[str] = []
+
+    for translation in translations:
+        outlines = lookup.reverse_lookup_with_costs(translation, max_cost, max_outlines)
+        if len(outlines) > 0:
+            result.n_translations_with_outlines += 1
+
+        for outline, cost in outlines:
+            lines.append(_format_record(outline, cost, translation))
+
+            if len(lines) >= records_per_run:
+                result.run_paths.append(_write_run(lines, run_dir))
+                result.n_records += len(lines)
+                lines = []
+
+    if len(lines) > 0:
+        result.run_paths.append(_write_run(lines, run_dir))
+        result.n_records += len(lines)
+
+    return result
+
+
+@dataclass(frozen=True)
+class _ConflictCluster:
+    outline: str
+    choices: tuple[tuple[str, float], ...]
+    """(translation, cost) of every translation of the outline, cheapest first"""
+
+    @property
+    def cost_gap(self):
+        """How much cheaper the first choice is than the second. The smaller the gap, the more easily a small change
+        to the theory swaps which translation wins"""
+
+        return self.choices[1][1] - self.choices[0][1]
+
+
+@dataclass
+class _ConflictReport:
+    n_outlines: int = 0
+    n_conflicts: int = 0
+    n_ties: int = 0
+    """Conflicts whose first and second choices cost the same"""
+    clusters: list[_ConflictCluster] = field(default_factory=list)
+    """The conflicts with the smallest cost gaps, smallest first"""
+
+
+def _find_conflicts(records: Iterable[str], n_clusters: int):
+    report = _ConflictReport()
+
+    # The clusters with the smallest gaps so far, as a heap whose top is the largest gap (and, among equal gaps, the
+    # latest outline), so that it is the first to be evicted
+    kept_clusters: list[tuple[float, int, _ConflictCluster]] = []
+
+    for outline_steno, lines in groupby(records, key=_record_outline):
+        report.n_outlines += 1
+
+        min_costs: dict[str, float] = {}
+        for line in lines:
+            _, cost, translation = _parse_record(line)
+            if cost < min_costs.get(translation, float("inf")):
+                min_costs[translation] = cost
+
+        if len(min_costs) < 2: continue
+
+        cluster = _ConflictCluster(outline_steno, tuple(sorted(min_costs.items(), key=lambda item: item[1])))
+
+        report.n_conflicts += 1
+        if cluster.cost_gap == 0:
+            report.n_ties += 1
+
+        heap_item = (-cluster.cost_gap, -report.n_conflicts, cluster)
+        if len(kept_clusters) < n_clusters:
+            heapq.heappush(kept_clusters, heap_item)
+        elif n_clusters > 0 and -cluster.cost_gap > kept_clusters[0][0]:
+            _ = heapq.heapreplace(kept_clusters, heap_item)
+
+    report.clusters = [cluster for _, _, cluster in sorted(kept_clusters, key=lambda item: (-item[0], -item[1]))]
+    return report
+
+
+def _main(args: argparse.Namespace):
+    from plover_hatchery.lib.dictionary import read_hatchery_dictionary
+
+    root = Path(os.getcwd())
+    hatchery_path = root / args.hatchery_path
+
+    translations = sorted(set(read_hatchery_dictionary(str(hatchery_path))["entries"]))
+    jobs = list(batched(translations, TRANSLATIONS_PER_JOB))
+
+    run_dir = Path(tempfile.mkdtemp(prefix="hatchery-conflicts-", dir=None if args.temp_dir is None else root / args.temp_dir))
+
+    shard_result = _ShardResult()
+    report = _ConflictReport()
+
+    def merge_shard_result(result: _ShardResult):
+        shard_result.run_paths.extend(result.run_paths)
+        shard_result.n_records += result.n_records
+        shard_result.n_translations_with_outlines += result.n_translations_with_outlines
+
+    def enumerate_outlines():
+        if args.jobs == 1:
+            init_worker(str(hatchery_path))
+            for job in jobs:
+                merge_shard_result(_enumerate_shard(job, args.max_cost, args.max_outlines, args.records_per_run, run_dir))
+            return
+
+        with ProcessPoolExecutor(max_workers=args.jobs, initializer=init_worker, initargs=(str(hatchery_path),)) as executor:
+            futures = [
+                executor.submit(_enumerate_shard, job, args.max_cost, args.max_outlines, args.records_per_run, run_dir)
+                for job in jobs
+            ]
+            for future in futures:
+                merge_shard_result(future.result())
+
+    def find_conflicts():
+        nonlocal report
+        report = _find_conflicts(_merge_runs(shard_result.run_paths, run_dir), args.n_clusters)
+
+    try:
+        enumerate_duration = timeit.timeit(enumerate_outlines, number=1)
+        find_duration = timeit.timeit(find_conflicts, number=1)
+    finally:
+        for path in run_dir.iterdir():
+            path.unlink()
+        run_dir.rmdir()
+
+
+    print(f"\x1b[1;36m{args.hatchery_path}\x1b[0m")
+    print(f"    {len(translations)} translations")
+    print(f"    {percent(shard_result.n_translations_with_outlines, len(translations))} produce outlines")
+    print(f"    {shard_result.n_records} (outline, translation) pairs on {report.n_outlines} outlines")
+    print(f"    \x1b[31m{percent(report.n_conflicts, report.n_outlines)} outlines have more than one translation\x1b[0m")
+    print(f"    {percent(report.n_ties, report.n_conflicts)} of conflicts are tied between the first and second choices")
+    print(f"    Enumerating outlines took {enumerate_duration} s across {args.jobs} processes")
+    print(f"    Finding conflicts took {find_duration} s")
+
+    for cluster in report.clusters[:args.n_examples]:
+        choices_str = ", ".join(f"{translation!r} ({cost:g})" for translation, cost in cluster.choices)
+        print(f"    {cluster.outline}: gap {cluster.cost_gap:g}: {choices_str}")
+
+
+    if args.report_path is not None:
+        report_path = root / args.report_path
+        report_path.parent.mkdir(exist_ok=True, parents=True)
+        with open(report_path, "w", encoding="utf-8") as file:
+            json.dump({
+                "path": str(args.hatchery_path),
+                "max_cost": args.max_cost,
+                "max_outlines": args.max_outlines,
+                "n_translations": len(translations),
+                "n_translations_with_outlines": shard_result.n_translations_with_outlines,
+                "n_records": shard_result.n_records,
+                "n_outlines": report.n_outlines,
+                "n_conflicts": report.n_conflicts,
+                "n_ties": report.n_ties,
+                "clusters": [
+                    {
+                        "outline": cluster.outline,
+                        "cost_gap": cluster.cost_gap,
+                        "choices": [{"translation": translation, "cost": cost} for translation, cost in cluster.choices],
+                    }
+                    for cluster in report.clusters
+                ],
+            }, file, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Enumerates the outlines of every translation in a Hatchery dictionary and reports the outlines that more than one translation shares, ranked by how close their first and second choices are")
+    _ = parser.add_argument("-d", "--hatchery-path", "--hatchery", help="path to the Hatchery dictionary to analyze", required=True)
+    _ = parser.add_argument("-r", "--report-path", "--report", help="path to output the report as JSON, including every kept conflict cluster")
+    _ = parser.add_argument("-c", "--max-cost", type=float, help="only consider outlines that cost at most this much (default: no limit)")
+    _ = parser.add_argument("-m", "--max-outlines", type=int, help="only consider this many of the cheapest outlines of each translation (default: no limit)")
+    _ = parser.add_argument("-k", "--n-clusters", type=int, default=1000, help="number of conflict clusters with the smallest cost gaps to keep in the report (default: 1000)")
+    _ = parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="number of processes to enumerate outlines with, each of which builds its own lookup (default: number of CPUs; 1 to enumerate in this process)")
+    _ = parser.add_argument("--records-per-run", type=int, default=200_000, help="number of (outline, translation) pairs each process sorts in memory before spilling them to disk (default: 200000)")
+    _ = parser.add_argument("--temp-dir", help="directory to spill sorted runs to (default: the system's temporary directory)")
+    _ = parser.add_argument("-n", "--n-examples", type=int, default=20, help="number of conflict clusters to print (default: 20)")
+    args = parser.parse_args()
+
+    setup_plover()
+    _main(args)
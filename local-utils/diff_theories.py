@@ -0,0 +1,237 @@
+from collections.abc import Iterable, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+import argparse
+import json
+import os
+import random
+import timeit
+
+from plover.steno import normalize_steno
+
+from _script_utils import DEFAULT_THEORY, init_worker, percent, setup_plover, worker_lookup
+
+
+def _find_outlines(translations: Iterable[str], max_cost: float | None, max_outlines: int | None):
+    """Finds the outlines of each translation, cheapest first"""
+
+    lookup = worker_lookup()
+
+    return {
+        translation: tuple("/".join(outline) for outline, _ in lookup.reverse_lookup_with_costs(translation, max_cost, max_outlines))
+        for translation in translations
+    }
+
+
+def _find_winners(outline_stenos: Iterable[str]):
+    """Finds the translation that each outline looks up to"""
+
+    lookup = worker_lookup()
+
+    return [lookup.lookup(tuple(outline_steno.split("/"))) for outline_steno in outline_stenos]
+
+
+@dataclass
+class _OutlineSetChange:
+    translation: str
+    gained: tuple[str, ...]
+    lost: tuple[str, ...]
+    old_first: str | None
+    new_first: str | None
+
+
+@dataclass
+class _TheoryDiff:
+    n_translations: int = 0
+    n_outlines_a: int = 0
+    n_outlines_b: int = 0
+    outline_set_changes: list[_OutlineSetChange] = field(default_factory=list)
+    n_first_outline_changes: int = 0
+    """Translations whose cheapest outline changed"""
+
+    n_corpus_outlines: int = 0
+    winner_changes: list[tuple[str, str | None, str | None]] = field(default_factory=list)
+    """(outline, translation under A, translation under B) for each outline of the corpus that changed translation"""
+
+
+def _diff_outline_sets(outlines_a: dict[str, tuple[str, ...]], outlines_b: dict[str, tuple[str, ...]], diff: _TheoryDiff):
+    for translation, translation_outlines_a in outlines_a.items():
+        translation_outlines_b = outlines_b[translation]
+
+        diff.n_translations += 1
+        diff.n_outlines_a += len(translation_outlines_a)
+        diff.n_outlines_b += len(translation_outlines_b)
+
+        old_first = translation_outlines_a[0] if len(translation_outlines_a) > 0 else None
+        new_first = translation_outlines_b[0] if len(translation_outlines_b) > 0 else None
+        if old_first != new_first:
+            diff.n_first_outline_changes += 1
+
+        set_a = set(translation_outlines_a)
+        set_b = set(translation_outlines_b)
+        if set_a == set_b and old_first == new_first: continue
+
+        diff.outline_set_changes.append(_OutlineSetChange(
+            translation,
+            tuple(outline for outline in translation_outlines_b if outline not in set_a),
+            tuple(outline for outline in translation_outlines_a if outline not in set_b),
+            old_first,
+            new_first,
+        ))
+
+
+def _sample_corpus(
+    json_path: Path | None,
+    outline_sets: Iterable[dict[str, tuple[str, ...]]],
+    sample_size: int,
+    rng: random.Random,
+):
+    """Samples the outlines whose first-choice translations are compared, from a JSON dictionary if one is given, and
+    otherwise from the outlines that either theory produces"""
+
+    if json_path is not None:
+        with open(json_path, "r", encoding="utf-8") as file:
+            json_dict: dict[str, str] = json.load(file)
+
+        candidates: set[str] = set()
+        for outline_steno in json_dict:
+            try:
+                candidates.add("/".join(normalize_steno(outline_steno)))
+            except ValueError:
+                pass
+    else:
+        candidates = set(
+            outline_steno
+            for outline_set in outline_sets
+            for outlines in outline_set.values()
+            for outline_steno in outlines
+        )
+
+    candidates_list = sorted(candidates)
+    if len(candidates_list) <= sample_size:
+        return candidates_list
+
+    return sorted(rng.sample(candidates_list, sample_size))
+
+
+def _sample_translations(translations: Sequence[str], n_translations: int | None, rng: random.Random):
+    if n_translations is None or len(translations) <= n_translations:
+        return list(translations)
+
+    return sorted(rng.sample(translations, n_translations))
+
+
+def _main(args: argparse.Namespace):
+    from plover_hatchery.lib.dictionary import read_hatchery_dictionary
+
+    root = Path(os.getcwd())
+    hatchery_path = root / args.hatchery_path
+    rng = random.Random(args.seed)
+
+    translations = _sample_translations(sorted(set(read_hatchery_dictionary(str(hatchery_path))["entries"])), args.n_translations, rng)
+
+    diff = _TheoryDiff()
+
+    def diff_theories():
+        # Each theory gets its own process, which keeps its lookup between the two phases
+        with (
+            ProcessPoolExecutor(max_workers=1, initializer=init_worker, initargs=(str(hatchery_path), args.theory_a)) as executor_a,
+            ProcessPoolExecutor(max_workers=1, initializer=init_worker, initargs=(str(hatchery_path), args.theory_b)) as executor_b,
+        ):
+            outlines_a_future = executor_a.submit(_find_outlines, translations, args.max_cost, args.max_outlines)
+            outlines_b_future = executor_b.submit(_find_outlines, translations, args.max_cost, args.max_outlines)
+            outlines_a = outlines_a_future.result()
+            outlines_b = outlines_b_future.result()
+
+            _diff_outline_sets(outlines_a, outlines_b, diff)
+
+
+            corpus = _sample_corpus(
+                None if args.in_json_path is None else root / args.in_json_path,
+                (outlines_a, outlines_b),
+                args.sample_size,
+                rng,
+            )
+            diff.n_corpus_outlines = len(corpus)
+
+            winners_a_future = executor_a.submit(_find_winners, corpus)
+            winners_b_future = executor_b.submit(_find_winners, corpus)
+
+            for outline_steno, winner_a, winner_b in zip(corpus, winners_a_future.result(), winners_b_future.result()):
+                if winner_a != winner_b:
+                    diff.winner_changes.append((outline_steno, winner_a, winner_b))
+
+    duration = timeit.timeit(diff_theories, number=1)
+
+
+    n_gaining = sum(1 for change in diff.outline_set_changes if len(change.gained) > 0)
+    n_losing = sum(1 for change in diff.outline_set_changes if len(change.lost) > 0)
+
+    print(f"\x1b[1;36m{args.theory_a} → {args.theory_b}\x1b[0m")
+    print(f"    {diff.n_translations} translations: {diff.n_outlines_a} → {diff.n_outlines_b} outlines")
+    print(f"    \x1b[32m{percent(n_gaining, diff.n_translations)} gained outlines\x1b[0m")
+    print(f"    \x1b[31m{percent(n_losing, diff.n_translations)} lost outlines\x1b[0m")
+    print(f"    {percent(diff.n_first_outline_changes, diff.n_translations)} changed their cheapest outline")
+    print(f"    {percent(len(diff.winner_changes), diff.n_corpus_outlines)} of {diff.n_corpus_outlines} sampled outlines changed translation")
+    print(f"    Took {duration} s")
+
+    for change in diff.outline_set_changes[:args.n_examples]:
+        print(f"    {change.translation!r}: +{list(change.gained)} -{list(change.lost)}")
+
+    for outline_steno, winner_a, winner_b in diff.winner_changes[:args.n_examples]:
+        print(f"    {outline_steno}: {winner_a!r} → {winner_b!r}")
+
+
+    if args.report_path is not None:
+        report_path = root / args.report_path
+        report_path.parent.mkdir(exist_ok=True, parents=True)
+        with open(report_path, "w", encoding="utf-8") as file:
+            json.dump({
+                "theory_a": args.theory_a,
+                "theory_b": args.theory_b,
+                "path": str(args.hatchery_path),
+                "max_cost": args.max_cost,
+                "max_outlines": args.max_outlines,
+                "n_translations": diff.n_translations,
+                "n_outlines_a": diff.n_outlines_a,
+                "n_outlines_b": diff.n_outlines_b,
+                "n_translations_gaining_outlines": n_gaining,
+                "n_translations_losing_outlines": n_losing,
+                "n_first_outline_changes": diff.n_first_outline_changes,
+                "n_corpus_outlines": diff.n_corpus_outlines,
+                "n_winner_changes": len(diff.winner_changes),
+                "outline_set_changes": [
+                    {
+                        "translation": change.translation,
+                        "gained": change.gained,
+                        "lost": change.lost,
+                        "old_first": change.old_first,
+                        "new_first": change.new_first,
+                    }
+                    for change in diff.outline_set_changes
+                ],
+                "winner_changes": [
+                    {"outline": outline_steno, "a": winner_a, "b": winner_b}
+                    for outline_steno, winner_a, winner_b in diff.winner_changes
+                ],
+            }, file, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Builds lookups for two theories over the same Hatchery dictionary in parallel, and reports which translations gained or lost outlines and which outlines changed translation")
+    _ = parser.add_argument("-d", "--hatchery-path", "--hatchery", help="path to the Hatchery dictionary to build both theories over", required=True)
+    _ = parser.add_argument("-a", "--theory-a", help=f"module name or path to the Python file of the old theory, which defines `theory` (default: {DEFAULT_THEORY})", default=DEFAULT_THEORY)
+    _ = parser.add_argument("-b", "--theory-b", help="module name or path to the Python file of the new theory, which defines `theory`", required=True)
+    _ = parser.add_argument("-j", "--in-json-path", "--in-json", help="path to a JSON steno dictionary to sample outlines from (default: sample the outlines either theory produces)")
+    _ = parser.add_argument("-s", "--sample-size", type=int, default=10000, help="number of outlines to compare the translations of (default: 10000)")
+    _ = parser.add_argument("-t", "--n-translations", type=int, help="number of translations to sample and compare the outlines of (default: all)")
+    _ = parser.add_argument("-c", "--max-cost", type=float, help="only compare outlines that cost at most this much (default: no limit)")
+    _ = parser.add_argument("-m", "--max-outlines", type=int, default=8, help="number of the cheapest outlines of each translation to compare (default: 8)")
+    _ = parser.add_argument("--seed", type=int, default=0, help="seed for sampling translations and outlines (default: 0)")
+    _ = parser.add_argument("-r", "--report-path", "--report", help="path to output the full report as JSON")
+    _ = parser.add_argument("-n", "--n-examples", type=int, default=20, help="number of changes of each kind to print (default: 20)")
+    args = parser.parse_args()
+
+    setup_plover()
+    _main(args)
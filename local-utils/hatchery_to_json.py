@@ -0,0 +1,49 @@
+from pathlib import Path
+import argparse
+import os
+import timeit
+
+from _script_utils import percent, setup_plover
+
+
+def _main(args: argparse.Namespace):
+    from plover_hatchery.lib.dictionary import read_hatchery_dictionary, all_entries, export_json, JsonExportStats, write_atomically
+    from plover_hatchery.lib.theory_presets.amphitheory import theory
+
+    root = Path(os.getcwd())
+    hatchery_path = root / args.hatchery_path
+
+    out_path = root / args.out_path
+    out_path.parent.mkdir(exist_ok=True, parents=True)
+
+    dictionary = read_hatchery_dictionary(str(hatchery_path))
+    lookup = theory.build_lookup(entry_lines=all_entries(dictionary), filename=str(hatchery_path))
+
+    translations = sorted(set(dictionary["entries"]))
+    stats = JsonExportStats()
+
+    def export():
+        nonlocal stats
+
+        with write_atomically(out_path) as file:
+            stats = export_json(lookup, translations, file, max_outlines=args.max_outlines, max_cost=args.max_cost)
+
+    duration = timeit.timeit(export, number=1)
+
+    print(f"\x1b[1;36m{args.out_path}\x1b[0m")
+    print(f"    {percent(stats.n_translations_with_outlines, stats.n_translations)} translations have outlines")
+    print(f"    {stats.n_outlines} outlines")
+    print(f"    {stats.n_outlines_lost} outlines left out because they translate to something else")
+    print(f"    Took {duration} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exports the cheapest outlines of every translation in a Hatchery dictionary as a standard JSON steno dictionary")
+    _ = parser.add_argument("-d", "--hatchery-path", "--hatchery", help="path to the Hatchery dictionary to export", required=True)
+    _ = parser.add_argument("-o", "--out-path", "--out", help="path to output the JSON dictionary", required=True)
+    _ = parser.add_argument("-m", "--max-outlines", type=int, default=8, help="number of the cheapest outlines of each translation to export (default: 8)")
+    _ = parser.add_argument("-c", "--max-cost", type=float, help="only export outlines that cost at most this much (default: no limit)")
+    args = parser.parse_args()
+
+    setup_plover()
+    _main(args)
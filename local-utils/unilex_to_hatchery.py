@@ -3,17 +3,7 @@ import os
 import timeit
 import argparse
     
-from plover import system
-from plover.config import DEFAULT_SYSTEM_NAME
-from plover.registry import registry
-
-
-
-
-
-def _setup_plover():
-    registry.update()
-    system.setup(DEFAULT_SYSTEM_NAME)
+from _script_utils import setup_plover
 
 
 
@@ -33,9 +23,15 @@ def _main(args: argparse.Namespace):
     else:
         failures_out_path = None
 
+    if args.alignment_cache_path is not None:
+        alignment_cache_path = root / args.alignment_cache_path
+        alignment_cache_path.parent.mkdir(exist_ok=True, parents=True)
+    else:
+        alignment_cache_path = None
+
 
     print(f"Generating entries…")
-    duration = timeit.timeit(lambda: generate_from_unilex(in_path, out_path, failures_out_path), number=1)
+    duration = timeit.timeit(lambda: generate_from_unilex(in_path, out_path, failures_out_path, args.jobs, alignment_cache_path, args.max_cached_alignments), number=1)
     print(f"Finished (took {duration} s)")
 
 if __name__ == "__main__":
@@ -45,7 +41,10 @@ if __name__ == "__main__":
     _ = parser.add_argument("-u", "--in-unilex-path", "--in-unilex", help="path to the input Unilex lexicon", default=str(filepath / "./data/unilex"))
     _ = parser.add_argument("-o", "--out-path", "--out", help="path to output the Hatchery dictionary (to use in Plover, use the `hatchery` file extension)", default=str(filepath / "./out/debug.hatchery"))
     _ = parser.add_argument("-f", "--failures-out-path", "--failout", help="path to output the failed entries")
+    _ = parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="number of processes to parse and align the lexicon with (default: number of CPUs; 1 to convert serially)")
+    _ = parser.add_argument("-c", "--alignment-cache-path", "--alignment-cache", help="path to a file to keep alignments in between runs, so that only new lines of the lexicon are aligned")
+    _ = parser.add_argument("--max-cached-alignments", type=int, default=200_000, help="number of recently used alignments each process keeps in memory, so that repeated ones are only aligned once (default: 200000; 0 to keep none)")
     args = parser.parse_args()
 
-    _setup_plover()
+    setup_plover()
     _main(args)
\ No newline at end of file
@@ -0,0 +1,200 @@
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from itertools import batched
+from pathlib import Path
+import argparse
+import json
+import os
+import timeit
+
+from plover.steno import normalize_steno
+
+from _script_utils import init_worker, percent, setup_plover, worker_lookup, worker_translations
+
+
+OUTLINES_PER_JOB = 1000
+"""How many outlines of the JSON dictionary each worker process looks up at a time"""
+
+TRANSLATIONS_PER_JOB = 1000
+"""How many translations of the Hatchery dictionary each worker process checks at a time"""
+
+
+@dataclass
+class _OutlineReport:
+    n_outlines: int = 0
+    n_invalid_outlines: int = 0
+    n_known_translations: int = 0
+    """Outlines whose translation is also in the Hatchery dictionary"""
+    n_matches: int = 0
+    n_mismatches: int = 0
+    n_unresolved: int = 0
+    n_unresolved_known_translations: int = 0
+    mismatches: list[tuple[str, str, str]] = field(default_factory=list)
+    """(outline, translation in the JSON dictionary, translation from Hatchery)"""
+    unresolved_known_translations: list[tuple[str, str]] = field(default_factory=list)
+    """(outline, translation) for outlines that Hatchery leaves untranslated, even though it has the translation"""
+
+    def merge(self, other: "_OutlineReport"):
+        self.n_outlines += other.n_outlines
+        self.n_invalid_outlines += other.n_invalid_outlines
+        self.n_known_translations += other.n_known_translations
+        self.n_matches += other.n_matches
+        self.n_mismatches += other.n_mismatches
+        self.n_unresolved += other.n_unresolved
+        self.n_unresolved_known_translations += other.n_unresolved_known_translations
+        self.mismatches.extend(other.mismatches)
+        self.unresolved_known_translations.extend(other.unresolved_known_translations)
+
+
+def _count_translations_in_lookup(translations: Iterable[str]):
+    """Counts the translations with at least one entry that made it into the lookup, i.e., that has a subtrie"""
+
+    from plover_hatchery.lib.trie import SubtrieQuery
+
+    query = SubtrieQuery(max_depth=0)
+    n_in_lookup = 0
+
+    for translation in translations:
+        breakdown = worker_lookup().breakdown_translation(translation, query)
+        if breakdown is not None and any(entry["subtrie"] is not None for entry in json.loads(breakdown)):
+            n_in_lookup += 1
+
+    return n_in_lookup
+
+
+def _check_outlines(items: Iterable[tuple[str, str]]):
+    lookup = worker_lookup().lookup
+    known_translations = worker_translations()
+
+    report = _OutlineReport()
+
+    for outline_steno, translation in items:
+        report.n_outlines += 1
+
+        try:
+            outline = normalize_steno(outline_steno)
+        except ValueError:
+            report.n_invalid_outlines += 1
+            continue
+
+        is_known_translation = translation in known_translations
+        if is_known_translation:
+            report.n_known_translations += 1
+
+        result = lookup(outline)
+        if result is None:
+            report.n_unresolved += 1
+            if is_known_translation:
+                report.n_unresolved_known_translations += 1
+                report.unresolved_known_translations.append((outline_steno, translation))
+        elif result == translation:
+            report.n_matches += 1
+        else:
+            report.n_mismatches += 1
+            report.mismatches.append((outline_steno, translation, result))
+
+    return report
+
+
+def _main(args: argparse.Namespace):
+    from plover_hatchery.lib.dictionary import read_hatchery_dictionary
+
+    root = Path(os.getcwd())
+    hatchery_path = root / args.hatchery_path
+
+    translations = sorted(set(read_hatchery_dictionary(str(hatchery_path))["entries"]))
+
+    json_dict: dict[str, str] = {}
+    if args.in_json_path is not None:
+        with open(root / args.in_json_path, "r", encoding="utf-8") as file:
+            json_dict = json.load(file)
+
+
+    # Every worker process builds its own lookup, since lookups are mostly Python and would otherwise share one GIL
+
+    n_translations_in_lookup = 0
+    outline_report = _OutlineReport()
+
+    def check_all():
+        nonlocal n_translations_in_lookup
+
+        with ProcessPoolExecutor(max_workers=args.processes, initializer=init_worker, initargs=(str(hatchery_path),)) as executor:
+            n_translations_in_lookup = sum(executor.map(_count_translations_in_lookup, batched(translations, TRANSLATIONS_PER_JOB)))
+
+            for batch_report in executor.map(_check_outlines, batched(json_dict.items(), OUTLINES_PER_JOB)):
+                outline_report.merge(batch_report)
+
+    duration = timeit.timeit(check_all, number=1)
+
+
+    # Entries of the Hatchery dictionary that made it into the lookup
+
+    report: dict[str, object] = {
+        "hatchery": {
+            "n_translations": len(translations),
+            "n_translations_in_lookup": n_translations_in_lookup,
+        },
+    }
+
+    print(f"\x1b[1;36mHatchery dictionary\x1b[0m")
+    print(f"    {len(translations)} translations")
+    print(f"    {percent(n_translations_in_lookup, len(translations))} were added to the lookup")
+
+
+    # Outlines of the JSON dictionary that Hatchery translates the same way
+
+    if args.in_json_path is not None:
+        n_valid = outline_report.n_outlines - outline_report.n_invalid_outlines
+
+        print(f"\x1b[1;36m{args.in_json_path}\x1b[0m")
+        print(f"    {outline_report.n_outlines} outlines ({outline_report.n_invalid_outlines} not valid steno)")
+        print(f"    {percent(outline_report.n_known_translations, n_valid)} have a translation in the Hatchery dictionary")
+        print(f"    \x1b[32m{percent(outline_report.n_matches, n_valid)} match\x1b[0m")
+        print(f"    \x1b[31m{percent(outline_report.n_mismatches, n_valid)} translate to something else\x1b[0m")
+        print(f"    {percent(outline_report.n_unresolved, n_valid)} are not translated")
+        print(f"    {percent(outline_report.n_unresolved_known_translations, outline_report.n_known_translations)} of outlines with a known translation are not translated")
+
+        for outline_steno, expected, actual in outline_report.mismatches[:args.n_examples]:
+            print(f"    {outline_steno}: expected {expected!r}, got {actual!r}")
+
+        report["json"] = {
+            "path": str(args.in_json_path),
+            "n_outlines": outline_report.n_outlines,
+            "n_invalid_outlines": outline_report.n_invalid_outlines,
+            "n_known_translations": outline_report.n_known_translations,
+            "n_matches": outline_report.n_matches,
+            "n_mismatches": outline_report.n_mismatches,
+            "n_unresolved": outline_report.n_unresolved,
+            "n_unresolved_known_translations": outline_report.n_unresolved_known_translations,
+            "mismatches": [
+                {"outline": outline_steno, "expected": expected, "actual": actual}
+                for outline_steno, expected, actual in outline_report.mismatches
+            ],
+            "unresolved_known_translations": [
+                {"outline": outline_steno, "expected": expected}
+                for outline_steno, expected in outline_report.unresolved_known_translations
+            ],
+        }
+
+    print(f"Took {duration} s across {args.processes} processes")
+
+
+    if args.report_path is not None:
+        report_path = root / args.report_path
+        report_path.parent.mkdir(exist_ok=True, parents=True)
+        with open(report_path, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Builds the lookup for a Hatchery dictionary, and reports how many of its entries make it into the lookup and how many outlines of a JSON dictionary it translates the same way")
+    _ = parser.add_argument("-d", "--hatchery-path", "--hatchery", help="path to the Hatchery dictionary to validate", required=True)
+    _ = parser.add_argument("-j", "--in-json-path", "--in-json", help="path to a JSON steno dictionary (such as `lapwing-base.json`) to compare against")
+    _ = parser.add_argument("-r", "--report-path", "--report", help="path to output the full report as JSON, including every mismatch")
+    _ = parser.add_argument("-p", "--processes", type=int, default=os.cpu_count() or 1, help="number of processes to look up outlines with, each of which builds its own lookup (default: number of CPUs)")
+    _ = parser.add_argument("-n", "--n-examples", type=int, default=20, help="number of mismatches to print (default: 20)")
+    args = parser.parse_args()
+
+    setup_plover()
+    _main(args)
@@ -0,0 +1,56 @@
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import final
+import gzip
+import hashlib
+
+
+@final
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: str
+    __gzipped_body: bytes | None = field(default=None, init=False, repr=False)
+
+    def gzipped_body(self):
+        if self.__gzipped_body is None:
+            self.__gzipped_body = gzip.compress(self.body, compresslevel=6)
+        return self.__gzipped_body
+
+
+@final
+class BreakdownResponseCache:
+    """An LRU cache of serialized breakdown responses, keyed by endpoint and argument.
+
+    Responses are only valid for the lookup they were computed from, so the cache must be cleared whenever the
+    dictionary is rebuilt."""
+
+    def __init__(self, max_size: int=256):
+        self.__max_size = max_size
+        self.__responses: OrderedDict[tuple[str, str], CachedResponse] = OrderedDict()
+        self.__lock = Lock()
+
+    def get_else_compute(self, endpoint: str, argument: str, compute: Callable[[], str]):
+        key = (endpoint, argument)
+
+        with self.__lock:
+            response = self.__responses.get(key)
+            if response is not None:
+                self.__responses.move_to_end(key)
+                return response
+
+        body = compute().encode("utf-8")
+        response = CachedResponse(body, hashlib.blake2b(body, digest_size=16).hexdigest())
+
+        with self.__lock:
+            self.__responses[key] = response
+            if len(self.__responses) > self.__max_size:
+                _ = self.__responses.popitem(last=False)
+
+        return response
+
+    def clear(self):
+        with self.__lock:
+            self.__responses.clear()
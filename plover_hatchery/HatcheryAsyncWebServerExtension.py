@@ -0,0 +1,342 @@
+import asyncio
+from collections.abc import Callable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import suppress
+from functools import partial
+from http import HTTPStatus
+from threading import Event, Thread
+from typing import final
+import traceback
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from plover.engine import StenoEngine
+
+from . import WebApi
+from .BreakdownResponseCache import CachedResponse
+
+
+MAX_WORKERS = 2
+"""The number of threads that run trie queries"""
+
+MAX_PENDING_REQUESTS = 16
+"""The number of requests that may be in flight at once, counting queries still running for requests that timed out.
+Requests beyond this are turned away with a 503 rather than queued behind the others"""
+
+REQUEST_TIMEOUT_S = 10.0
+"""How long a request may take in total before it is answered with a 504, or its stream is ended"""
+
+
+@final
+class _HttpError(Exception):
+    def __init__(self, status: HTTPStatus):
+        super().__init__(status.phrase)
+        self.status = status
+
+
+async def _read_request_head(reader: asyncio.StreamReader):
+    request_line = (await reader.readline()).decode("latin-1").rstrip("\r\n")
+    parts = request_line.split(" ")
+    if len(parts) != 3:
+        raise _HttpError(HTTPStatus.BAD_REQUEST)
+
+    method, target, _ = parts
+
+    headers: dict[str, str] = {}
+    while True:
+        line = (await reader.readline()).decode("latin-1").rstrip("\r\n")
+        if line == "":
+            break
+
+        name, separator, value = line.partition(":")
+        if separator == "":
+            raise _HttpError(HTTPStatus.BAD_REQUEST)
+
+        headers[name.strip().lower()] = value.strip()
+
+    return method, target, headers
+
+
+async def _write_head(writer: asyncio.StreamWriter, status: HTTPStatus, headers: dict[str, str]):
+    lines = (
+        f"HTTP/1.1 {status.value} {status.phrase}",
+        *(f"{name}: {value}" for name, value in headers.items()),
+        "Connection: close",
+        "",
+        "",
+    )
+    writer.write("\r\n".join(lines).encode("latin-1"))
+    await writer.drain()
+
+
+async def _write_response(writer: asyncio.StreamWriter, status: HTTPStatus, headers: dict[str, str], body: bytes=b""):
+    await _write_head(writer, status, {**headers, "Content-Length": str(len(body))})
+    writer.write(body)
+    await writer.drain()
+
+
+@final
+class HatcheryAsyncWebServerExtension:
+    """Serves the same routes as `HatcheryWebServerExtension`, but from an asyncio event loop. Trie queries are offloaded
+    to a bounded thread pool with a per-request timeout, so a burst of requests cannot queue up behind one slow breakdown.
+    """
+
+    def __init__(self, engine: StenoEngine):
+        self.__loop: asyncio.AbstractEventLoop | None = None
+        self.__thread: Thread | None = None
+        self.__executor: ThreadPoolExecutor | None = None
+        self.__port: int | None = None
+        self.__n_pending_requests = 0
+        """Requests in flight, plus queries left running in the pool after their request timed out. Only touched from
+        the event loop"""
+        self.__n_abandoned_queries = 0
+        """Queries left running in the pool after their request timed out"""
+
+    def start(self):
+        """Start the web server's event loop in a background thread"""
+
+        self.__executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="hatchery-web")
+
+        started = Event()
+        self.__thread = Thread(target=self.__run, args=(started,), daemon=True)
+        self.__thread.start()
+        _ = started.wait(timeout=5)
+
+    @property
+    def port(self):
+        """The port the server is listening on, once it has started"""
+
+        return self.__port
+
+    def stop(self):
+        """Stop the web server"""
+
+        loop = self.__loop
+        if loop is not None and loop.is_running():
+            _ = loop.call_soon_threadsafe(loop.stop)
+
+        if self.__thread is not None:
+            self.__thread.join(timeout=5)
+
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False, cancel_futures=True)
+
+
+    def __run(self, started: Event):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self.__loop = loop
+
+        try:
+            server = loop.run_until_complete(asyncio.start_server(self.__handle_connection, WebApi.HOST, WebApi.PORT))
+        except Exception as e:
+            print(f"Failed to start Hatchery web server: {e}")
+            loop.close()
+            return
+        else:
+            self.__port = server.sockets[0].getsockname()[1]
+        finally:
+            started.set()
+
+        try:
+            loop.run_forever()
+        finally:
+            server.close()
+
+            tasks = asyncio.all_tasks(loop)
+            for task in tasks:
+                _ = task.cancel()
+            _ = loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+
+            loop.close()
+
+
+    async def __run_in_pool[T](self, compute: Callable[[], T], deadline: float) -> T:
+        """Runs a query in the thread pool. If the deadline passes first, the query is cancelled if it has not started
+        yet, or else left to finish in the background with its result dropped. A query left running keeps counting
+        against the pending requests until it finishes, since it still holds one of the pool's threads"""
+
+        assert self.__executor is not None
+
+        loop = asyncio.get_running_loop()
+        future = self.__executor.submit(compute)
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=deadline - loop.time())
+        except TimeoutError:
+            if not future.cancel():
+                self.__n_pending_requests += 1
+                self.__n_abandoned_queries += 1
+                future.add_done_callback(partial(self.__on_abandoned_query_done, loop))
+
+            raise _HttpError(HTTPStatus.GATEWAY_TIMEOUT)
+
+
+    def __on_abandoned_query_done(self, loop: asyncio.AbstractEventLoop, _: "Future[object]"):
+        # Called from the pool's thread, and possibly after the server has stopped
+        with suppress(RuntimeError):
+            _ = loop.call_soon_threadsafe(self.__release_abandoned_query)
+
+
+    def __release_abandoned_query(self):
+        self.__n_pending_requests -= 1
+        self.__n_abandoned_queries -= 1
+
+
+    async def __handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # Error responses carry the same CORS headers as any other, so that the web UI can see their status
+        cors_headers = self.__cors_headers(None)
+
+        try:
+            try:
+                method, target, headers = await asyncio.wait_for(_read_request_head(reader), timeout=REQUEST_TIMEOUT_S)
+                cors_headers = self.__cors_headers(headers.get("origin"))
+                await self.__dispatch(method, target, headers, cors_headers, writer)
+            except _HttpError as e:
+                await _write_response(writer, e.status, cors_headers)
+            except TimeoutError:
+                await _write_response(writer, HTTPStatus.REQUEST_TIMEOUT, cors_headers)
+            except ValueError:
+                # Also raised when a request line or header is too long to read
+                await _write_response(writer, HTTPStatus.BAD_REQUEST, cors_headers)
+            except ConnectionError:
+                raise
+            except Exception:
+                # Such as an error in a plugin or the trie, which the pool re-raises
+                traceback.print_exc()
+                await _write_response(writer, HTTPStatus.INTERNAL_SERVER_ERROR, cors_headers)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            with suppress(ConnectionError):
+                await writer.wait_closed()
+
+
+    def __cors_headers(self, origin: str | None):
+        headers = {"Access-Control-Allow-Methods": "GET,PATCH,PUT,POST,DELETE,OPTIONS"}
+
+        if origin is not None and WebApi.allowed_origins.match(origin):
+            headers["Access-Control-Allow-Origin"] = "*"
+
+        return headers
+
+
+    async def __dispatch(
+        self,
+        method: str,
+        target: str,
+        headers: dict[str, str],
+        cors_headers: dict[str, str],
+        writer: asyncio.StreamWriter,
+    ):
+        if method == "OPTIONS":
+            await _write_response(writer, HTTPStatus.NO_CONTENT, cors_headers)
+            return
+
+        if method != "GET":
+            raise _HttpError(HTTPStatus.METHOD_NOT_ALLOWED)
+
+
+        url = urlsplit(target)
+        if not url.path.startswith("/api/"):
+            raise _HttpError(HTTPStatus.NOT_FOUND)
+
+        route, _, argument = url.path.removeprefix("/api/").partition("/")
+        argument = unquote(argument)
+        args = parse_qs(url.query)
+
+
+        # Once every thread is stuck on a query that already timed out, a new query would only wait out its own timeout
+        if self.__n_pending_requests >= MAX_PENDING_REQUESTS or self.__n_abandoned_queries >= MAX_WORKERS:
+            raise _HttpError(HTTPStatus.SERVICE_UNAVAILABLE)
+
+        self.__n_pending_requests += 1
+        try:
+            deadline = asyncio.get_running_loop().time() + REQUEST_TIMEOUT_S
+
+            match route:
+                case "breakdown_translation":
+                    query = WebApi.parse_subtrie_query(args)
+                    cached = await self.__run_in_pool(partial(WebApi.breakdown_translation, argument, query), deadline)
+
+                case "breakdown_lookup":
+                    cached = await self.__run_in_pool(partial(WebApi.breakdown_lookup, argument), deadline)
+
+                case "breakdown_lookup_stream":
+                    await self.__stream_lines(WebApi.breakdown_lookup_lines(argument), deadline, writer, cors_headers)
+                    return
+
+                case _:
+                    raise _HttpError(HTTPStatus.NOT_FOUND)
+
+            await self.__write_cached_response(cached, headers, cors_headers, writer)
+        finally:
+            self.__n_pending_requests -= 1
+
+
+    async def __write_cached_response(
+        self,
+        cached: CachedResponse,
+        request_headers: dict[str, str],
+        cors_headers: dict[str, str],
+        writer: asyncio.StreamWriter,
+    ):
+        """Serves a cached response, compressed if the client accepts it, or a 304 if the client already has it"""
+
+        accepts_gzip = "gzip" in request_headers.get("accept-encoding", "")
+        etag = f'"{cached.etag}-gz"' if accepts_gzip else f'"{cached.etag}"'
+
+        headers = {
+            **cors_headers,
+            "Content-Type": "application/json",
+            "Vary": "Accept-Encoding",
+            "Cache-Control": "no-cache",
+            "ETag": etag,
+        }
+
+        if etag in request_headers.get("if-none-match", ""):
+            await _write_response(writer, HTTPStatus.NOT_MODIFIED, headers)
+            return
+
+        if accepts_gzip:
+            headers["Content-Encoding"] = "gzip"
+            body = await asyncio.get_running_loop().run_in_executor(self.__executor, cached.gzipped_body)
+        else:
+            body = cached.body
+
+        await _write_response(writer, HTTPStatus.OK, headers, body)
+
+
+    async def __stream_lines(
+        self,
+        lines: Iterator[str],
+        deadline: float,
+        writer: asyncio.StreamWriter,
+        cors_headers: dict[str, str],
+    ):
+        """Streams lines as they are produced. Each line is produced in the thread pool, and no more are produced once the
+        client disconnects or the deadline passes"""
+
+        line = await self.__run_in_pool(partial(next, lines, None), deadline)
+
+        await _write_head(writer, HTTPStatus.OK, {
+            **cors_headers,
+            "Content-Type": "application/x-ndjson",
+            "Cache-Control": "no-cache",
+        })
+
+        while line is not None:
+            writer.write(line.encode("utf-8"))
+            await writer.drain()
+
+            try:
+                line = await self.__run_in_pool(partial(next, lines, None), deadline)
+            except _HttpError:
+                # The head has already been sent, so the only way to signal the timeout is to end the stream early
+                return
+            except ConnectionError:
+                raise
+            except Exception:
+                # Likewise for a query that fails partway through
+                traceback.print_exc()
+                return
@@ -0,0 +1,190 @@
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from http.client import HTTPConnection, HTTPResponse
+from threading import Event
+from typing import Any, cast
+import gzip
+import time
+
+import pytest
+
+from . import HatcheryAsyncWebServerExtension as extension_module
+from . import WebApi
+from .BreakdownResponseCache import BreakdownResponseCache
+from .HatcheryAsyncWebServerExtension import HatcheryAsyncWebServerExtension
+from .Store import store
+
+
+_ORIGIN = "http://localhost:3000"
+
+_WAIT_TIMEOUT_S = 5.0
+"""How long a test waits on the server before failing, well beyond any timeout the tests set"""
+
+
+@pytest.fixture
+def server(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(WebApi, "HOST", "127.0.0.1")
+    monkeypatch.setattr(WebApi, "PORT", 0)
+    monkeypatch.setattr(store, "translations", [])
+    monkeypatch.setattr(store, "breakdown_responses", BreakdownResponseCache())
+
+    server = HatcheryAsyncWebServerExtension(cast(Any, None))
+    server.start()
+    assert server.port is not None
+
+    yield server
+
+    server.stop()
+
+
+def _set_breakdown_lookup(monkeypatch: pytest.MonkeyPatch, breakdown_lookup: Callable[[tuple[str, ...], list[str]], str | None]):
+    monkeypatch.setattr(store, "breakdown_lookup", breakdown_lookup)
+
+
+def _request(server: HatcheryAsyncWebServerExtension, path: str, headers: dict[str, str] | None=None):
+    assert server.port is not None
+
+    connection = HTTPConnection("127.0.0.1", server.port, timeout=_WAIT_TIMEOUT_S)
+    connection.request("GET", path, headers={"Origin": _ORIGIN, **(headers or {})})
+    return connection.getresponse()
+
+
+def _get(server: HatcheryAsyncWebServerExtension, path: str, headers: dict[str, str] | None=None):
+    response = _request(server, path, headers)
+    return response, response.read()
+
+
+def _blocking_breakdown_lookup(started: Event, release: Event):
+    def breakdown_lookup(outline: tuple[str, ...], translations: list[str]):
+        started.set()
+        assert release.wait(_WAIT_TIMEOUT_S)
+        return "[]"
+
+    return breakdown_lookup
+
+
+def test__async_web_server__serves_gzip_with_etag_and_not_modified(server: HatcheryAsyncWebServerExtension, monkeypatch: pytest.MonkeyPatch):
+    _set_breakdown_lookup(monkeypatch, lambda outline, translations: f'[{{"outline": "{"/".join(outline)}"}}]')
+
+    response, body = _get(server, "/api/breakdown_lookup/KAT", {"Accept-Encoding": "gzip"})
+    assert response.status == HTTPStatus.OK
+    assert response.getheader("Content-Encoding") == "gzip"
+    assert response.getheader("Access-Control-Allow-Origin") == "*"
+    assert gzip.decompress(body) == b'[{"outline": "KAT"}]'
+
+    etag = response.getheader("ETag")
+    assert etag is not None
+
+    response, body = _get(server, "/api/breakdown_lookup/KAT", {"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert response.status == HTTPStatus.NOT_MODIFIED
+    assert body == b""
+
+    # The uncompressed response has its own ETag, so a client cannot be sent a 304 for the wrong encoding
+    response, body = _get(server, "/api/breakdown_lookup/KAT", {"If-None-Match": etag})
+    assert response.status == HTTPStatus.OK
+    assert response.getheader("Content-Encoding") is None
+    assert body == b'[{"outline": "KAT"}]'
+
+
+def test__async_web_server__streams_ndjson_as_lines_are_found(server: HatcheryAsyncWebServerExtension, monkeypatch: pytest.MonkeyPatch):
+    release = Event()
+
+    def breakdown_lookup_stream(outline: tuple[str, ...], translations: list[str]) -> Iterable[str]:
+        def summaries() -> Iterator[str]:
+            yield '{"path": 1}'
+            assert release.wait(_WAIT_TIMEOUT_S)
+            yield '{"path": 2}'
+
+        return summaries()
+
+    monkeypatch.setattr(store, "breakdown_lookup_stream", breakdown_lookup_stream)
+
+    response = _request(server, "/api/breakdown_lookup_stream/KAT")
+    assert response.status == HTTPStatus.OK
+    assert response.getheader("Content-Type") == "application/x-ndjson"
+
+    # The first line arrives while the second is still being found
+    assert response.readline() == b'{"path": 1}\n'
+    release.set()
+    assert response.read() == b'{"path": 2}\n'
+
+
+def test__async_web_server__answers_504_with_cors_headers_on_timeout(server: HatcheryAsyncWebServerExtension, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(extension_module, "REQUEST_TIMEOUT_S", 0.2)
+
+    started = Event()
+    release = Event()
+    _set_breakdown_lookup(monkeypatch, _blocking_breakdown_lookup(started, release))
+
+    try:
+        response, _ = _get(server, "/api/breakdown_lookup/KAT")
+        assert response.status == HTTPStatus.GATEWAY_TIMEOUT
+        assert response.getheader("Access-Control-Allow-Origin") == "*"
+    finally:
+        release.set()
+
+
+def test__async_web_server__answers_503_once_pending_limit_is_reached(server: HatcheryAsyncWebServerExtension, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(extension_module, "MAX_PENDING_REQUESTS", 1)
+
+    started = Event()
+    release = Event()
+    _set_breakdown_lookup(monkeypatch, _blocking_breakdown_lookup(started, release))
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pending = executor.submit(_get, server, "/api/breakdown_lookup/KAT")
+
+        try:
+            assert started.wait(_WAIT_TIMEOUT_S)
+
+            response, _ = _get(server, "/api/breakdown_lookup/TKOG")
+            assert response.status == HTTPStatus.SERVICE_UNAVAILABLE
+            assert response.getheader("Access-Control-Allow-Origin") == "*"
+        finally:
+            release.set()
+
+        response, body = pending.result(timeout=_WAIT_TIMEOUT_S)
+        assert response.status == HTTPStatus.OK
+        assert body == b"[]"
+
+
+def test__async_web_server__releases_slot_once_abandoned_query_finishes(server: HatcheryAsyncWebServerExtension, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(extension_module, "REQUEST_TIMEOUT_S", 0.2)
+    monkeypatch.setattr(extension_module, "MAX_PENDING_REQUESTS", 1)
+
+    started = Event()
+    release = Event()
+    _set_breakdown_lookup(monkeypatch, _blocking_breakdown_lookup(started, release))
+
+    try:
+        response, _ = _get(server, "/api/breakdown_lookup/KAT")
+        assert response.status == HTTPStatus.GATEWAY_TIMEOUT
+
+        # The query that timed out still holds its slot
+        response, _ = _get(server, "/api/breakdown_lookup/TKOG")
+        assert response.status == HTTPStatus.SERVICE_UNAVAILABLE
+    finally:
+        release.set()
+
+    deadline = time.monotonic() + _WAIT_TIMEOUT_S
+    while True:
+        response, body = _get(server, "/api/breakdown_lookup/TKOG")
+        if response.status != HTTPStatus.SERVICE_UNAVAILABLE or time.monotonic() > deadline:
+            break
+
+        time.sleep(0.01)
+
+    assert response.status == HTTPStatus.OK
+    assert body == b"[]"
+
+
+def test__async_web_server__answers_500_with_cors_headers_when_query_fails(server: HatcheryAsyncWebServerExtension, monkeypatch: pytest.MonkeyPatch):
+    def breakdown_lookup(outline: tuple[str, ...], translations: list[str]) -> str | None:
+        raise RuntimeError("the trie is broken")
+
+    _set_breakdown_lookup(monkeypatch, breakdown_lookup)
+
+    response, _ = _get(server, "/api/breakdown_lookup/KAT")
+    assert response.status == HTTPStatus.INTERNAL_SERVER_ERROR
+    assert response.getheader("Access-Control-Allow-Origin") == "*"
@@ -31,8 +31,12 @@ class HatcheryDictionary(StenoDictionary):
         self.__maybe_lookup = lookup.lookup
         self.__maybe_reverse_lookup = lookup.reverse_lookup
 
+        self._longest_key = lookup.longest_key
+
         store.breakdown_translation = lookup.breakdown_translation
         store.breakdown_lookup = lookup.breakdown_lookup
+        store.breakdown_lookup_stream = lookup.breakdown_lookup_stream
+        store.breakdown_responses.clear()
             
 
     def __getitem__(self, stroke_stenos: tuple[str, ...]) -> str:
@@ -1,21 +1,25 @@
-import re
-from flask import Flask, jsonify, request
 from threading import Thread
-from flask.typing import ResponseClass
-from werkzeug.serving import make_server
+from typing import TYPE_CHECKING
+
 from plover.engine import StenoEngine
 
-from .Store import store
+from . import WebApi
+from .BreakdownResponseCache import CachedResponse
 
+if TYPE_CHECKING:
+    from werkzeug.serving import BaseWSGIServer
 
-allowed_origins = re.compile(r"https?://localhost:\d+|https://vaie\.art")
 
 class HatcheryWebServerExtension:
     def __init__(self, engine: StenoEngine):
+        # Flask is only imported once the extension is enabled, so that Plover's plugin scan does not pay for it
+        from flask import Flask, Response, request
+        from flask.typing import ResponseClass
+
         app = Flask(__name__)
 
         self.__app = app
-        self.__server = None
+        self.__server: "BaseWSGIServer | None" = None
         self.__server_thread = None
 
         # Disable CORS
@@ -23,33 +27,47 @@ class HatcheryWebServerExtension:
         def _(response: ResponseClass):
             origin = request.origin
             
-            if allowed_origins.match(origin):
+            if WebApi.allowed_origins.match(origin):
                 response.headers.add("Access-Control-Allow-Origin", "*")
 
             response.headers.add("Access-Control-Allow-Methods", "GET,PATCH,PUT,POST,DELETE,OPTIONS")
             return response
         
+        def respond(cached: CachedResponse):
+            """Serves a cached response, compressed if the client accepts it, or a 304 if the client already has it"""
+
+            accepts_gzip = "gzip" in request.accept_encodings
+            etag = f"{cached.etag}-gz" if accepts_gzip else cached.etag
+
+            response = Response(cached.gzipped_body() if accepts_gzip else cached.body, mimetype="application/json")
+            if accepts_gzip:
+                response.headers["Content-Encoding"] = "gzip"
+            response.headers["Vary"] = "Accept-Encoding"
+            response.headers["Cache-Control"] = "no-cache"
+            response.set_etag(etag)
+
+            return response.make_conditional(request)
+
         @app.route("/api/breakdown_translation/<translation>")
         def breakdown_translation_route(translation: str):
-            breakdown = store.breakdown_translation(translation)
-            if breakdown is None:
-                return jsonify({})
-
-            return breakdown
+            query = WebApi.parse_subtrie_query(request.args.to_dict(flat=False))
+            return respond(WebApi.breakdown_translation(translation, query))
         
         @app.route("/api/breakdown_lookup/<outline>")
         def breakdown_lookup_route(outline: str):
-            breakdown = store.breakdown_lookup(tuple(outline.split(" ")), store.translations)
-            if breakdown is None:
-                return jsonify([])
+            return respond(WebApi.breakdown_lookup(outline))
 
-            return breakdown
+        @app.route("/api/breakdown_lookup_stream/<outline>")
+        def breakdown_lookup_stream_route(outline: str):
+            return Response(WebApi.breakdown_lookup_lines(outline), mimetype="application/x-ndjson")
         
     def start(self):
         """Start the web server in a background thread"""
+        from werkzeug.serving import make_server
+
         try:
             
-            self.__server = make_server("localhost", 5325, self.__app)
+            self.__server = make_server(WebApi.HOST, WebApi.PORT, self.__app)
             
             self.__server_thread = Thread(target=self.__server.serve_forever)
             self.__server_thread.daemon = True
@@ -1,13 +1,21 @@
-from typing import final, Callable
+from collections.abc import Iterable
+from typing import TYPE_CHECKING, final, Callable
 
-from plover_hatchery.lib.trie.NondeterministicTrie import NondeterministicTrie
+from plover_hatchery.BreakdownResponseCache import BreakdownResponseCache
+
+if TYPE_CHECKING:
+    # Only needed for annotations; importing them here would load the trie and its native library at plugin scan
+    from plover_hatchery_lib_rs import SubtrieQuery
+    from plover_hatchery.lib.trie.NondeterministicTrie import NondeterministicTrie
 
 @final
 class Store:
     def __init__(self):
-        self.breakdown_translation: Callable[[str], str | None] | None = None
+        self.breakdown_translation: Callable[[str, SubtrieQuery], str | None] | None = None
         self.breakdown_lookup: Callable[[tuple[str, ...], list[str]], str | None] | None = None
+        self.breakdown_lookup_stream: Callable[[tuple[str, ...], list[str]], Iterable[str] | None] | None = None
         self.trie: NondeterministicTrie | None = None
         self.translations: list[str] | None = None
+        self.breakdown_responses = BreakdownResponseCache()
 
 store = Store()
\ No newline at end of file
@@ -0,0 +1,101 @@
+from collections.abc import Callable, Iterator, Mapping, Sequence
+from typing import TYPE_CHECKING
+import re
+import sys
+
+from .BreakdownResponseCache import CachedResponse
+from .Store import store
+
+if TYPE_CHECKING:
+    from plover_hatchery_lib_rs import SubtrieQuery
+
+
+allowed_origins = re.compile(r"https?://localhost:\d+|https://vaie\.art")
+
+HOST = "localhost"
+PORT = 5325
+
+
+_MAX_USIZE = sys.maxsize * 2 + 1
+
+
+def _parse_arg[T](args: Mapping[str, Sequence[str]], name: str, parse: Callable[[str], T]) -> T | None:
+    values = args.get(name)
+    if not values:
+        return None
+
+    try:
+        return parse(values[0])
+    except (ValueError, OverflowError):
+        return None
+
+
+def _parse_count(value: str):
+    """Parses a limit that the trie stores as a `usize`"""
+
+    count = int(value)
+    if count < 0:
+        raise ValueError(f"{count} is negative")
+    if count > _MAX_USIZE:
+        raise OverflowError(f"{count} does not fit in a usize")
+
+    return count
+
+
+def parse_subtrie_query(args: Mapping[str, Sequence[str]]):
+    """Reads the limits on which part of each subtrie to send from the query string. Malformed or out-of-range limits are
+    ignored"""
+
+    from plover_hatchery_lib_rs import SubtrieQuery
+
+    return SubtrieQuery(
+        max_depth=_parse_arg(args, "depth", _parse_count),
+        max_nodes=_parse_arg(args, "max_nodes", _parse_count),
+        max_transition_cost=_parse_arg(args, "max_cost", float),
+        excluded_flags=list(args.get("exclude_flag", ())),
+        cursor=_parse_arg(args, "cursor", _parse_count) or 0,
+    )
+
+
+def breakdown_translation(translation: str, query: "SubtrieQuery") -> CachedResponse:
+    def compute():
+        if store.breakdown_translation is None:
+            return "{}"
+
+        breakdown = store.breakdown_translation(translation, query)
+        return "{}" if breakdown is None else breakdown
+
+    cache_argument = repr((
+        translation,
+        query.max_depth,
+        query.max_nodes,
+        query.max_transition_cost,
+        tuple(sorted(query.excluded_flags)),
+        query.cursor,
+    ))
+    return store.breakdown_responses.get_else_compute("breakdown_translation", cache_argument, compute)
+
+
+def breakdown_lookup(outline: str) -> CachedResponse:
+    def compute():
+        if store.breakdown_lookup is None or store.translations is None:
+            return "[]"
+
+        breakdown = store.breakdown_lookup(tuple(outline.split(" ")), store.translations)
+        return "[]" if breakdown is None else breakdown
+
+    return store.breakdown_responses.get_else_compute("breakdown_lookup", outline, compute)
+
+
+def breakdown_lookup_lines(outline: str) -> Iterator[str]:
+    """Yields each path of a lookup breakdown as one line of NDJSON"""
+
+    if store.breakdown_lookup_stream is None or store.translations is None:
+        return
+
+    summaries = store.breakdown_lookup_stream(tuple(outline.split(" ")), store.translations)
+    if summaries is None:
+        return
+
+    for summary in summaries:
+        yield f"{summary}\n"
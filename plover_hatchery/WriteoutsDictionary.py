@@ -26,6 +26,8 @@ class WriteoutsDictionary(StenoDictionary):
 
         self.__maybe_lookup, self.__maybe_reverse_lookup = build_lookup_json(map)
 
+        self._longest_key = max((len(outline_steno.split("/")) for outline_steno in map), default=0)
+
 
     def __getitem__(self, stroke_stenos: tuple[str, ...]) -> str:
         result = self.__lookup(stroke_stenos)
@@ -0,0 +1,79 @@
+import json
+from pathlib import Path
+import statistics
+import subprocess
+import sys
+import tomllib
+
+import pytest
+
+
+IMPORT_TIME_BUDGET_S = 1.0
+"""How long importing an entry point may take, on top of the Plover modules that are loaded before plugins are scanned.
+Only meant to catch an entry point starting to import something heavy again, so it is generous enough for a busy machine;
+the deferred modules are what is actually checked"""
+
+N_MEASUREMENTS = 3
+"""How many times each import is measured, so that the median rather than one slow run is held to the budget"""
+
+DEFERRED_MODULES = (
+    "flask",
+    "werkzeug",
+    "plover_hatchery_lib_rs",
+    "plover_hatchery.lib.pipes",
+    "plover_hatchery.lib.theory_presets",
+)
+"""Modules that should only be loaded once a feature is actually used"""
+
+
+def _entry_points():
+    with open(Path(__file__).parent.parent / "pyproject.toml", "rb") as file:
+        project = tomllib.load(file)["project"]
+
+    for group in project["entry-points"].values():
+        yield from group.values()
+
+
+_MEASURE_IMPORT = """
+import importlib, json, sys, time
+
+import plover.engine
+import plover.steno_dictionary
+
+module_name, attribute = sys.argv[1].split(":")
+
+loaded_before = set(sys.modules)
+start = time.perf_counter()
+getattr(importlib.import_module(module_name), attribute)
+duration = time.perf_counter() - start
+
+print(json.dumps({"duration": duration, "loaded": sorted(set(sys.modules) - loaded_before)}))
+"""
+
+
+def _measure_import(entry_point: str):
+    # Measured in a fresh interpreter, since the test session has already imported most of the package
+    result = subprocess.run(
+        [sys.executable, "-c", _MEASURE_IMPORT, entry_point],
+        cwd=Path(__file__).parent.parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+@pytest.mark.parametrize("entry_point", list(_entry_points()))
+def test__entry_point__imports_within_budget(entry_point: str):
+    measurements = [_measure_import(entry_point) for _ in range(N_MEASUREMENTS)]
+
+
+    for measurement in measurements:
+        loaded_deferred_modules = [
+            module
+            for module in measurement["loaded"]
+            if any(module == deferred or module.startswith(f"{deferred}.") for deferred in DEFERRED_MODULES)
+        ]
+        assert loaded_deferred_modules == []
+
+    assert statistics.median(measurement["duration"] for measurement in measurements) < IMPORT_TIME_BUDGET_S
@@ -0,0 +1,228 @@
+from collections import OrderedDict
+from collections.abc import Hashable, Mapping
+from pathlib import Path
+from threading import Lock
+from typing import Any, NamedTuple, final
+import hashlib
+import pickle
+import sqlite3
+
+
+_FORMAT_VERSION = 2
+
+DEFAULT_MAX_ENTRIES = 200_000
+"""How many of the most recently used alignments are kept in memory unless `set_max_entries` says otherwise"""
+
+
+@final
+class AlignmentSpan(NamedTuple):
+    """One match of an alignment, as the matrix coordinates of its start and end cells"""
+
+    start_x: int
+    start_y: int
+    end_x: int
+    end_y: int
+    match_data: Any
+
+
+@final
+class AlignmentCache:
+    """A content-addressed store of alignments, keyed by a digest of the aligner and the normalized inputs it was given.
+
+    Each aligner is identified by a fingerprint of its source, so persisted alignments are simply never found again once
+    that aligner or its mapping tables change.
+
+    The most recently used alignments are kept in memory, up to `set_max_entries` of them. If a file is opened,
+    alignments are also persisted in it, and read from it as they are needed rather than loaded up front, so that every
+    worker process can share one file without holding a copy of it."""
+
+    def __init__(self):
+        self.__spans: OrderedDict[bytes, tuple[AlignmentSpan, ...]] = OrderedDict()
+        """Alignments kept in memory, least recently used first, up to `max_entries` of them"""
+        self.__max_entries: int | None = DEFAULT_MAX_ENTRIES
+        self.__new_spans: dict[bytes, tuple[AlignmentSpan, ...]] = {}
+        """Alignments added since the persisted file was opened, which have yet to be saved or handed back"""
+        self.__is_recording = False
+        self.__connection: sqlite3.Connection | None = None
+        self.__lock = Lock()
+
+
+    @staticmethod
+    def digest(fingerprint: bytes, key: Hashable) -> bytes:
+        return hashlib.blake2b(repr(key).encode("utf-8"), digest_size=16, key=fingerprint).digest()
+
+
+    def set_max_entries(self, max_entries: int | None):
+        """Sets how many alignments are kept in memory, with None for no limit. The least recently used are dropped
+        first"""
+
+        with self.__lock:
+            self.__max_entries = max_entries
+            self.__evict()
+
+
+    def get(self, digest: bytes):
+        with self.__lock:
+            spans = self.__spans.get(digest)
+            if spans is not None:
+                self.__spans.move_to_end(digest)
+                return spans
+
+            spans = self.__new_spans.get(digest)
+            if spans is not None or self.__connection is None:
+                return spans
+
+            row = self.__connection.execute("SELECT spans FROM alignments WHERE digest = ?", (digest,)).fetchone()
+            if row is None:
+                return None
+
+            spans = pickle.loads(row[0])
+            self.__keep(digest, spans)
+
+        return spans
+
+
+    def add(self, digest: bytes, spans: tuple[AlignmentSpan, ...]):
+        with self.__lock:
+            self.__add(digest, spans)
+
+
+    def take_new_entries(self):
+        """Returns the alignments added since this was last called, so that a worker process can hand them back"""
+
+        with self.__lock:
+            entries = self.__new_spans
+            self.__new_spans = {}
+
+        return entries
+
+
+    def update(self, entries: Mapping[bytes, tuple[AlignmentSpan, ...]]):
+        """Adds alignments computed elsewhere, such as those a worker process handed back"""
+
+        with self.__lock:
+            for digest, spans in entries.items():
+                self.__add(digest, spans)
+
+
+    def open(self, path: Path, *, read_only: bool=False):
+        """Looks alignments up in the file at `path` from now on, and records new ones until they are saved or taken. A
+        worker process that hands its alignments back opens the file read-only. A missing or unreadable file is treated
+        as an empty cache, and is replaced when saved to"""
+
+        connection = _connect_read_only(path) if read_only else _connect(path)
+
+        with self.__lock:
+            if self.__connection is not None:
+                self.__connection.close()
+
+            self.__connection = connection
+            self.__is_recording = True
+
+
+    def save(self):
+        """Adds the alignments recorded since the file was opened to it"""
+
+        with self.__lock:
+            if self.__connection is None:
+                raise ValueError("no alignment cache file is open for writing")
+
+            with self.__connection:
+                _ = self.__connection.executemany(
+                    "INSERT OR IGNORE INTO alignments (digest, spans) VALUES (?, ?)",
+                    (
+                        (digest, pickle.dumps(spans, protocol=pickle.HIGHEST_PROTOCOL))
+                        for digest, spans in self.__new_spans.items()
+                    ),
+                )
+
+            self.__new_spans.clear()
+
+
+    def close(self):
+        """Stops looking up and recording alignments in the opened file. Unsaved alignments are dropped"""
+
+        with self.__lock:
+            if self.__connection is not None:
+                self.__connection.close()
+
+            self.__connection = None
+            self.__is_recording = False
+            self.__new_spans.clear()
+
+
+    def clear(self):
+        with self.__lock:
+            self.__spans.clear()
+            self.__new_spans.clear()
+
+
+    def __add(self, digest: bytes, spans: tuple[AlignmentSpan, ...]):
+        if self.__is_recording:
+            _ = self.__new_spans.setdefault(digest, spans)
+
+        self.__keep(digest, spans)
+
+
+    def __keep(self, digest: bytes, spans: tuple[AlignmentSpan, ...]):
+        if self.__max_entries == 0: return
+
+        self.__spans[digest] = spans
+        self.__spans.move_to_end(digest)
+        self.__evict()
+
+
+    def __evict(self):
+        if self.__max_entries is None: return
+
+        while len(self.__spans) > self.__max_entries:
+            _ = self.__spans.popitem(last=False)
+
+
+    def __len__(self):
+        """The number of distinct alignments held in memory"""
+
+        return len(self.__spans.keys() | self.__new_spans.keys())
+
+
+def _connect(path: Path):
+    connection = sqlite3.connect(path, check_same_thread=False)
+
+    try:
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+    except sqlite3.DatabaseError:
+        # Not a database at all, such as a cache persisted in an older format
+        connection.close()
+        path.unlink()
+        connection = sqlite3.connect(path, check_same_thread=False)
+        version = 0
+
+    if version != _FORMAT_VERSION:
+        with connection:
+            _ = connection.execute("DROP TABLE IF EXISTS alignments")
+            _ = connection.execute("CREATE TABLE alignments (digest BLOB PRIMARY KEY, spans BLOB NOT NULL) WITHOUT ROWID")
+            _ = connection.execute(f"PRAGMA user_version = {_FORMAT_VERSION}")
+
+    return connection
+
+
+def _connect_read_only(path: Path):
+    try:
+        connection = sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+    except sqlite3.Error:
+        return None
+
+    try:
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+    except sqlite3.DatabaseError:
+        version = None
+
+    if version != _FORMAT_VERSION:
+        connection.close()
+        return None
+
+    return connection
+
+
+alignment_cache = AlignmentCache()
+"""The cache shared by every `aligner`"""
@@ -0,0 +1,78 @@
+from pathlib import Path
+
+from .AlignmentCache import DEFAULT_MAX_ENTRIES, AlignmentCache, AlignmentSpan, alignment_cache
+
+
+def test__aligner__cached_alignment_matches_computed():
+    from plover_hatchery.lib.alignment.match_ortho_steno import match_chars_to_chords
+
+    alignment_cache.clear()
+
+    computed = str(match_chars_to_chords("zenith", "STKPWE/TPH*EUT"))
+    n_cached = len(alignment_cache)
+    replayed = str(match_chars_to_chords("zenith", "STKPWE/TPH*EUT"))
+
+    assert n_cached == 1
+    assert replayed == computed == "(z.STKPW, e.E, n.TPH, i.EU, th.*T)"
+
+
+def test__alignment_cache__keeps_most_recently_used_in_memory():
+    cache = AlignmentCache()
+    spans = (AlignmentSpan(0, 0, 1, 1, None),)
+
+    cache.add(b"a" * 16, spans)
+    assert len(cache) == 1
+
+    cache.set_max_entries(2)
+    cache.add(b"b" * 16, spans)
+    assert cache.get(b"a" * 16) == spans
+    cache.add(b"c" * 16, spans)
+    assert len(cache) == 2
+    assert cache.get(b"b" * 16) is None
+    assert cache.get(b"a" * 16) == spans
+    assert cache.get(b"c" * 16) == spans
+
+    cache.set_max_entries(0)
+    assert len(cache) == 0
+    cache.add(b"a" * 16, spans)
+    assert cache.get(b"a" * 16) is None
+
+
+def test__alignment_cache__persists(tmp_path: Path):
+    from plover_hatchery.lib.alignment.match_ortho_steno import match_chars_to_chords
+
+    cache_path = tmp_path / "alignments"
+
+    alignment_cache.clear()
+    alignment_cache.open(cache_path)
+    computed = str(match_chars_to_chords("pinecone", "PAOEUPB/KO*EPB"))
+    assert len(alignment_cache) == 1
+    alignment_cache.save()
+    alignment_cache.close()
+
+    # A worker looks the alignment up in the file instead of recomputing it, so it has nothing new to hand back
+    alignment_cache.clear()
+    alignment_cache.set_max_entries(0)
+    alignment_cache.open(cache_path, read_only=True)
+    try:
+        assert str(match_chars_to_chords("pinecone", "PAOEUPB/KO*EPB")) == computed
+        assert len(alignment_cache.take_new_entries()) == 0
+    finally:
+        alignment_cache.close()
+        alignment_cache.set_max_entries(DEFAULT_MAX_ENTRIES)
+
+
+def test__alignment_cache__ignores_missing_or_outdated_file(tmp_path: Path):
+    cache = AlignmentCache()
+    cache.open(tmp_path / "missing", read_only=True)
+    assert cache.get(b"a" * 16) is None
+    cache.close()
+
+    outdated_path = tmp_path / "outdated"
+    _ = outdated_path.write_bytes(b"not a database")
+
+    cache.open(outdated_path)
+    assert cache.get(b"a" * 16) is None
+    cache.add(b"a" * 16, ())
+    cache.save()
+    cache.close()
@@ -1,7 +1,15 @@
+from array import array
 from dataclasses import dataclass
-from typing import Generic, SupportsIndex, TypeVar, Protocol, cast, overload
-from collections.abc import Generator, Iterable
+from enum import Enum, auto
+from typing import Any, Generic, NamedTuple, SupportsIndex, TypeVar, Protocol, cast, final, overload
+from collections.abc import Callable, Generator, Hashable, Iterable
 from abc import ABC, abstractmethod
+from pathlib import Path
+import hashlib
+import inspect
+import math
+
+from .AlignmentCache import AlignmentSpan, alignment_cache
 
 class Sliceable[_Item](Protocol):
     @overload
@@ -52,24 +60,64 @@ class Cell(Generic[Cost, MatchData]):
     def __gt__(self, cell: "Cell[Comparable[Cost], MatchData]") -> bool:
         return self.cost > cell.cost
 
+@final
+class AlignmentBand(NamedTuple):
+    """A diagonal band of the matrix to align within before resorting to the full matrix"""
+
+    radius: float
+    """How many items of y a cell may be from the diagonal, scaled by the ratio of the lengths of the sequences"""
+    max_cost: Comparable[Any]
+    """Cells which cost more than this are dropped while aligning within the band. If the alignment ends up needing
+    any of them, the full matrix is aligned instead"""
+
+
 class AlignmentService[Cost, MatchData, InputX, InputY, MappingX, MappingY, ItemX, ItemY, Match](ABC):
     @staticmethod
     def process_input(x_input: InputX, y_input: InputY, /) -> tuple[Sliceable[ItemX], Sliceable[ItemY]]:
         return (cast(Sliceable[ItemX], x_input), cast(Sliceable[ItemY], y_input))
 
+    @staticmethod
+    def cache_key(x_input: InputX, y_input: InputY, /) -> Hashable | None:
+        """Everything about the inputs that the alignment depends on, for looking up an earlier alignment of equivalent
+        inputs. The key's `repr` must be stable across runs. Alignments are not cached if this is None."""
+        return None
+
     @staticmethod
     def initial_cost() -> Comparable[Cost]:
         ...
 
     @staticmethod
     @abstractmethod
-    def mismatch_cost(mismatch_parent: Cell[Cost, MatchData], increment_x: bool, increment_y: bool, /) -> Comparable[Cost]:
+    def mismatch_cost(parent_cost: Comparable[Cost], parent_has_match: bool, increment_x: bool, increment_y: bool, /) -> Comparable[Cost]:
         ...
 
     @staticmethod
     def generate_candidate_x_key(candidate_subseq_x: Sliceable[ItemX], /) -> Sliceable[MappingX]:
         return cast(Sliceable[MappingX], candidate_subseq_x)
     
+    @staticmethod
+    def x_key_item(item_x: ItemX, /) -> MappingX:
+        """The item of a candidate x key generated from a single x item. Must agree with `generate_candidate_x_key`."""
+        return cast(MappingX, item_x)
+
+    @staticmethod
+    def mapping_keys() -> Iterable[Sliceable[MappingX]] | None:
+        """Every candidate x key that `has_mapping` accepts, if there are finitely many. These are compiled into a trie so
+        that only the suffixes that have mappings are tried; if None, every suffix is generated and tested instead."""
+        return None
+
+    @staticmethod
+    def max_x_key_length() -> int | None:
+        """The most items of x that a single match may span, if known. Defaults to the length of the longest of the
+        `mapping_keys`."""
+        return None
+
+    @staticmethod
+    def band(seq_x: Sliceable[ItemX], seq_y: Sliceable[ItemY], /) -> AlignmentBand | None:
+        """The band to try aligning within first, or None to always align the full matrix. Only valid if a cell never
+        costs less than its parent."""
+        return None
+
     @staticmethod
     def generate_candidate_y_key(candidate_subseq_y: Sliceable[ItemY], /) -> Sliceable[MappingY]:
         return cast(Sliceable[MappingY], candidate_subseq_y)
@@ -95,7 +143,7 @@ class AlignmentService[Cost, MatchData, InputX, InputY, MappingX, MappingY, Item
 
     @staticmethod
     @abstractmethod
-    def match_cost(parent: Cell[Cost, MatchData], /) -> Comparable[Cost]:
+    def match_cost(parent_cost: Comparable[Cost], /) -> Comparable[Cost]:
         ...
 
     @staticmethod
@@ -106,12 +154,89 @@ class AlignmentService[Cost, MatchData, InputX, InputY, MappingX, MappingY, Item
     @staticmethod
     @abstractmethod
     def construct_match(seq_x: Sliceable[ItemX], seq_y: Sliceable[ItemY], start_cell: Cell[Cost, MatchData], end_cell: Cell[Cost, MatchData], match_data: MatchData | None, /) -> Match:
+        """Only the coordinates of the start and end cells may be used, since cached alignments are replayed from those alone."""
         ...
 
 
 
 
-def aligner(Service: type[AlignmentService[Cost, MatchData, InputX, InputY, MappingX, MappingY, ItemX, ItemY, Match]]):
+@final
+class _ReversedKeyTrie(Generic[ItemX, MappingX]):
+    """The keys of a mapping table, stored last item first, so that the keys which match the suffixes of a sequence
+    can all be found in one backward walk over it"""
+
+    def __init__(self, keys: Iterable[Sliceable[MappingX]]):
+        self.__children: list[dict[MappingX, int]] = [{}]
+        self.__keys: list[Sliceable[MappingX] | None] = [None]
+        self.max_key_length = 0
+
+        for key in keys:
+            self.max_key_length = max(self.max_key_length, len(key))
+
+            node = 0
+            for index in range(len(key) - 1, -1, -1):
+                child = self.__children[node].get(key[index])
+                if child is None:
+                    child = len(self.__children)
+                    self.__children[node][key[index]] = child
+                    self.__children.append({})
+                    self.__keys.append(None)
+
+                node = child
+
+            self.__keys[node] = key
+
+
+    def suffix_keys(self, seq: Sliceable[ItemX], end: int, max_length: int, key_item: Callable[[ItemX], MappingX]):
+        """Yields the length and key of each suffix of `seq[:end]`, up to `max_length` items long, that is in the trie"""
+
+        node = 0
+        key = self.__keys[node]
+        if key is not None:
+            yield 0, key
+
+        for length in range(1, max_length + 1):
+            child = self.__children[node].get(key_item(seq[end - length]))
+            if child is None: return
+
+            node = child
+            key = self.__keys[node]
+            if key is not None:
+                yield length, key
+
+
+def _service_fingerprint(Service: type):
+    hasher = hashlib.blake2b(f"{Service.__module__}.{Service.__qualname__}".encode("utf-8"), digest_size=16)
+    hasher.update(Path(__file__).read_bytes())
+    hasher.update(Path(inspect.getfile(Service)).read_bytes())
+    return hasher.digest()
+
+
+class MatrixBackend(Enum):
+    CELLS = auto()
+    """Each cell is a `Cell` object that points to its parent"""
+    ARRAYS = auto()
+    """Cells are stored across flat, preallocated arrays, and point to their parents by index"""
+
+
+def aligner(
+    Service: type[AlignmentService[Cost, MatchData, InputX, InputY, MappingX, MappingY, ItemX, ItemY, Match]],
+    /,
+    *,
+    matrix_backend: MatrixBackend=MatrixBackend.ARRAYS,
+):
+    fingerprint: bytes | None = None
+    key_trie: _ReversedKeyTrie[ItemX, MappingX] | None = None
+
+    def replay(seq_x: Sliceable[ItemX], seq_y: Sliceable[ItemY], spans: Iterable[AlignmentSpan]):
+        def boundary_cell(x: int, y: int) -> Cell[Cost, MatchData]:
+            return Cell(Service.initial_cost(), x, y, None, x, y, False)
+
+        return tuple(
+            Service.construct_match(seq_x, seq_y, boundary_cell(span.start_x, span.start_y), boundary_cell(span.end_x, span.end_y), span.match_data)
+            for span in spans
+        )
+
     def align(input_x: InputX, input_y: InputY):
         """Generates an alignment between characters in a translation and keys in a Lapwing-style outline.
         
@@ -121,44 +246,50 @@ def aligner(Service: type[AlignmentService[Cost, MatchData, InputX, InputY, Mapp
         - Strict left-to-right parsing; no inversions
         """
 
+        nonlocal fingerprint, key_trie
+
         seq_x, seq_y = Service.process_input(input_x, input_y)
 
-        def create_mismatch_cell(x: int, y: int, increment_x: bool, increment_y: bool) -> Cell[Cost, MatchData]:
-            mismatch_parent = matrix[x if increment_x else x + 1][y if increment_y else y + 1]
-
-            return Cell(
-                Service.mismatch_cost(mismatch_parent, increment_x, increment_y),
-                mismatch_parent.unmatched_x_start_index,
-                mismatch_parent.unmatched_y_start_index,
-                mismatch_parent,
-                x + 1,
-                y + 1,
-                False,
-            )
+        digest: bytes | None = None
+        cache_key = Service.cache_key(input_x, input_y)
+        if cache_key is not None:
+            if fingerprint is None:
+                fingerprint = _service_fingerprint(Service)
+
+            digest = alignment_cache.digest(fingerprint, cache_key)
+            spans = alignment_cache.get(digest)
+            if spans is not None:
+                return replay(seq_x, seq_y, spans)
+
+        if key_trie is None:
+            mapping_keys = Service.mapping_keys()
+            if mapping_keys is not None:
+                key_trie = _ReversedKeyTrie(mapping_keys)
         
 
-        def find_match(x: int, y: int, increment_x: bool, increment_y: bool):
-            """Attempt to match any combination of the last m consecutive unmatched characters to the last n consecutive unmatched keys."""
-
-            domain_seq_x = seq_x[:x + 1]
-            domain_seq_y = seq_y[:y + 1]
-
-            # print()
-            # print(domain_seq_x, domain_seq_y, x, y)
-
-            candidate_cells = [create_mismatch_cell(x, y, increment_x, increment_y)]
-
+        def candidate_x_keys(x: int, increment_x: bool) -> Iterable[tuple[int, Sliceable[MappingX]]]:
+            """Yields the length and key of each suffix of the first x + 1 items that has a mapping."""
 
             # When not incrementing x, only consider silent chords
+            max_length = x + 1 if increment_x else 0
+
+            if key_trie is not None:
+                yield from key_trie.suffix_keys(seq_x, x + 1, max_length, Service.x_key_item)
+                return
 
-            for i in range((len(domain_seq_x) if increment_x else 0) + 1):
-                candidate_subseq_x = domain_seq_x[len(domain_seq_x) - i:]
-                candidate_subseq_x_key = Service.generate_candidate_x_key(candidate_subseq_x)
-                # print("using grapheme", candidate_subseq_x_key)
-                if not Service.has_mapping(candidate_subseq_x_key): continue
+            domain_seq_x = seq_x[:x + 1]
+            for i in range(max_length + 1):
+                candidate_subseq_x_key = Service.generate_candidate_x_key(domain_seq_x[len(domain_seq_x) - i:])
+                if Service.has_mapping(candidate_subseq_x_key):
+                    yield i, candidate_subseq_x_key
 
 
+        def find_matches(x: int, y: int, increment_x: bool, increment_y: bool) -> Generator[tuple[int, int, MatchData], None, None]:
+            """Attempt to match any combination of the last m consecutive unmatched characters to the last n consecutive unmatched keys.
+            
+            Yields the number of characters and keys in each match, along with its match data."""
 
+            for n_items_x, candidate_subseq_x_key in candidate_x_keys(x, increment_x):
                 candidate_subseqs_y: Iterable[Sliceable[ItemY]]
                 if increment_y:
                     candidate_subseqs_y = Service.get_mapping_options(candidate_subseq_x_key)
@@ -168,81 +299,218 @@ def aligner(Service: type[AlignmentService[Cost, MatchData, InputX, InputY, Mapp
 
                 for candidate_subseq_y in candidate_subseqs_y:
                     candidate_subseq_y_key = Service.generate_candidate_y_key(candidate_subseq_y)
-                    # print("testing chord", candidate_subseq_y_key)
-                    actual_subseq_y = domain_seq_y[len(domain_seq_y) - len(candidate_subseq_y_key):]
+                    actual_subseq_y = seq_y[max(0, y + 1 - len(candidate_subseq_y_key)):y + 1]
 
                     if not Service.is_match(actual_subseq_y, candidate_subseq_y_key): continue
 
-                    parent = matrix[x + 1 - len(candidate_subseq_x)][y + 1 - len(actual_subseq_y)]
-                    
-                    # print("found", candidate_subseq_x_key, candidate_subseq_y_key)
-                    candidate_cells.append(
-                        Cell(
-                            Service.match_cost(parent),
-                            x + 1,
-                            y + 1,
-                            parent,
-                            x + 1,
-                            y + 1,
-                            True,
-                            Service.match_data(candidate_subseq_x_key, candidate_subseq_y_key, candidate_subseq_x, candidate_subseq_y),
-                        )
+                    candidate_subseq_x = seq_x[x + 1 - n_items_x:x + 1]
+                    yield (
+                        n_items_x,
+                        len(actual_subseq_y),
+                        Service.match_data(candidate_subseq_x_key, candidate_subseq_y_key, candidate_subseq_x, candidate_subseq_y),
                     )
 
-            return min(candidate_cells)
+
+        def cell_directions(x: int, y: int):
+            """The ways to reach the cell that aligns the first x characters to the first y keys, in order of preference
+            when their costs tie"""
+
+            if x == 0:
+                return ((False, True),)
+            if y == 0:
+                return ((True, False),)
+            
+            # Increment x: add a character from the translation
+            # Increment y: add a key from the outline
+            # Increment xy: both
+            return ((True, False), (False, True), (True, True))
 
 
-        # Base row and column
+        def align_with_cells() -> list[AlignmentSpan]:
+            def create_mismatch_cell(x: int, y: int, increment_x: bool, increment_y: bool) -> Cell[Cost, MatchData]:
+                mismatch_parent = matrix[x if increment_x else x + 1][y if increment_y else y + 1]
 
-        matrix: list[list[Cell[Cost, MatchData]]] = [[Cell(Service.initial_cost(), 0, 0, None, 0, 0, False)]]
+                return Cell(
+                    Service.mismatch_cost(mismatch_parent.cost, mismatch_parent.has_match, increment_x, increment_y),
+                    mismatch_parent.unmatched_x_start_index,
+                    mismatch_parent.unmatched_y_start_index,
+                    mismatch_parent,
+                    x + 1,
+                    y + 1,
+                    False,
+                )
 
-        for i in range(len(seq_x)):
-            matrix.append([find_match(i, -1, True, False)])
+            def find_match(x: int, y: int, increment_x: bool, increment_y: bool):
+                candidate_cells = [create_mismatch_cell(x, y, increment_x, increment_y)]
 
-        for i in range(len(seq_y)):
-            matrix[0].append(find_match(-1, i, False, True))
+                for n_items_x, n_items_y, match_data in find_matches(x, y, increment_x, increment_y):
+                    parent = matrix[x + 1 - n_items_x][y + 1 - n_items_y]
+                    candidate_cells.append(Cell(Service.match_cost(parent.cost), x + 1, y + 1, parent, x + 1, y + 1, True, match_data))
 
+                return min(candidate_cells)
 
-        # Populating the matrix
 
-        for x in range(len(seq_x)):
-            for y in range(len(seq_y)):
-                # Increment x: add a character from the translation
-                x_candidate = find_match(x, y, True, False)
+            matrix: list[list[Cell[Cost, MatchData]]] = [[Cell(Service.initial_cost(), 0, 0, None, 0, 0, False)]]
 
-                # Increment y: add a key from the outline
-                y_candidate = find_match(x, y, False, True)
+            for x in range(len(seq_x) + 1):
+                if x > 0:
+                    matrix.append([])
 
-                # Increment xy: both
-                xy_candidate = find_match(x, y, True, True)
+                for y in range(len(seq_y) + 1):
+                    if x == 0 and y == 0: continue
 
+                    matrix[x].append(min(
+                        find_match(x - 1, y - 1, increment_x, increment_y)
+                        for increment_x, increment_y in cell_directions(x, y)
+                    ))
+
+
+            # Traceback
+
+            spans: list[AlignmentSpan] = []
+
+            cell = matrix[-1][-1]
+            while cell.parent is not None:
+                if cell.has_match:
+                    start_cell = cell.parent
+                    match_data = cell.match_data
+                else:
+                    start_cell = matrix[cell.parent.unmatched_x_start_index][cell.parent.unmatched_y_start_index]
+                    match_data = None
 
-                matrix[x + 1].append(min(x_candidate, y_candidate, xy_candidate))
+                spans.append(AlignmentSpan(start_cell.x, start_cell.y, cell.x, cell.y, match_data))
+                cell = start_cell
+
+            spans.reverse()
+            return spans
+
+
+        def align_with_arrays(band: AlignmentBand | None) -> list[AlignmentSpan] | None:
+            """Fills the matrix, or only the cells within `band` if given. Returns None if no alignment is found within
+            the band."""
+
+            # Cell (x, y) is stored at index x * width + y
+            width = len(seq_y) + 1
+            n_cells = (len(seq_x) + 1) * width
+
+            costs: list[Comparable[Cost]] = [Service.initial_cost()] * n_cells
+            parents = array("l", [-1]) * n_cells
+            unmatched_start_indices = array("l", [0]) * n_cells
+            has_match = bytearray(n_cells)
+            match_data_indices = array("l", [-1]) * n_cells
+            match_datas: list[MatchData] = []
+
+            # Cells outside the band, or which cost too much, are left unreachable
+            reachable = bytearray(n_cells)
+            reachable[0] = True
+
+            max_cost = band.max_cost if band is not None else None
+            n_consecutive_unreachable_rows = 0
+
+            for x in range(len(seq_x) + 1):
+                if band is None:
+                    ys = range(len(seq_y) + 1)
+                else:
+                    diagonal_y = x * len(seq_y) / len(seq_x) if len(seq_x) > 0 else 0
+                    ys = range(max(0, math.ceil(diagonal_y - band.radius)), min(len(seq_y), math.floor(diagonal_y + band.radius)) + 1)
 
+                row_is_reachable = x == 0
 
-        # Display the cost matrix
-        # COL_WIDTH = 16
-        # print(f"{'.'.ljust(COL_WIDTH) * 2}{''.join(str(key).ljust(COL_WIDTH) for key in annotated_keys)}")
-        # for r, ch in zip(matrix, f".{translation}"):
-        #     print(f"{ch.ljust(COL_WIDTH)}{''.join(str(cell.cost).ljust(COL_WIDTH) for cell in r)}")
+                for y in ys:
+                    if x == 0 and y == 0: continue
+
+                    index = x * width + y
+
+                    best_cost: Comparable[Cost] | None = None
+                    best_parent = -1
+                    best_is_match = False
+                    best_match_data: MatchData | None = None
+
+                    for increment_x, increment_y in cell_directions(x, y):
+                        mismatch_parent = index - (width if increment_x else 0) - (1 if increment_y else 0)
+                        if reachable[mismatch_parent]:
+                            cost = Service.mismatch_cost(costs[mismatch_parent], bool(has_match[mismatch_parent]), increment_x, increment_y)
+                            if best_cost is None or cost < best_cost:
+                                best_cost = cost
+                                best_parent = mismatch_parent
+                                best_is_match = False
+
+                        for n_items_x, n_items_y, match_data in find_matches(x - 1, y - 1, increment_x, increment_y):
+                            parent = index - n_items_x * width - n_items_y
+                            if not reachable[parent]: continue
+
+                            cost = Service.match_cost(costs[parent])
+                            if best_cost is None or cost < best_cost:
+                                best_cost = cost
+                                best_parent = parent
+                                best_is_match = True
+                                best_match_data = match_data
+
+                    if best_cost is None or max_cost is not None and max_cost < best_cost: continue
+
+                    reachable[index] = True
+                    row_is_reachable = True
+
+                    costs[index] = best_cost
+                    parents[index] = best_parent
+
+                    if best_is_match:
+                        unmatched_start_indices[index] = index
+                        has_match[index] = True
+                        match_data_indices[index] = len(match_datas)
+                        match_datas.append(cast(MatchData, best_match_data))
+                    else:
+                        unmatched_start_indices[index] = unmatched_start_indices[best_parent]
+
+
+                # Stop early once no later cell can have a reachable parent
+                if row_is_reachable:
+                    n_consecutive_unreachable_rows = 0
+                else:
+                    n_consecutive_unreachable_rows += 1
+                    if max_x_key_length is not None and n_consecutive_unreachable_rows >= max(1, max_x_key_length):
+                        return None
+
+            if not reachable[n_cells - 1]:
+                return None
+
+
+            # Traceback
+
+            spans: list[AlignmentSpan] = []
+
+            index = n_cells - 1
+            while parents[index] != -1:
+                if has_match[index]:
+                    start_index = parents[index]
+                    match_data = match_datas[match_data_indices[index]]
+                else:
+                    start_index = unmatched_start_indices[index]
+                    match_data = None
 
+                spans.append(AlignmentSpan(start_index // width, start_index % width, index // width, index % width, match_data))
+                index = start_index
 
-        # Traceback
+            spans.reverse()
+            return spans
 
-        def traceback_matchings(cell: Cell[Cost, MatchData]) -> Generator[Match, None, None]:
-            if cell.parent is None: return
 
-            if cell.has_match:
-                start_cell = cell.parent
-                match_data = cell.match_data
-            else:
-                start_cell = matrix[cell.parent.unmatched_x_start_index][cell.parent.unmatched_y_start_index]
-                match_data = None
+        max_x_key_length = Service.max_x_key_length()
+        if max_x_key_length is None and key_trie is not None:
+            max_x_key_length = key_trie.max_key_length
 
-            yield from traceback_matchings(start_cell)
+        if matrix_backend is MatrixBackend.CELLS:
+            spans = align_with_cells()
+        else:
+            band = Service.band(seq_x, seq_y)
+            spans = align_with_arrays(band) if band is not None else None
+            if spans is None:
+                spans = align_with_arrays(None)
+                assert spans is not None
 
-            yield Service.construct_match(seq_x, seq_y, start_cell, cell, match_data)
+        if digest is not None:
+            alignment_cache.add(digest, tuple(spans))
 
-        return tuple(traceback_matchings(matrix[-1][-1]))
+        return replay(seq_x, seq_y, spans)
 
-    return align
\ No newline at end of file
+    return align
@@ -0,0 +1,105 @@
+from abc import ABC
+from typing import NamedTuple
+
+from .alignment import AlignmentBand, AlignmentService, Cell, MatrixBackend, aligner
+
+
+class _Cost(NamedTuple):
+    n_unmatched: int
+    n_chunks: int
+
+
+_MAPPINGS = {
+    "": ("h",),
+    "a": ("a", "ei"),
+    "c": ("k", "s"),
+    "ch": ("ch", "k"),
+    "e": ("e", "ii", ""),
+    "i": ("i", "ai"),
+    "n": ("n",),
+    "o": ("o", "ou"),
+    "r": ("r",),
+    "s": ("s", "z"),
+    "t": ("t",),
+    "th": ("th",),
+}
+
+
+class _match_letters_to_phonemes(AlignmentService, ABC):
+    @staticmethod
+    def process_input(letters: str, phonemes: str):
+        return (letters, tuple(phonemes.split()))
+
+    @staticmethod
+    def initial_cost():
+        return _Cost(0, 0)
+
+    @staticmethod
+    def mismatch_cost(parent_cost: _Cost, parent_has_match: bool, increment_x: bool, increment_y: bool):
+        return _Cost(parent_cost.n_unmatched + 1, parent_cost.n_chunks + 1 if parent_has_match else parent_cost.n_chunks)
+
+    @staticmethod
+    def has_mapping(candidate_x_key: str):
+        return candidate_x_key in _MAPPINGS
+
+    @staticmethod
+    def mapping_keys():
+        return _MAPPINGS.keys()
+
+    @staticmethod
+    def get_mapping_options(candidate_x_key: str):
+        return tuple((phoneme,) if phoneme != "" else () for phoneme in _MAPPINGS[candidate_x_key])
+
+    @staticmethod
+    def is_match(actual_phonemes: tuple[str, ...], candidate_phonemes: tuple[str, ...]):
+        return actual_phonemes == candidate_phonemes
+
+    @staticmethod
+    def match_cost(parent_cost: _Cost):
+        return _Cost(parent_cost.n_unmatched, parent_cost.n_chunks + 1)
+
+    @staticmethod
+    def match_data(subseq_letters: str, subseq_phonemes: tuple[str, ...], pre_subseq_letters: str, pre_subseq_phonemes: tuple[str, ...]):
+        return None
+
+    @staticmethod
+    def construct_match(letters: str, phonemes: tuple[str, ...], start_cell: Cell[_Cost, None], end_cell: Cell[_Cost, None], _: None):
+        return f"{letters[start_cell.x:end_cell.x]}.{' '.join(phonemes[start_cell.y:end_cell.y])}"
+
+
+class _match_letters_to_phonemes_banded(_match_letters_to_phonemes, ABC):
+    @staticmethod
+    def band(letters: str, phonemes: tuple[str, ...]):
+        return AlignmentBand(1, _Cost(0, len(letters) + len(phonemes) + 1))
+
+
+_CASES = (
+    ("chaos", "k ei o s"),
+    ("anchor", "a n k o r"),
+    ("three", "th r ii"),
+    ("stone", "s t ou n"),
+    ("xenon", "z ii n o n"),
+    ("", "h"),
+    ("tea", ""),
+    ("scat", "k ei t"),
+    ("", "s t ou n"),
+    ("stone", "s"),
+)
+
+
+def test__aligner__matrix_backends_agree():
+    align_with_cells = aligner(_match_letters_to_phonemes, matrix_backend=MatrixBackend.CELLS)
+    align_with_arrays = aligner(_match_letters_to_phonemes, matrix_backend=MatrixBackend.ARRAYS)
+
+    for letters, phonemes in _CASES:
+        assert align_with_arrays(letters, phonemes) == align_with_cells(letters, phonemes)
+
+    assert align_with_arrays("chaos", "k ei o s") == ("ch.k", "a.ei", "o.o", "s.s")
+
+
+def test__aligner__banded_alignment_matches_full_alignment():
+    align_full = aligner(_match_letters_to_phonemes, matrix_backend=MatrixBackend.CELLS)
+    align_banded = aligner(_match_letters_to_phonemes_banded)
+
+    for letters, phonemes in _CASES:
+        assert align_banded(letters, phonemes) == align_full(letters, phonemes)
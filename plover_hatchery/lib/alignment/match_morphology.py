@@ -3,7 +3,7 @@ from abc import ABC
 import dataclasses
 from dataclasses import dataclass
 from typing import NamedTuple, cast, final
-from plover_hatchery.lib.alignment.alignment import AlignmentService, Cell, aligner
+from plover_hatchery.lib.alignment.alignment import AlignmentBand, AlignmentService, Cell, aligner
 from plover_hatchery.lib.alignment.parse_morphology import Affix, Formatting, Morpheme, Morphology, MorphologyChunk, Root, MorphologyPart
 
 
@@ -29,22 +29,37 @@ class _match_morphology_to_chars(AlignmentService, ABC):
     def process_input(morphology: Morphology, translation: str):
         return (morphology.parts, translation)
 
+    @staticmethod
+    def cache_key(morphology: Morphology, translation: str):
+        return (tuple((isinstance(part, Formatting), part.name) for part in morphology.parts), translation)
+
     @staticmethod
     def initial_cost():
         return _Cost(0, 0, 0)
     
     @staticmethod
-    def mismatch_cost(mismatch_parent: Cell[_Cost, None], increment_x: bool, increment_y: bool):
+    def mismatch_cost(parent_cost: _Cost, parent_has_match: bool, increment_x: bool, increment_y: bool):
         return _Cost(
-            mismatch_parent.cost.n_unmatched_parts + (1 if increment_x else 0),
-            mismatch_parent.cost.n_unmatched_chars + (1 if increment_y else 0),
-            mismatch_parent.cost.n_chunks + 1 if mismatch_parent.has_match else mismatch_parent.cost.n_chunks,
+            parent_cost.n_unmatched_parts + (1 if increment_x else 0),
+            parent_cost.n_unmatched_chars + (1 if increment_y else 0),
+            parent_cost.n_chunks + 1 if parent_has_match else parent_cost.n_chunks,
         )
 
     @staticmethod
     def has_mapping(candidate_x_key: tuple[MorphologyPart, ...]) -> bool:
         return len(candidate_x_key) == 1
 
+    @staticmethod
+    def max_x_key_length():
+        return 1
+
+    @staticmethod
+    def band(parts: tuple[MorphologyPart, ...], translation: str):
+        # Parts differ in length, so the band has to leave room for the longest one to sit off the diagonal. The banded
+        # alignment is only accepted if it matches every part and character
+        radius = max((len(part.name) for part in parts), default=0) + 1
+        return AlignmentBand(radius, _Cost(0, 0, len(parts) + len(translation) + 1))
+
     @staticmethod
     def get_mapping_options(candidate_x_key: tuple[MorphologyPart, ...]):
         part = candidate_x_key[0]
@@ -77,11 +92,11 @@ class _match_morphology_to_chars(AlignmentService, ABC):
         return actual_chars == candidate_chars
     
     @staticmethod
-    def match_cost(parent: Cell[_Cost, None]):
+    def match_cost(parent_cost: _Cost):
         return _Cost(
-            parent.cost.n_unmatched_parts,
-            parent.cost.n_unmatched_chars,
-            parent.cost.n_chunks + 1,
+            parent_cost.n_unmatched_parts,
+            parent_cost.n_unmatched_chars,
+            parent_cost.n_chunks + 1,
         )
     
     @staticmethod
@@ -112,23 +112,31 @@ class match_chars_to_chords(AlignmentService, ABC):
     @staticmethod
     def process_input(translation: str, outline_steno: str) -> tuple[str, tuple[AsteriskableKey, ...]]:
         return (translation, AsteriskableKey.annotations_from_outline(outline_steno))
+
+    @staticmethod
+    def cache_key(translation: str, outline_steno: str):
+        return (translation, outline_steno)
     
     @staticmethod
     def initial_cost():
         return _Cost(0, 0, 0)
     
     @staticmethod
-    def mismatch_cost(mismatch_parent: Cell[_Cost, tuple[bool, ...]], increment_x: bool, increment_y: bool):
+    def mismatch_cost(parent_cost: _Cost, parent_has_match: bool, increment_x: bool, increment_y: bool):
         return _Cost(
-            mismatch_parent.cost.n_unmatched_chars + (1 if increment_x else 0),
-            mismatch_parent.cost.n_unmatched_keys + (1 if increment_y else 0),
-            mismatch_parent.cost.n_chunks + 1 if mismatch_parent.has_match else mismatch_parent.cost.n_chunks,
+            parent_cost.n_unmatched_chars + (1 if increment_x else 0),
+            parent_cost.n_unmatched_keys + (1 if increment_y else 0),
+            parent_cost.n_chunks + 1 if parent_has_match else parent_cost.n_chunks,
         )
 
     @staticmethod
     def has_mapping(candidate_x_key: str) -> bool:
         return candidate_x_key in _GRAPHEME_TO_STENO_MAPPINGS
 
+    @staticmethod
+    def mapping_keys():
+        return _GRAPHEME_TO_STENO_MAPPINGS.keys()
+
     @staticmethod
     def get_mapping_options(candidate_x_key: str):
         return _GRAPHEME_TO_STENO_MAPPINGS[candidate_x_key]
@@ -144,11 +152,11 @@ class match_chars_to_chords(AlignmentService, ABC):
         )
     
     @staticmethod
-    def match_cost(parent: Cell[_Cost, tuple[bool, ...]]):
+    def match_cost(parent_cost: _Cost):
         return _Cost(
-            parent.cost.n_unmatched_chars,
-            parent.cost.n_unmatched_keys,
-            parent.cost.n_chunks + 1,
+            parent_cost.n_unmatched_chars,
+            parent_cost.n_unmatched_keys,
+            parent_cost.n_chunks + 1,
         )
     
     @staticmethod
@@ -9,7 +9,7 @@ from plover.steno import Stroke
 from ..sophone.Sophone import Sophone
 from ..sopheme.Keysymbol import Keysymbol
 from .steno_annotations import AsteriskableKey, AnnotatedChord
-from .alignment import AlignmentService, Cell, Comparable, aligner
+from .alignment import AlignmentBand, AlignmentService, Cell, Comparable, aligner
 
 from plover_hatchery_lib_rs import Sopheme
 
@@ -264,6 +264,10 @@ _KEYSYMBOL_TO_STENO_MAPPINGS = {
     }).items()
 }
 
+_BAND_RADIUS = 3
+"""How many characters a keysymbol may be aligned away from where it would be if every keysymbol took up the same
+number of characters"""
+
 class _Cost(NamedTuple):
     n_unmatched_keysymbols: int
     n_unmatched_chars: int
@@ -289,22 +293,40 @@ class match_keysymbols_to_chars(
     @staticmethod
     def process_input(transcription: tuple[Keysymbol, ...], translation: str) -> tuple[tuple[Keysymbol, ...], str]:
         return (transcription, translation)
+
+    @staticmethod
+    def cache_key(transcription: tuple[Keysymbol, ...], translation: str):
+        # Only the base symbols are looked up in the mapping table; stress and other markers are carried through
+        return (tuple(keysymbol.base_symbol for keysymbol in transcription), translation)
     
     @staticmethod
     def initial_cost():
         return _Cost(0, 0, 0)
     
     @staticmethod
-    def mismatch_cost(mismatch_parent: Cell[_Cost, None], increment_x: bool, increment_y: bool):
+    def mismatch_cost(parent_cost: _Cost, parent_has_match: bool, increment_x: bool, increment_y: bool):
         return _Cost(
-            mismatch_parent.cost.n_unmatched_keysymbols + (1 if increment_x else 0),
-            mismatch_parent.cost.n_unmatched_chars + (1 if increment_y else 0),
-            mismatch_parent.cost.n_chunks + 1 if mismatch_parent.has_match else mismatch_parent.cost.n_chunks,
+            parent_cost.n_unmatched_keysymbols + (1 if increment_x else 0),
+            parent_cost.n_unmatched_chars + (1 if increment_y else 0),
+            parent_cost.n_chunks + 1 if parent_has_match else parent_cost.n_chunks,
         )
     
     @staticmethod
     def generate_candidate_x_key(candidate_subseq_x: tuple[Keysymbol, ...]) -> tuple[str, ...]:
         return tuple(keysymbol.base_symbol for keysymbol in candidate_subseq_x)
+
+    @staticmethod
+    def x_key_item(keysymbol: Keysymbol) -> str:
+        return keysymbol.base_symbol
+
+    @staticmethod
+    def mapping_keys():
+        return _KEYSYMBOL_TO_GRAPHEME_MAPPINGS.keys()
+
+    @staticmethod
+    def band(transcription: tuple[Keysymbol, ...], translation: str):
+        # Accept the banded alignment only if it matches every keysymbol and character
+        return AlignmentBand(_BAND_RADIUS, _Cost(0, 0, len(transcription) + len(translation) + 1))
     
     @staticmethod
     def has_mapping(candidate_x_key: tuple[str, ...]):
@@ -319,11 +341,11 @@ class match_keysymbols_to_chars(
         return actual_chars == candidate_chars
     
     @staticmethod
-    def match_cost(parent: Cell[_Cost, None]):
+    def match_cost(parent_cost: _Cost):
         return _Cost(
-            parent.cost.n_unmatched_keysymbols,
-            parent.cost.n_unmatched_chars,
-            parent.cost.n_chunks + 1,
+            parent_cost.n_unmatched_keysymbols,
+            parent_cost.n_unmatched_chars,
+            parent_cost.n_chunks + 1,
         )
     
     @staticmethod
@@ -1,2 +1,4 @@
 from .generate_from_unilex import generate_from_unilex
-from .read import read_hatchery_dictionary, all_entries
\ No newline at end of file
+from .read import read_hatchery_dictionary, all_entries
+from .write import HatcheryDictionaryWriter, write_atomically
+from .export_json import export_json, JsonExportStats
@@ -0,0 +1,58 @@
+from collections.abc import Iterable
+from dataclasses import dataclass
+from typing import TextIO, final
+import json
+
+from ..pipes.Theory import TheoryLookup
+
+
+@final
+@dataclass
+class JsonExportStats:
+    n_translations: int = 0
+    n_translations_with_outlines: int = 0
+    """Translations with at least one outline written"""
+    n_outlines: int = 0
+    """Outlines written"""
+    n_outlines_lost: int = 0
+    """Outlines of a translation that were not written because the lookup translates them to something else"""
+
+
+def export_json(
+    lookup: TheoryLookup,
+    translations: Iterable[str],
+    file: TextIO,
+    *,
+    max_outlines: int | None=None,
+    max_cost: float | None=None,
+):
+    """Writes the cheapest outlines of each translation to `file` as a Plover JSON dictionary, one definition at a time.
+    An outline is only written for the translation that the lookup itself gives it, so the exported dictionary agrees
+    with the live one on every outline it contains, and no outline is written twice."""
+
+    stats = JsonExportStats()
+    is_first_definition = True
+
+    _ = file.write("{")
+
+    for translation in translations:
+        stats.n_translations += 1
+        n_written = 0
+
+        for outline, _ in lookup.reverse_lookup_with_costs(translation, max_cost, max_outlines):
+            if lookup.lookup(outline) != translation:
+                stats.n_outlines_lost += 1
+                continue
+
+            separator = "\n" if is_first_definition else ",\n"
+            _ = file.write(f"{separator}{json.dumps("/".join(outline))}: {json.dumps(translation, ensure_ascii=False)}")
+            is_first_definition = False
+            n_written += 1
+
+        stats.n_outlines += n_written
+        if n_written > 0:
+            stats.n_translations_with_outlines += 1
+
+    _ = file.write("\n}\n")
+
+    return stats
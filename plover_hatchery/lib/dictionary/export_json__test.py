@@ -0,0 +1,68 @@
+from io import StringIO
+import json
+
+from ..pipes.Theory import OutlineWithCost, TheoryLookup
+from .export_json import export_json
+
+
+_OUTLINES = {
+    "cat": (OutlineWithCost(("KAT",), 0), OutlineWithCost(("KA", "^T"), 2)),
+    "kat": (OutlineWithCost(("KAT",), 1),),
+    "dog": (OutlineWithCost(("TKOG",), 0), OutlineWithCost(("TKO", "^G"), 3)),
+    "\"quoted\"": (OutlineWithCost(("KWOET",), 0),),
+}
+
+_WINNERS = {
+    ("KAT",): "cat",
+    ("KA", "^T"): "cat",
+    ("TKOG",): "dog",
+    ("TKO", "^G"): "dog",
+    ("KWOET",): "\"quoted\"",
+}
+
+
+def _reverse_lookup_with_costs(translation: str, max_cost: float | None, max_outlines: int | None):
+    outlines = [outline for outline in _OUTLINES[translation] if max_cost is None or outline.cost <= max_cost]
+    return outlines if max_outlines is None else outlines[:max_outlines]
+
+
+_LOOKUP = TheoryLookup(
+    lookup=lambda outline: _WINNERS.get(outline),
+    reverse_lookup=lambda translation: [outline for outline, _ in _OUTLINES[translation]],
+    reverse_lookup_with_costs=_reverse_lookup_with_costs,
+    breakdown_translation=lambda translation, query: None,
+    breakdown_lookup=lambda outline, translations: None,
+    breakdown_lookup_stream=lambda outline, translations: None,
+    longest_key=2,
+)
+
+
+def test__export_json__writes_only_outlines_that_translate_back():
+    out = StringIO()
+    stats = export_json(_LOOKUP, _OUTLINES.keys(), out)
+
+    assert json.loads(out.getvalue()) == {
+        "KAT": "cat",
+        "KA/^T": "cat",
+        "TKOG": "dog",
+        "TKO/^G": "dog",
+        "KWOET": "\"quoted\"",
+    }
+    assert stats.n_translations == 4
+    assert stats.n_translations_with_outlines == 3
+    assert stats.n_outlines == 5
+    assert stats.n_outlines_lost == 1
+
+
+def test__export_json__respects_cutoffs():
+    out = StringIO()
+    _ = export_json(_LOOKUP, _OUTLINES.keys(), out, max_outlines=1)
+    assert json.loads(out.getvalue()) == {"KAT": "cat", "TKOG": "dog", "KWOET": "\"quoted\""}
+
+    out = StringIO()
+    _ = export_json(_LOOKUP, ["dog"], out, max_cost=2)
+    assert json.loads(out.getvalue()) == {"TKOG": "dog"}
+
+    out = StringIO()
+    _ = export_json(_LOOKUP, [], out)
+    assert json.loads(out.getvalue()) == {}
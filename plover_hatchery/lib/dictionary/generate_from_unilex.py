@@ -1,16 +1,23 @@
 from collections import defaultdict
+from collections.abc import Iterable, Mapping
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
 from dataclasses import dataclass
+from itertools import batched
 from pathlib import Path
-from typing import Any, Generator, Generic, TypeVar, final, overload
-
-import toml
+from typing import Any, Generator, Generic, TextIO, TypeVar, final, overload
 
+from plover_hatchery.lib.alignment.AlignmentCache import DEFAULT_MAX_ENTRIES, AlignmentSpan, alignment_cache
 from plover_hatchery.lib.alignment.match_sophemes import match_keysymbols_to_chars
 from plover_hatchery.lib.alignment.parse_morphology import AffixStressNormalizedKey, RootStressNormalizedKey, split_morphology, Affix, AffixKey, Formatting, Morpheme, MorphemeKey, MorphemeStressNormalizedKey, MorphemeSeq, Morphology, Root, RootKey
 from plover_hatchery.lib.alignment.match_morphology import match_morphology_to_chars
-from plover_hatchery.lib.dictionary.HatcheryDictionaryContents import HatcheryDictionaryContents
+from plover_hatchery.lib.dictionary.write import HatcheryDictionaryWriter, write_atomically
 from plover_hatchery.lib.sopheme import Sopheme, Keysymbol
 
+LINES_PER_JOB = 500
+"""How many lines of the lexicon each worker parses at a time when converting in parallel"""
+
+
 _Item = TypeVar("_Item")
 _BaseKey = TypeVar("_BaseKey")
 _NormalizedKey = TypeVar("_NormalizedKey")
@@ -53,6 +60,121 @@ class _FinalEntry:
     morphology: Morphology
 
 
+@final
+@dataclass(frozen=True)
+class _ParsedLine:
+    """Everything about one line of the lexicon that does not depend on the lines before it. Registrations are listed in
+    the order they are made, so that they can be replayed in a single process regardless of where the line was parsed."""
+
+    line: str
+    translation: str
+    morphology: Morphology | None
+    morpheme_registrations: tuple[tuple[Morpheme, MorphemeStressNormalizedKey], ...]
+    chunk_registrations: tuple[tuple["Affix | Root", "AffixStressNormalizedKey | RootStressNormalizedKey"], ...]
+    ignore_entry: bool
+    failed: bool
+
+
+def _get_normalized_chunk_keysymbols(chunk: "Affix | Root", morpheme_normalized_keys: Mapping[MorphemeKey, MorphemeStressNormalizedKey]) -> Generator[MorphemeStressNormalizedKey, None, None]:
+    for part in chunk.morpheme_seq.parts:
+        if isinstance(part, Formatting): continue
+
+        yield morpheme_normalized_keys[part.dict_key]
+
+
+@overload
+def _normalize_chunk_stress(chunk: Affix, morpheme_normalized_keys: Mapping[MorphemeKey, MorphemeStressNormalizedKey]) -> AffixStressNormalizedKey: ...
+@overload
+def _normalize_chunk_stress(chunk: Root, morpheme_normalized_keys: Mapping[MorphemeKey, MorphemeStressNormalizedKey]) -> RootStressNormalizedKey: ...
+def _normalize_chunk_stress(chunk: "Affix | Root", morpheme_normalized_keys: Mapping[MorphemeKey, MorphemeStressNormalizedKey]):
+    max_stress = Keysymbol.max_stress_value(
+        morpheme_normalized_keys[morpheme.dict_key].max_stress
+        for morpheme in chunk.morpheme_seq.parts
+        if isinstance(morpheme, Morpheme)
+    )
+
+    morpheme_keys = tuple(_get_normalized_chunk_keysymbols(chunk, morpheme_normalized_keys))
+    if isinstance(chunk, Affix):
+        return AffixStressNormalizedKey(chunk.is_suffix, chunk.morpheme_seq.name, morpheme_keys, max_stress, chunk.morpheme_seq.ortho)
+    
+    return RootStressNormalizedKey(chunk.morpheme_seq.name, morpheme_keys, max_stress, chunk.morpheme_seq.ortho)
+
+
+def _parse_line(line: str) -> _ParsedLine:
+    """Splits and aligns the morphology of one line of the lexicon and normalizes the stress of its parts.
+
+    A morpheme's normalized key only depends on its own name, phonology and spelling, so it can be computed without
+    knowing which morphemes other lines have registered."""
+
+    translation = ""
+    morphology: Morphology | None = None
+    morpheme_registrations: list[tuple[Morpheme, MorphemeStressNormalizedKey]] = []
+    chunk_registrations: list[tuple[Affix | Root, AffixStressNormalizedKey | RootStressNormalizedKey]] = []
+    ignore_entry = False
+
+    try:
+        translation, _, _, transcription, morphology_str, _ = line.split(":")
+
+
+        morphology = split_morphology(transcription, morphology_str)
+        morphology = match_morphology_to_chars(morphology, translation)
+
+        morpheme_normalized_keys: dict[MorphemeKey, MorphemeStressNormalizedKey] = {}
+        for part in morphology.parts:
+            if not isinstance(part, Morpheme): continue
+
+            keysymbols = Keysymbol.parse_seq(part.phono)
+            new_keysymbols, max_stress = Keysymbol.normalize_stress(keysymbols)
+            normalized_key = MorphemeStressNormalizedKey(part.name, new_keysymbols, max_stress, part.ortho)
+
+            morpheme_normalized_keys[part.dict_key] = normalized_key
+            morpheme_registrations.append((part, normalized_key))
+
+
+        for chunk in morphology.chunks:
+            if isinstance(chunk, Formatting): continue
+                
+            chunk_registrations.append((chunk, _normalize_chunk_stress(chunk, morpheme_normalized_keys)))
+
+            if isinstance(chunk, Affix) and chunk.is_suffix and chunk.morpheme_seq.name in ("s", "ing", "ed", "'s"):
+                ignore_entry = True
+
+    except Exception:
+        # Whatever was registered before the failure is still kept, as it would be when converting serially
+        return _ParsedLine(line, translation, morphology, tuple(morpheme_registrations), tuple(chunk_registrations), ignore_entry, True)
+
+    return _ParsedLine(line, translation, morphology, tuple(morpheme_registrations), tuple(chunk_registrations), ignore_entry, False)
+
+
+def _open_worker_alignment_cache(alignment_cache_path: Path | None, max_cached_alignments: int | None):
+    alignment_cache.set_max_entries(max_cached_alignments)
+
+    # Workers only look up the persisted alignments and hand their new ones back, which the main process saves
+    if alignment_cache_path is not None:
+        alignment_cache.open(alignment_cache_path, read_only=True)
+
+
+def _parse_lines(lines: tuple[str, ...]) -> tuple[list[_ParsedLine], dict[bytes, tuple[AlignmentSpan, ...]]]:
+    """Parses a batch of lines in a worker, handing back the alignments it computed so the main process can keep them"""
+    return [_parse_line(line) for line in lines], alignment_cache.take_new_entries()
+
+
+def _parse_lines_in_parallel(
+    lines: Iterable[str],
+    jobs: int,
+    alignment_cache_path: Path | None,
+    max_cached_alignments: int | None,
+) -> Generator[_ParsedLine, None, None]:
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=_open_worker_alignment_cache,
+        initargs=(alignment_cache_path, max_cached_alignments),
+    ) as executor:
+        for parsed_lines, new_alignments in executor.map(_parse_lines, batched(lines, LINES_PER_JOB)):
+            alignment_cache.update(new_alignments)
+            yield from parsed_lines
+
+
 @final
 class _UnilexHatcheryConverter:
     def __init__(self):
@@ -68,31 +190,6 @@ class _UnilexHatcheryConverter:
         return self.__suffixes 
 
 
-    def __get_normalized_chunk_keysymbols(self, chunk: "Affix | Root") -> Generator[MorphemeStressNormalizedKey, None, None]:
-        for part in chunk.morpheme_seq.parts:
-            if isinstance(part, Formatting): continue
-
-            yield self.__morphemes.normalized_keys[part.dict_key]
-            
-
-    @overload
-    def __normalize_chunk_stress(self, chunk: Affix) -> AffixStressNormalizedKey: ...
-    @overload
-    def __normalize_chunk_stress(self, chunk: Root) -> RootStressNormalizedKey: ...
-    def __normalize_chunk_stress(self, chunk: "Affix | Root"):
-        max_stress = Keysymbol.max_stress_value(
-            self.__morphemes.normalized_keys[morpheme.dict_key].max_stress
-            for morpheme in chunk.morpheme_seq.parts
-            if isinstance(morpheme, Morpheme)
-        )
-
-        morpheme_keys = tuple(self.__get_normalized_chunk_keysymbols(chunk))
-        if isinstance(chunk, Affix):
-            return AffixStressNormalizedKey(chunk.is_suffix, chunk.morpheme_seq.name, morpheme_keys, max_stress, chunk.morpheme_seq.ortho)
-        
-        return RootStressNormalizedKey(chunk.morpheme_seq.name, morpheme_keys, max_stress, chunk.morpheme_seq.ortho)
-
-
     def __root_full_varname(self, root: Root):
         if len(self.__roots.by_name[root.morpheme_seq.name]) == 1:
             return root.varname
@@ -176,7 +273,15 @@ class _UnilexHatcheryConverter:
         return " ".join(entry_parts)
 
 
-    def generate(self, in_path: Path, out_path: Path, failures_out_path: Path | None):
+    def generate(
+        self,
+        in_path: Path,
+        out_path: Path,
+        failures_out_path: Path | None,
+        jobs: int=1,
+        alignment_cache_path: Path | None=None,
+        max_cached_alignments: int | None=DEFAULT_MAX_ENTRIES,
+    ):
         # with open(root / args.in_json_path, "r", encoding="utf-8") as file:
         #     lapwing_dict = json.load(file)
         
@@ -203,112 +308,115 @@ class _UnilexHatcheryConverter:
 
 
 
-        entries_list: list[_FinalEntry] = []
+        # Later lines with the same translation replace the definition, but keep the position, of earlier ones
+        entries_by_translation: dict[str, _FinalEntry] = {}
 
 
         n_entries_parsed = 0
 
-        failures_str = ""
-
-        with open(in_path, "r", encoding="utf-8") as file:
-            print()
-            while len(line := file.readline()) > 0:
-                if n_entries_parsed % 1000 == 0:
-                    print(f"\x1b[FParsed {n_entries_parsed}")
-                n_entries_parsed += 1
-
-
-                try:
-                    translation, _, _, transcription, morphology_str, _ = line.split(":")
-
+        alignment_cache.set_max_entries(max_cached_alignments)
+        if alignment_cache_path is not None:
+            alignment_cache.open(alignment_cache_path)
 
-                    morphology = split_morphology(transcription, morphology_str)
-                    morphology = match_morphology_to_chars(morphology, translation)
-
-                    for part in morphology.parts:
-                        if not isinstance(part, Morpheme): continue
-
-                        keysymbols = Keysymbol.parse_seq(part.phono)
-                        new_keysymbols, max_stress = Keysymbol.normalize_stress(keysymbols)
-                        normalized_key = MorphemeStressNormalizedKey(part.name, new_keysymbols, max_stress, part.ortho)
-
-                        self.__morphemes.register(part, part.name, part.dict_key, normalized_key)
+        with ExitStack() as files:
+            out_file = files.enter_context(write_atomically(out_path))
+            writer = HatcheryDictionaryWriter(out_file)
+            writer.write_meta({
+                "hatchery-format-version": "0.0.0",
+            })
+            out_file.flush()
 
+            failures_file: TextIO | None = None
 
+            with open(in_path, "r", encoding="utf-8") as file:
+                if jobs > 1:
+                    parsed_lines = _parse_lines_in_parallel(file, jobs, alignment_cache_path, max_cached_alignments)
+                else:
+                    parsed_lines = (_parse_line(line) for line in file)
 
-                    ignore_entry = False
-                    for chunk in morphology.chunks:
-                        if isinstance(chunk, Formatting): continue
-                            
-                        if isinstance(chunk, Affix):
-                            normalized_key = self.__normalize_chunk_stress(chunk)
-                            self.__affix_tracker_for(chunk).register(chunk, chunk.morpheme_seq.name, chunk.dict_key, normalized_key)
+                print()
+                for parsed_line in parsed_lines:
+                    if n_entries_parsed % 1000 == 0:
+                        print(f"\x1b[FParsed {n_entries_parsed}")
+                    n_entries_parsed += 1
 
-                            if chunk.is_suffix and chunk.morpheme_seq.name in ("s", "ing", "ed", "'s"):
-                                ignore_entry = True
 
-                            continue
+                    # Registration order decides the ids of same-named entries, so it is only ever done here, in file order
+                    for morpheme, normalized_key in parsed_line.morpheme_registrations:
+                        self.__morphemes.register(morpheme, morpheme.name, morpheme.dict_key, normalized_key)
 
-                        normalized_key = self.__normalize_chunk_stress(chunk)
-                        self.__roots.register(chunk, chunk.morpheme_seq.name, chunk.dict_key, normalized_key)
+                    for chunk, normalized_key in parsed_line.chunk_registrations:
+                        tracker = self.__affix_tracker_for(chunk) if isinstance(chunk, Affix) else self.__roots
+                        tracker.register(chunk, chunk.morpheme_seq.name, chunk.dict_key, normalized_key)
 
 
-                    if ignore_entry:
+                    if parsed_line.failed:
+                        if failures_out_path is not None:
+                            if failures_file is None:
+                                failures_file = files.enter_context(open(failures_out_path, "w", encoding="utf-8"))
+                            _ = failures_file.write(parsed_line.line)
                         continue
 
+                    if parsed_line.ignore_entry:
+                        continue
 
-                    # sophemes = match_keysymbols_to_chars(transcription, translation)
-                    entries_list.append(_FinalEntry(translation, morphology))
-
-                except Exception as e:
-                    import traceback
-                    if failures_out_path is not None:
-                        failures_str += line
-                        # print(f"failed {line.strip()}: {e} ({''.join(traceback.format_tb(e.__traceback__))})")
-
-
+                    assert parsed_line.morphology is not None
+                    entries_by_translation[parsed_line.translation] = _FinalEntry(parsed_line.translation, parsed_line.morphology)
 
-        if failures_out_path is not None and len(failures_str) > 0:
-            with open(failures_out_path, "r", encoding="utf-8") as failures_file:
-                _ = failures_file.write(failures_str)
-            
 
-        out_dict: HatcheryDictionaryContents = {
-            "meta": {
-                "hatchery-format-version": "0.0.0",
-            },
-            "morphemes": {},
-            "entries": {},
-        }
+            # Variable names depend on how many same-named morphemes there are, so definitions can only be written once
+            # every line has been registered
 
+            writer.begin_section("morphemes")
 
-        for _, morpheme in sorted(self.__morphemes.by_normalized_key.items(), key=lambda item: (item[0].name, self.__morphemes.ids[item[0]])):
-            # if morpheme_n_uses[morpheme_key] == 1: continue
-            out_dict["morphemes"][self.__morpheme_full_varname(morpheme)] = self.__morpheme_definition(morpheme)
+            for _, morpheme in sorted(self.__morphemes.by_normalized_key.items(), key=lambda item: (item[0].name, self.__morphemes.ids[item[0]])):
+                # if morpheme_n_uses[morpheme_key] == 1: continue
+                writer.write_definition(self.__morpheme_full_varname(morpheme), self.__morpheme_definition(morpheme))
 
-        for root_key, root in sorted(self.__roots.by_normalized_key.items(), key=lambda item: (item[0].name, self.__roots.ids[item[0]])):
-            # if root_n_uses[root_key] == 1: continue
-            out_dict["morphemes"][self.__root_full_varname(root)] = self.__morpheme_seq_definition(root.morpheme_seq, root_key.max_stress)
+            for root_key, root in sorted(self.__roots.by_normalized_key.items(), key=lambda item: (item[0].name, self.__roots.ids[item[0]])):
+                # if root_n_uses[root_key] == 1: continue
+                writer.write_definition(self.__root_full_varname(root), self.__morpheme_seq_definition(root.morpheme_seq, root_key.max_stress))
 
-        for prefix_key, prefix in sorted(self.__prefixes.by_normalized_key.items(), key=lambda item: (item[0].name, self.__prefixes.ids[item[0]])):
-            out_dict["morphemes"][self.__affix_full_varname(prefix)] = self.__morpheme_seq_definition(prefix.morpheme_seq, prefix_key.max_stress)
+            for prefix_key, prefix in sorted(self.__prefixes.by_normalized_key.items(), key=lambda item: (item[0].name, self.__prefixes.ids[item[0]])):
+                writer.write_definition(self.__affix_full_varname(prefix), self.__morpheme_seq_definition(prefix.morpheme_seq, prefix_key.max_stress))
 
-        for suffix_key, suffix in sorted(self.__suffixes.by_normalized_key.items(), key=lambda item: (item[0].name, self.__suffixes.ids[item[0]])):
-            out_dict["morphemes"][self.__affix_full_varname(suffix)] = self.__morpheme_seq_definition(suffix.morpheme_seq, suffix_key.max_stress)
+            for suffix_key, suffix in sorted(self.__suffixes.by_normalized_key.items(), key=lambda item: (item[0].name, self.__suffixes.ids[item[0]])):
+                writer.write_definition(self.__affix_full_varname(suffix), self.__morpheme_seq_definition(suffix.morpheme_seq, suffix_key.max_stress))
 
 
-        print()
-        n_entries_written = 0
-        for entry in entries_list:
-            if n_entries_written % 1000 == 0:
-                print(f"\x1b[FWritten {n_entries_written}")
-            n_entries_written += 1
+            writer.begin_section("entries")
 
-            out_dict["entries"][entry.translation] = self.__final_entry_definition(entry)
-            
-
-        with open(out_path, "w+", encoding="utf-8") as out_file:
-            toml.dump(out_dict, out_file)
-
-def generate_from_unilex(in_path: Path, out_path: Path, failures_out_path: Path | None):
-    return _UnilexHatcheryConverter().generate(in_path, out_path, failures_out_path)
\ No newline at end of file
+            print()
+            n_entries_written = 0
+            for entry in entries_by_translation.values():
+                if n_entries_written % 1000 == 0:
+                    print(f"\x1b[FWritten {n_entries_written}")
+                n_entries_written += 1
+
+                writer.write_definition(entry.translation, self.__final_entry_definition(entry))
+
+
+        if alignment_cache_path is not None:
+            alignment_cache.save()
+            alignment_cache.close()
+
+def generate_from_unilex(
+    in_path: Path,
+    out_path: Path,
+    failures_out_path: Path | None,
+    jobs: int=1,
+    alignment_cache_path: Path | None=None,
+    max_cached_alignments: int | None=DEFAULT_MAX_ENTRIES,
+):
+    """Converts the Unilex lexicon into a Hatchery dictionary. With more than one job, lines are parsed and aligned in a
+    pool of worker processes; the output is the same either way.
+
+    Definitions are written as they are produced, but every entry is still held in memory until parsing finishes, since
+    entries are deduplicated by translation and their morphemes' variable names depend on every line. Memory use grows
+    with the size of the lexicon.
+
+    Each process keeps up to `max_cached_alignments` of its most recently used alignments in memory (None for no limit),
+    so that repeated pairs of pronunciations and spellings are only aligned once. If `alignment_cache_path` is given,
+    alignments are also looked up in and saved to that file, so that a later conversion only aligns what it has not seen
+    before."""
+    return _UnilexHatcheryConverter().generate(in_path, out_path, failures_out_path, jobs, alignment_cache_path, max_cached_alignments)
\ No newline at end of file
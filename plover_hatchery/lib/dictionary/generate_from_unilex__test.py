@@ -0,0 +1,44 @@
+from pathlib import Path
+import pickle
+import sys
+
+import pytest
+
+from .generate_from_unilex import _parse_line, generate_from_unilex
+
+
+_LEXICON_LINES = (
+    "airworthiest:JJS:0: { * eir r }.> w ~ @@r r . dh == iy >.> E05 s t > :{air}>worth==y>>est>:1\n",
+    "air:NN:0: { * eir r } :{air}:1\n",
+    "airs:NNS:0: { * eir r }.> z > :{air}>s>:1\n",
+    "not a lexicon line\n",
+    "worth:NN:0: { w * @@r r . th } :{worth}:1\n",
+)
+
+
+def test__parse_line__result_survives_pickling():
+    parsed_line = _parse_line(_LEXICON_LINES[0])
+
+    assert not parsed_line.failed
+    assert pickle.loads(pickle.dumps(parsed_line)) == parsed_line
+
+
+def test__generate_from_unilex__parallel_output_matches_serial(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    # Small batches, so that the lines are spread across both workers
+    monkeypatch.setattr(sys.modules[generate_from_unilex.__module__], "LINES_PER_JOB", 2)
+
+    in_path = tmp_path / "unilex"
+    _ = in_path.write_text("".join(_LEXICON_LINES * 3), encoding="utf-8")
+
+    serial_out_path = tmp_path / "serial.hatchery"
+    serial_failures_path = tmp_path / "serial.failures"
+    generate_from_unilex(in_path, serial_out_path, serial_failures_path, jobs=1)
+
+    parallel_out_path = tmp_path / "parallel.hatchery"
+    parallel_failures_path = tmp_path / "parallel.failures"
+    generate_from_unilex(in_path, parallel_out_path, parallel_failures_path, jobs=2)
+
+
+    assert parallel_out_path.read_bytes() == serial_out_path.read_bytes()
+    assert parallel_failures_path.read_bytes() == serial_failures_path.read_bytes()
+    assert not (tmp_path / "parallel.hatchery.tmp").exists()
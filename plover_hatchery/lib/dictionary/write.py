@@ -0,0 +1,99 @@
+from collections.abc import Generator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Literal, TextIO, final
+import os
+import re
+
+from .HatcheryDictionaryContents import HatcheryDictionaryMetaContents
+
+
+_SECTION_ORDER = ("meta", "morphemes", "entries")
+
+_BARE_KEY = re.compile(r"[A-Za-z0-9_-]+")
+
+_ESCAPES = {
+    "\"": "\\\"",
+    "\\": "\\\\",
+    "\b": "\\b",
+    "\t": "\\t",
+    "\n": "\\n",
+    "\f": "\\f",
+    "\r": "\\r",
+}
+
+_NEEDS_ESCAPE = re.compile(r"[\"\\\x00-\x1f\x7f]")
+
+
+def _escape_char(match: re.Match[str]):
+    char = match.group()
+    return _ESCAPES.get(char, f"\\u{ord(char):04x}")
+
+
+def _toml_str(value: str):
+    return f"\"{_NEEDS_ESCAPE.sub(_escape_char, value)}\""
+
+
+def _toml_key(key: str):
+    return key if _BARE_KEY.fullmatch(key) else _toml_str(key)
+
+
+@contextmanager
+def write_atomically(path: Path) -> Generator[TextIO, None, None]:
+    """Opens a temporary file next to `path` that only replaces it once it has been written in full, so that a dictionary
+    Plover has loaded is never left half-written. The temporary file is removed if writing fails"""
+
+    temp_path = path.with_name(f"{path.name}.tmp")
+
+    try:
+        with open(temp_path, "w", encoding="utf-8") as file:
+            yield file
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+    os.replace(temp_path, path)
+
+
+@final
+class HatcheryDictionaryWriter:
+    """Writes a Hatchery dictionary one definition at a time, so that the dictionary never has to be held in memory
+    all at once. Sections are written in the order meta, morphemes, entries, and each can only be started once."""
+
+    def __init__(self, file: TextIO):
+        self.__file = file
+        self.__n_sections_started = 0
+
+
+    def write_meta(self, meta: HatcheryDictionaryMetaContents):
+        self.begin_section("meta")
+        for key, value in meta.items():
+            self.write_definition(key, value)
+
+
+    def begin_section(self, name: Literal["meta", "morphemes", "entries"]):
+        section_index = _SECTION_ORDER.index(name)
+        if section_index < self.__n_sections_started:
+            raise ValueError(f"section {name} has already been started")
+
+        # Sections that were skipped are written empty, so that every dictionary has all of them
+        for skipped_name in _SECTION_ORDER[self.__n_sections_started:section_index + 1]:
+            if self.__n_sections_started > 0:
+                _ = self.__file.write("\n")
+
+            _ = self.__file.write(f"[{skipped_name}]\n")
+            self.__n_sections_started += 1
+
+
+    def write_definition(self, key: str, value: str):
+        if self.__n_sections_started == 0:
+            raise ValueError("a section must be started before writing definitions")
+
+        _ = self.__file.write(f"{_toml_key(key)} = {_toml_str(value)}\n")
+
+
+    def finish(self):
+        """Writes any sections that were never started"""
+
+        if self.__n_sections_started < len(_SECTION_ORDER):
+            self.begin_section("entries")
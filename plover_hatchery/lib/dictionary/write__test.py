@@ -0,0 +1,77 @@
+from io import StringIO
+from pathlib import Path
+
+import pytest
+import toml
+
+from .write import HatcheryDictionaryWriter, write_atomically
+
+
+def test__hatchery_dictionary_writer__round_trips():
+    morphemes = {
+        "@air": "a.eir!1 i. r.r",
+        "#worth:2": "{@worth}",
+        "^'s": "{@'s}",
+        "air^": "\"quoted\" \\ back\tslash",
+    }
+    entries = {
+        "airworthiest": "{#air} {#worth:2}!2 {^est}",
+        "café": "c.k a.a f.f é.ei",
+        "new\nline": "\x7f",
+    }
+
+    out = StringIO()
+    writer = HatcheryDictionaryWriter(out)
+    writer.write_meta({"hatchery-format-version": "0.0.0"})
+
+    writer.begin_section("morphemes")
+    for key, value in morphemes.items():
+        writer.write_definition(key, value)
+
+    writer.begin_section("entries")
+    for key, value in entries.items():
+        writer.write_definition(key, value)
+
+
+    assert toml.loads(out.getvalue()) == {
+        "meta": {"hatchery-format-version": "0.0.0"},
+        "morphemes": morphemes,
+        "entries": entries,
+    }
+
+
+def test__hatchery_dictionary_writer__writes_skipped_sections():
+    out = StringIO()
+    writer = HatcheryDictionaryWriter(out)
+    writer.write_meta({"hatchery-format-version": "0.0.0"})
+    writer.finish()
+
+    assert toml.loads(out.getvalue()) == {"meta": {"hatchery-format-version": "0.0.0"}, "morphemes": {}, "entries": {}}
+
+    with pytest.raises(ValueError):
+        writer.begin_section("morphemes")
+
+
+def test__write_atomically__replaces_file_only_once_written(tmp_path: Path):
+    path = tmp_path / "out.hatchery"
+    _ = path.write_text("old", encoding="utf-8")
+
+    with write_atomically(path) as file:
+        _ = file.write("new")
+        assert path.read_text(encoding="utf-8") == "old"
+
+    assert path.read_text(encoding="utf-8") == "new"
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test__write_atomically__keeps_old_file_if_writing_fails(tmp_path: Path):
+    path = tmp_path / "out.hatchery"
+    _ = path.write_text("old", encoding="utf-8")
+
+    with pytest.raises(RuntimeError):
+        with write_atomically(path) as file:
+            _ = file.write("half")
+            raise RuntimeError()
+
+    assert path.read_text(encoding="utf-8") == "old"
+    assert list(tmp_path.iterdir()) == [path]
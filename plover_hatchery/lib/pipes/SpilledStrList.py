@@ -0,0 +1,69 @@
+from array import array
+from collections.abc import Iterable, Iterator, Sequence
+from threading import Lock
+from typing import final, overload
+import tempfile
+
+
+@final
+class SpilledStrList(Sequence[str]):
+    """An append-only list of strings that lives in a temporary file. Only the offset of each string is kept in memory."""
+
+    def __init__(self, values: Iterable[str]=()):
+        self.__file = tempfile.TemporaryFile()
+        self.__offsets = array("Q", [0])
+        self.__lock = Lock()
+        self.__needs_flush = False
+
+        for value in values:
+            self.append(value)
+
+
+    def append(self, value: str):
+        with self.__lock:
+            _ = self.__file.seek(self.__offsets[-1])
+            _ = self.__file.write(value.encode("utf-8"))
+            self.__offsets.append(self.__file.tell())
+            self.__needs_flush = True
+
+
+    def __read(self, index: int):
+        if self.__needs_flush:
+            self.__file.flush()
+            self.__needs_flush = False
+
+        start = self.__offsets[index]
+        end = self.__offsets[index + 1]
+
+        _ = self.__file.seek(start)
+        return self.__file.read(end - start).decode("utf-8")
+
+
+    @overload
+    def __getitem__(self, index: int) -> str: ...
+    @overload
+    def __getitem__(self, index: slice) -> list[str]: ...
+    def __getitem__(self, index: int | slice):
+        with self.__lock:
+            if isinstance(index, slice):
+                return [self.__read(i) for i in range(*index.indices(len(self)))]
+
+            if index < 0:
+                index += len(self)
+            if not 0 <= index < len(self):
+                raise IndexError("spilled list index out of range")
+
+            return self.__read(index)
+
+
+    def __len__(self):
+        return len(self.__offsets) - 1
+
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self[i]
+
+
+    def close(self):
+        self.__file.close()
@@ -0,0 +1,33 @@
+from collections.abc import Sequence
+
+from .SpilledStrList import SpilledStrList
+
+
+def test__spilled_str_list__round_trip():
+    values = ["crest", "", "amphithéâtre", "c.k r.r e.e!1 s.s t.t"]
+    spilled = SpilledStrList(values)
+
+    assert len(spilled) == len(values)
+    assert list(spilled) == values
+    assert spilled[2] == "amphithéâtre"
+    assert spilled[-1] == values[-1]
+    assert spilled[1:3] == values[1:3]
+
+
+def test__spilled_str_list__is_a_sequence():
+    values = ["crest", "amphithéâtre"]
+    spilled = SpilledStrList(values)
+
+    assert isinstance(spilled, Sequence)
+    assert "amphithéâtre" in spilled
+    assert spilled.index("amphithéâtre") == 1
+    assert list(reversed(spilled)) == values[::-1]
+
+
+def test__spilled_str_list__append_after_read():
+    spilled = SpilledStrList(["a"])
+    assert spilled[0] == "a"
+
+    spilled.append("b")
+    assert spilled[1] == "b"
+    assert spilled[0] == "a"
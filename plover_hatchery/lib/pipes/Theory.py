@@ -1,18 +1,31 @@
 from dataclasses import dataclass
 from collections.abc import Callable, Iterable
-from typing import final, Protocol
+from typing import final, NamedTuple, Protocol
 
-from ..trie import NondeterministicTrie
+from ..trie import NondeterministicTrie, SubtrieQuery
 from ..sopheme import Sopheme
 
 
+@final
+class OutlineWithCost(NamedTuple):
+    outline: tuple[str, ...]
+    cost: float
+
+
 @final
 @dataclass(frozen=True)
 class TheoryLookup:
     lookup: Callable[[tuple[str, ...]], str | None]
     reverse_lookup: Callable[[str], list[tuple[str, ...]]]
-    breakdown_translation: Callable[[str], str | None]
+    reverse_lookup_with_costs: Callable[[str, float | None, int | None], list[OutlineWithCost]]
+    """Finds the outlines of a translation, cheapest first, that cost at most the given cost (if any), keeping at most the
+    given number of them (if any)"""
+    breakdown_translation: Callable[[str, SubtrieQuery], str | None]
     breakdown_lookup: Callable[[tuple[str, ...], list[str]], str | None]
+    breakdown_lookup_stream: Callable[[tuple[str, ...], list[str]], Iterable[str] | None]
+    """Like `breakdown_lookup`, but yields each path as its own JSON document as soon as it is summarized"""
+    longest_key: int
+    """The largest number of strokes that any outline with a translation can have"""
 
 
 @final
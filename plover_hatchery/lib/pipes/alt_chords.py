@@ -1,11 +1,88 @@
-from collections.abc import Iterable
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass
 
 from plover.steno import Stroke
 
+from plover_hatchery_lib_rs import Soph
+
 from plover_hatchery.lib.pipes.Plugin import Plugin, define_plugin, GetPluginApi
-from plover_hatchery.lib.pipes.floating_keys import floating_keys
+from plover_hatchery.lib.pipes.floating_keys import FloatingKeysApi, floating_keys
 from plover_hatchery.lib.pipes.plugin_utils import join_sophs_to_chords_dicts
-from plover_hatchery.lib.pipes.soph_trie import LookupResultWithAssociations, SophChordAssociation, soph_trie
+from plover_hatchery.lib.pipes.soph_trie import LookupResultWithAssociations, SophChordAssociation, SophChordAssociationWithUnresolvedPhonemes, soph_trie
+
+
+@dataclass(frozen=True)
+class MainChordMasks:
+    """Bitmasks over the main chords of an alt chord's sophs, indexed by key index, so that checking whether any main
+    chord fits between two neighboring chords takes a few integer operations."""
+
+    floating_keys_api: FloatingKeysApi
+    usable_after_key_index: tuple[int, ...]
+    """The main chords that can follow a chord whose last non-floater key has the given index"""
+    usable_before_key_index: tuple[int, ...]
+    """The main chords that can precede a chord whose first non-floater key has the given index"""
+    always_usable: int
+    """The main chords that only contain floaters"""
+    all_usable: int
+
+    @staticmethod
+    def build(main_chords: Iterable[Stroke], floating_keys_api: FloatingKeysApi):
+        bounds = tuple(floating_keys_api.key_index_bounds(chord) for chord in main_chords)
+        n_key_indices = 1 + max((last_key_index for _, last_key_index in filter(None, bounds)), default=-1)
+
+        usable_after_key_index = [0] * n_key_indices
+        usable_before_key_index = [0] * n_key_indices
+        always_usable = 0
+
+        for i, chord_bounds in enumerate(bounds):
+            if chord_bounds is None:
+                always_usable |= 1 << i
+                continue
+
+            first_key_index, last_key_index = chord_bounds
+            for key_index in range(n_key_indices):
+                if key_index < first_key_index:
+                    usable_after_key_index[key_index] |= 1 << i
+                if last_key_index < key_index:
+                    usable_before_key_index[key_index] |= 1 << i
+
+        # Chords of only floaters fit anywhere in a stroke, whatever keys their neighbors use
+        for key_index in range(n_key_indices):
+            usable_after_key_index[key_index] |= always_usable
+            usable_before_key_index[key_index] |= always_usable
+
+        return MainChordMasks(
+            floating_keys_api,
+            tuple(usable_after_key_index),
+            tuple(usable_before_key_index),
+            always_usable,
+            (1 << len(bounds)) - 1,
+        )
+
+    def any_usable_between(self, preceding_chord: Stroke | None, following_chord: Stroke | None):
+        preceding_bounds = None if preceding_chord is None else self.floating_keys_api.key_index_bounds(preceding_chord)
+        if preceding_bounds is None:
+            usable_after = self.all_usable
+        else:
+            _, last_key_index = preceding_bounds
+            usable_after = (
+                self.usable_after_key_index[last_key_index]
+                if last_key_index < len(self.usable_after_key_index)
+                else self.always_usable
+            )
+
+        following_bounds = None if following_chord is None else self.floating_keys_api.key_index_bounds(following_chord)
+        if following_bounds is None:
+            usable_before = self.all_usable
+        else:
+            first_key_index, _ = following_bounds
+            usable_before = (
+                self.usable_before_key_index[first_key_index]
+                if first_key_index < len(self.usable_before_key_index)
+                else self.all_usable
+            )
+
+        return usable_after & usable_before != 0
 
 
 def alt_chords(
@@ -28,35 +105,60 @@ def alt_chords(
         floating_keys_api = get_plugin_api(floating_keys)
 
 
-        @soph_trie_api.validate_lookup_result.listen(alt_chords)
-        def _(result: LookupResultWithAssociations, **_):
-            # Return true iff, for every alt chord path taken, all of the main chords were unusable
+        main_chord_masks_by_alt_chord: dict[tuple[tuple[Soph, ...], Stroke], MainChordMasks] = {}
+        for sophs, alt_chords_for_sophs in sophs_to_alternate_chords.items():
+            main_chords = sophs_to_main_chords.get(sophs, ())
+            if len(main_chords) == 0: continue
+
+            masks = MainChordMasks.build(main_chords, floating_keys_api)
+            for alt_chord in alt_chords_for_sophs:
+                main_chord_masks_by_alt_chord[sophs, alt_chord] = masks
+
+
+        def uses_alt_chord_needlessly(associations: Sequence[SophChordAssociation | SophChordAssociationWithUnresolvedPhonemes], i: int):
+            """Determines whether the chord at the given index is an alt chord even though one of its main chords could
+            have been used between its neighbors."""
+
+            association = associations[i]
+
+            masks = main_chord_masks_by_alt_chord.get((association.sophs, association.chord))
+            if masks is None:
+                return False
 
-            for i, (sophs, chord, begins_new_stroke, phonemes, transitions) in enumerate(result.sophs_and_chords_used):
-                if sophs not in sophs_to_alternate_chords: continue
-                if chord not in sophs_to_alternate_chords[sophs]: continue
 
+            if i == 0 or association.chord_starts_new_stroke:
+                preceding_chord = None
+            else:
+                preceding_chord = associations[i - 1].chord
 
-                if i == 0 or begins_new_stroke:
-                    preceding_chord = Stroke.from_integer(0)
-                else:
-                    preceding_chord = result.sophs_and_chords_used[i - 1].chord
+            if i == len(associations) - 1 or associations[i + 1].chord_starts_new_stroke:
+                following_chord = None
+            else:
+                following_chord = associations[i + 1].chord
 
-                if i == len(result.sophs_and_chords_used) - 1 or result.sophs_and_chords_used[i + 1].chord_starts_new_stroke:
-                    following_chord = Stroke.from_integer(0)
-                else:
-                    following_chord = result.sophs_and_chords_used[i + 1].chord
 
+            return masks.any_usable_between(preceding_chord, following_chord)
+
+
+        @soph_trie_api.validate_path_extension.listen(alt_chords)
+        def _(associations: tuple[SophChordAssociationWithUnresolvedPhonemes, ...], **_):
+            # Once a chord has a chord after it, everything needed to validate it is known, so paths that take an alt
+            # chord needlessly can be dropped before they are extended any further
+            if len(associations) < 2:
+                return True
+
+            return not uses_alt_chord_needlessly(associations, len(associations) - 2)
+
+
+        @soph_trie_api.validate_lookup_result.listen(alt_chords)
+        def _(result: LookupResultWithAssociations, **_):
+            # Return true iff, for every alt chord path taken, all of the main chords were unusable. Every chord but the
+            # last was already checked as its path was extended
 
-                for main_chord in sophs_to_main_chords.get(sophs, ()):
-                    if not floating_keys_api.can_add_stroke_on(preceding_chord, main_chord):
-                        continue
-                    if not floating_keys_api.can_add_stroke_on(main_chord, following_chord):
-                        continue
+            if len(result.sophs_and_chords_used) == 0:
+                return True
 
-                    return False
-                
-            return True
+            return not uses_alt_chord_needlessly(result.sophs_and_chords_used, len(result.sophs_and_chords_used) - 1)
 
 
         return None
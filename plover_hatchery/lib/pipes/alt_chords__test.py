@@ -0,0 +1,27 @@
+from plover.steno import Stroke
+
+from .alt_chords import MainChordMasks
+from .floating_keys import FloatingKeysApi
+
+
+_FLOATING_KEYS_API = FloatingKeysApi(Stroke.from_steno("*"))
+
+
+def test__main_chord_masks__floater_only_main_chord_is_usable_between_any_chords():
+    masks = MainChordMasks.build([Stroke.from_steno("-T"), Stroke.from_steno("*")], _FLOATING_KEYS_API)
+
+    # `-T` cannot fit between `-P` and `-L`, but `*` fits between any two chords
+    assert masks.any_usable_between(Stroke.from_steno("-P"), Stroke.from_steno("-L"))
+    assert masks.any_usable_between(Stroke.from_steno("-S"), Stroke.from_steno("-D"))
+    assert masks.any_usable_between(Stroke.from_steno("-Z"), None)
+    assert masks.any_usable_between(None, Stroke.from_steno("S"))
+
+
+def test__main_chord_masks__chords_out_of_order_are_unusable():
+    masks = MainChordMasks.build([Stroke.from_steno("-T")], _FLOATING_KEYS_API)
+
+    assert masks.any_usable_between(Stroke.from_steno("-P"), Stroke.from_steno("-S"))
+    assert not masks.any_usable_between(Stroke.from_steno("-P"), Stroke.from_steno("-L"))
+    assert not masks.any_usable_between(Stroke.from_steno("-S"), Stroke.from_steno("-D"))
+    assert not masks.any_usable_between(Stroke.from_steno("-Z"), None)
+    assert not masks.any_usable_between(None, Stroke.from_steno("-P"))
@@ -1,14 +1,14 @@
 from dataclasses import dataclass
-from plover.steno import Stroke
 from plover_hatchery.lib.pipes import soph_trie
 from plover_hatchery.lib.pipes.Plugin import GetPluginApi, Plugin, define_plugin
+from plover_hatchery.lib.pipes.stroke_masks import StrokeMask, contains_all, parse_stroke_mask
 
 
 def amphitheory_outlines() -> Plugin[None]:
-    linker_chord = Stroke.from_steno("^")
-    capital_chord = Stroke.from_steno("#")
+    linker_chord = parse_stroke_mask("^")
+    capital_chord = parse_stroke_mask("#")
 
-    modifiers_stroke = linker_chord + capital_chord
+    modifiers_stroke = linker_chord | capital_chord
 
     @define_plugin(amphitheory_outlines)
     def plugin(get_plugin_api: GetPluginApi, **_):
@@ -27,7 +27,7 @@ def amphitheory_outlines() -> Plugin[None]:
 
 
         @soph_trie_api.process_outline.listen(amphitheory_outlines)
-        def _(state: AmphitheoryOutlinesState, outline: tuple[Stroke, ...], **_):
+        def _(state: AmphitheoryOutlinesState, outline: tuple[StrokeMask, ...], **_):
             # The empty outline is not allowed
             if len(outline) == 0:
                 return None
@@ -35,24 +35,29 @@ def amphitheory_outlines() -> Plugin[None]:
 
             for i, stroke in enumerate(outline):
                 # Strokes that are only modifiers are not allowed
-                if stroke in modifiers_stroke:
+                if contains_all(modifiers_stroke, stroke):
                     return None
 
                 # All strokes after the first must contain the linker chord
                 if i == 0: continue
 
-                if linker_chord not in stroke:
+                if not contains_all(stroke, linker_chord):
                     return None
 
             
-            if linker_chord in outline[0]:
+            if contains_all(outline[0], linker_chord):
                 state.link = True
 
-            if capital_chord in outline[0]:
+            if contains_all(outline[0], capital_chord):
                 state.capital = True
                 
 
-            return tuple(stroke - linker_chord - capital_chord for stroke in outline)
+            return tuple(stroke & ~modifiers_stroke for stroke in outline)
+
+
+        @soph_trie_api.unprocess_outline.listen(amphitheory_outlines)
+        def _(outline: tuple[StrokeMask, ...], **_):
+            return tuple(stroke if i == 0 else stroke | linker_chord for i, stroke in enumerate(outline))
 
 
         @soph_trie_api.modify_translation.listen(amphitheory_outlines)
@@ -1,27 +1,34 @@
 import timeit
 
 from collections import defaultdict
-from collections.abc import Iterable, Generator
+from collections.abc import Iterable, Generator, Sequence
+from functools import lru_cache
+from threading import Lock
 from typing import cast, TypeVar, Any, Protocol, Callable, final
 
 from plover_hatchery.lib.sopheme import parse_entry_definition
 
-from plover_hatchery_lib_rs import Def, DefView, DefDict, Entity
+from plover_hatchery_lib_rs import Def, DefView, DefDict, Entity, SubtrieQuery
 
 from .Hook import Hook
 from .Plugin import Plugin
-from .Theory import Theory, TheoryLookup
+from .SpilledStrList import SpilledStrList
+from .Theory import OutlineWithCost, Theory, TheoryLookup
 
 
 T = TypeVar("T")
 
 
+MAX_LONGEST_KEY = 12
+"""The number of strokes Plover may look up at once when no plugin can bound the length of an outline"""
+
+
 @final
 class TheoryHooks:
     class BeginBuildLookup(Protocol):
         def __call__(self) -> None: ...
     class CompleteBuildLookup(Protocol):
-        def __call__(self) -> None: ...
+        def __call__(self, *, rehydrate_view: Callable[[int], DefView]) -> None: ...
     class ProcessDef(Protocol):
         def __call__(self, *, view: DefView) -> Def: ...
     class AddEntry(Protocol):
@@ -30,10 +37,23 @@ class TheoryHooks:
         def __call__(self, *, stroke_stenos: tuple[str, ...], translations: list[str]) -> str | None: ...
     class ReverseLookup(Protocol):
         def __call__(self, *, translation: str, reverse_translations: dict[str, list[int]]) -> Iterable[tuple[str, ...]]: ...
+    class ReverseLookupWithCosts(Protocol):
+        def __call__(
+            self,
+            *,
+            translation: str,
+            max_cost: float | None,
+            max_outlines: int | None,
+            reverse_translations: dict[str, list[int]],
+        ) -> Iterable[OutlineWithCost]: ...
     class BreakdownTranslation(Protocol):
-        def __call__(self, *, translation: str, entries: list[str], reverse_translations: dict[str, list[int]]) -> str | None: ...
+        def __call__(self, *, translation: str, query: SubtrieQuery, entries: Sequence[str], reverse_translations: dict[str, list[int]]) -> str | None: ...
     class BreakdownLookup(Protocol):
         def __call__(self, *, stroke_stenos: tuple[str, ...], translations: list[str]) -> str | None: ...
+    class BreakdownLookupStream(Protocol):
+        def __call__(self, *, stroke_stenos: tuple[str, ...], translations: list[str]) -> Iterable[str] | None: ...
+    class LongestKey(Protocol):
+        def __call__(self) -> int | None: ...
 
     begin_build_lookup = Hook(BeginBuildLookup)
     complete_build_lookup = Hook(CompleteBuildLookup)
@@ -41,12 +61,47 @@ class TheoryHooks:
     add_entry = Hook(AddEntry)
     lookup = Hook(Lookup)
     reverse_lookup = Hook(ReverseLookup)
+    reverse_lookup_with_costs = Hook(ReverseLookupWithCosts)
     breakdown_translation = Hook(BreakdownTranslation)
     breakdown_lookup = Hook(BreakdownLookup)
+    breakdown_lookup_stream = Hook(BreakdownLookupStream)
+    longest_key = Hook(LongestKey)
+
+
+def _transcluded_varnames(entities: Iterable[Entity]) -> Generator[str, None, None]:
+    for entity in entities:
+        match entity:
+            case Entity.Transclusion(transclusion):
+                yield transclusion.target_varname
+            case Entity.RawDef(definition):
+                yield from _transcluded_varnames(definition.entities)
+            case _:
+                pass
 
 
 def compile_theory(
     plugin_generator: Callable[[], Generator[Plugin[Any], Any, None]],
+):
+    """Creates a theory from the plugins yielded by `plugin_generator`. The plugins are only initialized when the first
+    lookup is built, so importing a theory preset does not pay for theories that are never used."""
+
+    initialized_theory: Theory | None = None
+    initialize_lock = Lock()
+
+    def build_lookup(*, entry_lines: Iterable[tuple[str, str]], filename: str=""):
+        nonlocal initialized_theory
+
+        with initialize_lock:
+            if initialized_theory is None:
+                initialized_theory = initialize_theory(plugin_generator)
+
+        return initialized_theory.build_lookup(entry_lines=entry_lines, filename=filename)
+
+    return Theory(build_lookup=build_lookup)
+
+
+def initialize_theory(
+    plugin_generator: Callable[[], Generator[Plugin[Any], Any, None]],
 ):
     from plover_hatchery.Store import store
 
@@ -101,6 +156,11 @@ def compile_theory(
 
         defs = DefDict()
 
+        # The source of every parsed definition is kept on disk so that the `DefDict` can be dropped once the build
+        # completes and only rebuilt when a breakdown or debug tool asks for an entry's view again
+        def_varnames = SpilledStrList()
+        def_strs = SpilledStrList()
+
         def populate_dict():
             nonlocal n_entries, n_passed_parses
 
@@ -110,6 +170,8 @@ def compile_theory(
 
                 try:
                     defs.add(varname, list(parse_entry_definition(definition_str.strip())))
+                    def_varnames.append(varname)
+                    def_strs.append(definition_str.strip())
                     n_passed_parses += 1
                 except ValueError as e:
                     # import traceback
@@ -127,7 +189,8 @@ def compile_theory(
     \x1b[32mTook {duration} s""")
 
 
-        defs_list: list[str] = []
+        defs_list = SpilledStrList()
+        entry_varnames = SpilledStrList()
 
         def add_entries():
             nonlocal n_addable_entries, n_passed_additions
@@ -147,10 +210,11 @@ def compile_theory(
                 i += 1
 
                 translations.append("")
-                defs_list.append("")
+                entry_varnames.append(varname)
 
                 n_addable_entries += 1
 
+                def_str = ""
                 try:
                     entry_id = len(translations) - 1
 
@@ -161,7 +225,7 @@ def compile_theory(
 
                     translation = view.translation()
                     translations[-1] = translation
-                    defs_list[-1] = str(def_item)
+                    def_str = str(def_item)
                     reverse_translations[translation].append(entry_id)
 
                     n_passed_additions += 1
@@ -170,6 +234,8 @@ def compile_theory(
                     # print(f"failed to add {varname}: {e} ({''.join(traceback.format_tb(e.__traceback__))})")
                     pass
 
+                defs_list.append(def_str)
+
 
         print("\x1b[35m")
         duration = timeit.timeit(add_entries, number=1)
@@ -180,8 +246,59 @@ def compile_theory(
 
         print("\x1b[0m")
 
+
+        # Nothing holds onto the `DefDict` past this point; views are rebuilt from the spilled definitions on demand
+        del defs
+
+        def_indices_by_varname: dict[str, int] | None = None
+        def_indices_lock = Lock()
+
+        def get_def_indices_by_varname():
+            nonlocal def_indices_by_varname
+
+            with def_indices_lock:
+                if def_indices_by_varname is None:
+                    def_indices_by_varname = {varname: i for i, varname in enumerate(def_varnames)}
+
+                return def_indices_by_varname
+
+        def rehydrate_defs(varname: str):
+            """Rebuilds a `DefDict` with only the definition of `varname` and the definitions it transcludes, so that
+            each cached view keeps only the definitions it needs alive"""
+
+            def_indices = get_def_indices_by_varname()
+
+            new_defs = DefDict()
+            added_varnames: set[str] = set()
+            pending_varnames = [varname]
+
+            while len(pending_varnames) > 0:
+                next_varname = pending_varnames.pop()
+                if next_varname in added_varnames: continue
+                added_varnames.add(next_varname)
+
+                def_index = def_indices.get(next_varname)
+                if def_index is None: continue
+
+                entities = list(parse_entry_definition(def_strs[def_index]))
+                new_defs.add(next_varname, entities)
+                pending_varnames.extend(_transcluded_varnames(entities))
+
+            return new_defs
+
+        @lru_cache(maxsize=256)
+        def rehydrate_view(entry_id: int):
+            varname = entry_varnames[entry_id]
+            defs = rehydrate_defs(varname)
+            return process_def(DefView(defs, defs.get_def(varname)))
+
+
         for plugin_id, handler in hooks.complete_build_lookup.ids_handlers():
-            handler()
+            handler(rehydrate_view=rehydrate_view)
+
+
+        longest_key = get_longest_key()
+        print(f"\x1b[36mLooking up outlines of up to {longest_key} strokes\x1b[0m")
             
 
         def true_lookup(stroke_stenos: tuple[str, ...]):
@@ -190,13 +307,27 @@ def compile_theory(
         def true_reverse_lookup(translation: str):
             return reverse_lookup(states, translation, reverse_translations)
 
-        def true_breakdown_translation(translation: str):
-            return breakdown_translation(states, translation, defs_list, reverse_translations)
+        def true_reverse_lookup_with_costs(translation: str, max_cost: float | None=None, max_outlines: int | None=None):
+            return reverse_lookup_with_costs(states, translation, max_cost, max_outlines, reverse_translations)
+
+        def true_breakdown_translation(translation: str, query: SubtrieQuery):
+            return breakdown_translation(states, translation, query, defs_list, reverse_translations)
 
         def true_breakdown_lookup(stroke_stenos: tuple[str, ...], translations: list[str]):
             return breakdown_lookup(states, stroke_stenos, translations)
 
-        return TheoryLookup(true_lookup, true_reverse_lookup, true_breakdown_translation, true_breakdown_lookup)
+        def true_breakdown_lookup_stream(stroke_stenos: tuple[str, ...], translations: list[str]):
+            return breakdown_lookup_stream(states, stroke_stenos, translations)
+
+        return TheoryLookup(
+            true_lookup,
+            true_reverse_lookup,
+            true_reverse_lookup_with_costs,
+            true_breakdown_translation,
+            true_breakdown_lookup,
+            true_breakdown_lookup_stream,
+            longest_key,
+        )
         
 
     def process_def(view: DefView):
@@ -230,14 +361,52 @@ def compile_theory(
         return results
 
 
-    def breakdown_translation(states: dict[int, Any], translation: str, entries: list[str], reverse_translations: dict[str, list[int]]) -> str | None:
+    def reverse_lookup_with_costs(
+        states: dict[int, Any],
+        translation: str,
+        max_cost: float | None,
+        max_outlines: int | None,
+        reverse_translations: dict[str, list[int]],
+    ) -> list[OutlineWithCost]:
+        min_costs: dict[tuple[str, ...], float] = {}
+
+        for plugin_id, handler in hooks.reverse_lookup_with_costs.ids_handlers():
+            for outline, cost in handler(
+                translation=translation,
+                max_cost=max_cost,
+                max_outlines=max_outlines,
+                reverse_translations=reverse_translations,
+            ):
+                if cost < min_costs.get(outline, float("inf")):
+                    min_costs[outline] = cost
+
+        results = sorted((OutlineWithCost(outline, cost) for outline, cost in min_costs.items()), key=lambda result: result.cost)
+        return results if max_outlines is None else results[:max_outlines]
+
+
+    def breakdown_translation(states: dict[int, Any], translation: str, query: SubtrieQuery, entries: Sequence[str], reverse_translations: dict[str, list[int]]) -> str | None:
         for plugin_id, handler in hooks.breakdown_translation.ids_handlers():
-            result = handler(translation=translation, entries=entries, reverse_translations=reverse_translations)
+            result = handler(translation=translation, query=query, entries=entries, reverse_translations=reverse_translations)
             if result is not None:
                 return result
         
         return None
 
+    def get_longest_key():
+        longest_key = 0
+
+        for plugin_id, handler in hooks.longest_key.ids_handlers():
+            result = handler()
+            if result is None:
+                return MAX_LONGEST_KEY
+
+            longest_key = max(longest_key, result)
+
+        if len(hooks.longest_key.handlers()) == 0:
+            return MAX_LONGEST_KEY
+
+        return longest_key
+
     def breakdown_lookup(states: dict[int, Any], stroke_stenos: tuple[str, ...], translations: list[str]) -> str | None:
         for plugin_id, handler in hooks.breakdown_lookup.ids_handlers():
             result = handler(stroke_stenos=stroke_stenos, translations=translations)
@@ -246,6 +415,14 @@ def compile_theory(
         
         return None
 
+    def breakdown_lookup_stream(states: dict[int, Any], stroke_stenos: tuple[str, ...], translations: list[str]) -> Iterable[str] | None:
+        for plugin_id, handler in hooks.breakdown_lookup_stream.ids_handlers():
+            result = handler(stroke_stenos=stroke_stenos, translations=translations)
+            if result is not None:
+                return result
+        
+        return None
+
 
     return Theory(
         build_lookup=build_lookup,
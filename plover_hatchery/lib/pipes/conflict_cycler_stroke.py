@@ -2,14 +2,19 @@ from typing import Any
 
 
 from dataclasses import dataclass
-from plover.steno import Stroke
 
 from plover_hatchery.lib.pipes.Plugin import GetPluginApi, Plugin, define_plugin
 from plover_hatchery.lib.pipes.soph_trie import LookupResultWithAssociations, soph_trie
+from plover_hatchery.lib.pipes.stroke_masks import StrokeMask, parse_stroke_mask
 
 
-def conflict_cycler_stroke(steno: str) -> Plugin[None]:
-    cycler_stroke = Stroke.from_steno(steno)
+def conflict_cycler_stroke(steno: str, *, max_presses: int=3) -> Plugin[None]:
+    """Cycles through the translations of an outline, cheapest first, each time `steno` is stroked after it.
+
+    Plover looks up at least `max_presses` presses after even the longest outline; shorter outlines can be cycled further.
+    """
+
+    cycler_stroke = parse_stroke_mask(steno)
 
     @define_plugin(conflict_cycler_stroke)
     def plugin(get_plugin_api: GetPluginApi, **_):
@@ -27,7 +32,7 @@ def conflict_cycler_stroke(steno: str) -> Plugin[None]:
 
 
         @soph_trie_api.process_outline.listen(conflict_cycler_stroke)
-        def _(state: ConflictCyclerStrokeState, outline: tuple[Stroke, ...], **_):
+        def _(state: ConflictCyclerStrokeState, outline: tuple[StrokeMask, ...], **_):
             index_of_first_cycler_stroke = 0
 
             for i in range(len(outline) - 1, -1, -1):
@@ -42,6 +47,11 @@ def conflict_cycler_stroke(steno: str) -> Plugin[None]:
 
             return outline[:index_of_first_cycler_stroke]
 
+
+        @soph_trie_api.extra_lookup_strokes.listen(conflict_cycler_stroke)
+        def _(**_):
+            return max_presses
+
         
         @soph_trie_api.select_translation.listen(conflict_cycler_stroke)
         def _(
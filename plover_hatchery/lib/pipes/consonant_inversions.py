@@ -1,4 +1,5 @@
 import itertools
+from collections.abc import Iterable
 from typing import Any, Generator
 
 
@@ -8,6 +9,7 @@ from plover.steno import Stroke
 from plover_hatchery_lib_rs import DefViewCursor, DefViewItem
 from plover_hatchery.lib.pipes.Plugin import define_plugin, GetPluginApi
 from plover_hatchery.lib.pipes.soph_trie import ChordToSophSearchResult, ChordToSophSearchResultWithSrcIndex, LookupResultWithAssociations, SophChordAssociation, SophsToTranslationSearchPath, soph_trie
+from plover_hatchery.lib.pipes.stroke_masks import StrokeMask
 from plover_hatchery_lib_rs import Soph, TransitionFlagManager
 from plover_hatchery.lib.trie import NondeterministicTrie, TransitionSourceNode, JoinedTriePaths, TransitionFlag, TransitionCostKey
 
@@ -21,6 +23,10 @@ def consonant_inversions(*, consonant_sophs_str: str, inversion_domains_steno: s
         )
     )
 
+    # Every soph in an inversion is written with at least one key from the same domain, so no inversion can span more
+    # consonants than the widest domain has keys
+    max_inversion_length = max((len(domain.keys()) for domain in inversion_domains), default=0)
+
     @define_plugin(consonant_inversions)
     def plugin(get_plugin_api: GetPluginApi, **_):
         soph_trie_api = get_plugin_api(soph_trie)
@@ -45,29 +51,60 @@ def consonant_inversions(*, consonant_sophs_str: str, inversion_domains_steno: s
             return ConsonantInversionsAddEntryState()
 
 
-        def create_inversion_soph(sophs: "tuple[Soph, ...]"):
-            sorted_sophs = sorted(sophs, key=lambda soph: soph.value)
-            return Soph(f"inversion:{' '.join(soph.value for soph in sorted_sophs)}")
+        def create_inversion_soph(soph_values: Iterable[str]):
+            return Soph(f"inversion:{' '.join(sorted(soph_values))}")
 
-        def get_inversion_sophs(past_consonants: list[PastConsonant]):
-            def get_product_choices():
-                for consonant in past_consonants:
-                    keysymbol = consonant.cursor.tip().keysymbol()
 
-                    if keysymbol.optional:
-                        yield (*consonant.sophs, None)
+        # The soph choices and optionality of each consonant in a cluster, which fully determine its inversions
+        ClusterSignature = tuple[tuple[tuple[str, ...], bool], ...]
+
+        def get_cluster_signature(past_consonants: "list[PastConsonant]") -> ClusterSignature:
+            return tuple(
+                (
+                    tuple(sorted(set(soph.value for soph in consonant.sophs))),
+                    consonant.cursor.tip().keysymbol().optional,
+                )
+                for consonant in past_consonants
+            )
+
+        def get_inversion_soph_values(signature: ClusterSignature):
+            def get_product_choices():
+                for soph_values, optional in signature:
+                    if optional:
+                        yield (*soph_values, None)
                     else:
-                        yield consonant.sophs
+                        yield soph_values
 
+            # Different orderings of the same sophs produce the same inversion, so only the sorted multisets are kept
+            multisets: dict[tuple[str, ...], None] = {}
             for combo in itertools.product(*get_product_choices()):
-                non_null_sophs = tuple(
-                    soph
-                    for soph in combo
-                    if soph is not None
+                non_null_soph_values = tuple(sorted(
+                    soph_value
+                    for soph_value in combo
+                    if soph_value is not None
+                ))
+                if not 1 < len(non_null_soph_values) <= max_inversion_length: continue
+
+                multisets[non_null_soph_values] = None
+
+            return tuple(multisets)
+
+
+        inversion_key_ids_by_signature: dict[ClusterSignature, tuple[int, ...]] = {}
+
+        def get_inversion_key_ids(past_consonants: "list[PastConsonant]"):
+            signature = get_cluster_signature(past_consonants)
+
+            key_ids = inversion_key_ids_by_signature.get(signature)
+            if key_ids is None:
+                inversion_sophs = tuple(
+                    create_inversion_soph(soph_values)
+                    for soph_values in get_inversion_soph_values(signature)
                 )
-                if len(non_null_sophs) <= 1: continue
+                key_ids = soph_trie_api.key_id_manager.get_key_ids_else_create(inversion_sophs)
+                inversion_key_ids_by_signature[signature] = key_ids
 
-                yield create_inversion_soph(non_null_sophs)
+            return key_ids
 
 
         @soph_trie_api.add_soph_transition.listen(consonant_inversions)
@@ -102,25 +139,38 @@ def consonant_inversions(*, consonant_sophs_str: str, inversion_domains_steno: s
 
             state.past_consonants.append(PastConsonant(node_srcs, current_consonant_sophs, cursor))
 
+            # Consonants further back than the longest possible inversion can never be part of one again. Optional
+            # consonants can be left out of an inversion, so only the others count toward its length
+            n_required_consonants = 0
+            for i in reversed(range(len(state.past_consonants))):
+                if state.past_consonants[i].cursor.tip().keysymbol().optional: continue
+
+                n_required_consonants += 1
+                if n_required_consonants > max_inversion_length:
+                    del state.past_consonants[:i + 1]
+                    break
+
             if paths.dst_node_id is not None:
                 for i, consonant in enumerate(state.past_consonants[:-1]):
-                    inversion_sophs = get_inversion_sophs(state.past_consonants[i:])
+                    key_ids = get_inversion_key_ids(state.past_consonants[i:])
+                    if len(key_ids) == 0: continue
+
                     new_paths = trie.link_join(
                         tuple(TransitionSourceNode.increment_costs(consonant.node_srcs, 50)),
                         paths.dst_node_id,
-                        soph_trie_api.key_id_manager.get_key_ids_else_create(inversion_sophs),
+                        key_ids,
                         entry_id
                     )
 
-                    for transition_seq in new_paths.transition_seqs:
-                        for transition in transition_seq.transitions:
-                            soph_trie_api.transition_flags.flag_transition(TransitionCostKey(transition, entry_id), inversion_flag)
+                    trie.flag_joined_paths(new_paths, entry_id, inversion_flag)
+
 
 
 
+        inversion_domain_masks = tuple(int(domain) for domain in inversion_domains)
 
-        def get_inversion_domain_of_stroke(stroke: Stroke):
-            domains = tuple(filter(lambda domain: len(domain & stroke) > 0, inversion_domains))
+        def get_inversion_domain_of_key(key: StrokeMask):
+            domains = tuple(domain for domain in inversion_domain_masks if domain & key != 0)
 
             if len(domains) != 1:
                 return None
@@ -128,23 +178,29 @@ def consonant_inversions(*, consonant_sophs_str: str, inversion_domains_steno: s
             return domains[0]
 
 
+        # A sorted multiset of soph values, paired with the union of the chords that spell them
+        PartialInversion = tuple[tuple[str, ...], Stroke]
+
         @dataclass
         class ConsonantInversionsLookupState:
-            current_domain: Stroke | None = None
-            sophs_in_current_domain: list[tuple[ChordToSophSearchResultWithSrcIndex, ...]] = field(default_factory=list)
+            current_domain: StrokeMask | None = None
             first_key_index_in_current_domain: int = -1
+            partial_inversions_ending_at: list[dict[PartialInversion, None]] = field(default_factory=list)
+            """For each key consumed in the current domain, the inversions that could end on that key. Each inversion is
+            a run of single-soph chords that starts at the first key of the domain"""
 
-            def paths_ending_with(self, result: ChordToSophSearchResultWithSrcIndex, current_chain: tuple[ChordToSophSearchResultWithSrcIndex, ...]=()) -> Generator[tuple[ChordToSophSearchResultWithSrcIndex, ...], None, None]:
-                if result.chord_start_key_index < self.first_key_index_in_current_domain:
-                    return
-
-                if result.chord_start_key_index == self.first_key_index_in_current_domain:
-                    yield (result, *current_chain)
+            def reset(self, domain: StrokeMask | None, first_key_index: int):
+                self.current_domain = domain
+                self.first_key_index_in_current_domain = first_key_index
+                self.partial_inversions_ending_at = []
 
-                for old_result in self.sophs_in_current_domain[result.chord_start_key_index - self.first_key_index_in_current_domain]:
-                    if old_result in current_chain or old_result == result: continue
-
-                    yield from self.paths_ending_with(old_result, (result, *current_chain))
+            def partial_inversions_before(self, key_index: int) -> Iterable[PartialInversion]:
+                offset = key_index - self.first_key_index_in_current_domain
+                if offset < 0:
+                    return ()
+                if offset == 0:
+                    return (((), Stroke.from_integer(0)),)
+                return self.partial_inversions_ending_at[offset - 1]
 
 
         @soph_trie_api.begin_lookup.listen(consonant_inversions)
@@ -153,42 +209,43 @@ def consonant_inversions(*, consonant_sophs_str: str, inversion_domains_steno: s
 
 
         @soph_trie_api.consume_key.listen(consonant_inversions)
-        def _(state: ConsonantInversionsLookupState, key: str, key_index: int, is_new_stroke: bool, results: tuple[ChordToSophSearchResultWithSrcIndex, ...], **_):
-            inversion_domain = get_inversion_domain_of_stroke(Stroke.from_keys((key,)))
+        def _(state: ConsonantInversionsLookupState, key: StrokeMask, key_index: int, is_new_stroke: bool, results: tuple[ChordToSophSearchResultWithSrcIndex, ...], **_):
+            inversion_domain = get_inversion_domain_of_key(key)
             if inversion_domain is None:
                 # Nullify the state's inversion domain
-                state.current_domain = None
-                state.sophs_in_current_domain = []
-                state.first_key_index_in_current_domain = -1
+                state.reset(None, -1)
                 return
 
             if state.current_domain is None or is_new_stroke or inversion_domain != state.current_domain:
                 # Set the current inversion domain to the new one
-                state.current_domain = inversion_domain
-                state.sophs_in_current_domain = [()]
-                state.first_key_index_in_current_domain = key_index
-            
-            state.sophs_in_current_domain.append(results)
+                state.reset(inversion_domain, key_index)
 
+            # Extend the inversions that ended right before each result's chord with the result's soph. Each key only
+            # looks back at the inversions recorded for one earlier key, so the work per key is bounded by the number of
+            # distinct soph multisets rather than the number of chains of chords
+            partial_inversions: dict[PartialInversion, None] = {}
             for result in results:
-                for results_chain in state.paths_ending_with(result):
-                    if len(results_chain) == 1: continue
+                if len(result.soph_result.sophs) != 1: continue # TODO handle clusters
 
-                    
-                    if any(len(chain_result.soph_result.sophs) != 1 for chain_result in results_chain):
-                        continue # TODO handle clusters
+                soph_value = result.soph_result.sophs[0].value
 
-                    sophs = tuple(chain_result.soph_result.sophs[0] for chain_result in results_chain)
+                for soph_values, chord in state.partial_inversions_before(result.chord_start_key_index):
+                    if len(soph_values) >= max_inversion_length: continue
 
-                    chord = sum((chain_result.soph_result.chord for chain_result in results_chain), Stroke.from_integer(0))
+                    partial_inversions[tuple(sorted((*soph_values, soph_value))), chord + result.soph_result.chord] = None
 
-                    yield ChordToSophSearchResultWithSrcIndex(
-                        ChordToSophSearchResult(
-                            (create_inversion_soph(sophs),),
-                            chord,
-                        ),
-                        results_chain[0].chord_start_key_index,
-                    )
+            state.partial_inversions_ending_at.append(partial_inversions)
+
+            for soph_values, chord in partial_inversions:
+                if len(soph_values) <= 1: continue
+
+                yield ChordToSophSearchResultWithSrcIndex(
+                    ChordToSophSearchResult(
+                        (create_inversion_soph(soph_values),),
+                        chord,
+                    ),
+                    state.first_key_index_in_current_domain,
+                )
 
         return None
 
@@ -0,0 +1,82 @@
+from functools import cache
+
+from plover_hatchery_lib_rs import DefViewCursor, DefViewItem
+
+from .compile_theory import compile_theory
+from .consonant_inversions import consonant_inversions
+from .floating_keys import floating_keys
+from .soph_trie import soph_trie
+
+
+def _map_to_sophs(cursor: DefViewCursor):
+    match cursor.tip():
+        case DefViewItem.Keysymbol(keysymbol):
+            return {keysymbol.base_symbol.upper()}
+
+        case _:
+            return set()
+
+
+@compile_theory
+def _theory():
+    yield floating_keys("*")
+
+    yield soph_trie(
+        map_to_sophs=_map_to_sophs,
+        sophs_to_chords_dicts=({
+            "P": "-P",
+            "B": "-B",
+            "L": "-L",
+            "G": "-G",
+            "K": "-BG",
+            "T": "-T",
+            "A": "A",
+            "O": "O",
+            "E": "E",
+        },),
+    )
+
+    # `-PBLG` has four keys, so no inversion can span more than four consonants
+    yield consonant_inversions(
+        consonant_sophs_str="P B L G K T",
+        inversion_domains_steno="-PBLG",
+    )
+
+
+@cache
+def _lookup():
+    return _theory.build_lookup(entry_lines=(
+        ("akp", "a.a!1 k.k p.p"),
+        ("aglbp", "a.a!1 g.g l.l b.b p.p"),
+        ("eglbtp", "e.e!1 g.g l.l b.b t.t? p.p"),
+        ("obl", "o.o!1 b.b l.l"),
+    ))
+
+
+def test__consonant_inversions__inversion_spread_across_chords():
+    lookup = _lookup()
+
+    # `-BG` is one chord for `k`, which is written after `-P` despite being said before it
+    assert lookup.lookup(("A-BG", "-P")) == "akp"
+    assert lookup.lookup(("A-PBG",)) == "akp"
+
+
+def test__consonant_inversions__cluster_at_max_inversion_length():
+    lookup = _lookup()
+
+    # All four consonants are written in the reverse of the order they are said in
+    assert lookup.lookup(("A-PBLG",)) == "aglbp"
+
+
+def test__consonant_inversions__optional_consonant_does_not_count_toward_window():
+    lookup = _lookup()
+
+    # The optional `t` makes five consonants, but leaving it out leaves four, which still fit in one inversion
+    assert lookup.lookup(("E-PBLG",)) == "eglbtp"
+
+
+def test__consonant_inversions__consonants_in_order_are_not_inverted():
+    lookup = _lookup()
+
+    assert lookup.lookup(("O-BL",)) == "obl"
+    assert lookup.lookup(("O-B", "-L")) == "obl"
@@ -5,15 +5,15 @@ from typing import Any
 
 from collections.abc import Iterable
 from dataclasses import dataclass
-from plover.steno import Stroke
 
 from plover_hatchery.lib.pipes.Plugin import GetPluginApi, Plugin, define_plugin
 from plover_hatchery.lib.pipes.soph_trie import LookupResultWithAssociations, SophChordAssociation, soph_trie
+from plover_hatchery.lib.pipes.stroke_masks import StrokeMask, parse_stroke_mask
 from plover_hatchery.lib.trie import NondeterministicTrie, TransitionKey
 
 
 def debug_stroke(steno: str) -> Plugin[None]:
-    stroke = Stroke.from_steno(steno)
+    stroke = parse_stroke_mask(steno)
 
     @define_plugin(debug_stroke)
     def plugin(get_plugin_api: GetPluginApi, **_):
@@ -31,7 +31,7 @@ def debug_stroke(steno: str) -> Plugin[None]:
 
 
         @soph_trie_api.process_outline.listen(debug_stroke)
-        def _(state: DebugStrokeState, outline: tuple[Stroke, ...], **_):
+        def _(state: DebugStrokeState, outline: tuple[StrokeMask, ...], **_):
             if outline[-1] == stroke:
                 state.should_debug = True
                 return outline[:-1]
@@ -39,6 +39,11 @@ def debug_stroke(steno: str) -> Plugin[None]:
             return outline
 
 
+        @soph_trie_api.extra_lookup_strokes.listen(debug_stroke)
+        def _(**_):
+            return 1
+
+
         def join_all_translations(trie: NondeterministicTrie, results: Iterable[LookupResultWithAssociations], translations: list[str]):
             return "\n".join(summarize_result(trie, result, translations) for result in results)
 
@@ -13,18 +13,29 @@ class FloatingKeysApi:
     floaters: Stroke
 
     def can_add_stroke_on(self, src_stroke: Stroke, addon_stroke: Stroke) -> bool:
-        src_without_floaters = self.without_floaters(src_stroke)
-        if len(src_without_floaters) == 0:
+        src_bounds = self.key_index_bounds(src_stroke)
+        if src_bounds is None:
             return True
 
-        addon_without_floaters = self.without_floaters(addon_stroke)
-        if len(addon_without_floaters) == 0:
+        addon_bounds = self.key_index_bounds(addon_stroke)
+        if addon_bounds is None:
             return True
 
-        last_key_of_src = Stroke.from_keys(((src_without_floaters).keys()[-1],))
-        first_key_of_addon = Stroke.from_keys(((addon_without_floaters).keys()[0],))
+        _, last_key_index_of_src = src_bounds
+        first_key_index_of_addon, _ = addon_bounds
 
-        return last_key_of_src < first_key_of_addon
+        return last_key_index_of_src < first_key_index_of_addon
+
+
+    def key_index_bounds(self, stroke: Stroke) -> tuple[int, int] | None:
+        """Gets the steno-order indices of the first and last non-floater keys in a stroke, or None if the stroke only
+        contains floaters."""
+
+        mask = int(stroke) & ~int(self.floaters)
+        if mask == 0:
+            return None
+
+        return (mask & -mask).bit_length() - 1, mask.bit_length() - 1
 
 
     def without_floaters(self, stroke: Stroke):
@@ -1,12 +1,12 @@
 from typing import Any
 
-from plover.steno import Stroke
 from plover_hatchery.lib.pipes.Plugin import GetPluginApi, Plugin, define_plugin
 from plover_hatchery.lib.pipes.soph_trie import soph_trie
+from plover_hatchery.lib.pipes.stroke_masks import StrokeMask, parse_stroke_mask
 
 
 def prohibited_strokes(stenos: str) -> Plugin[None]:
-    strokes = set(Stroke.from_steno(steno) for steno in stenos)
+    strokes = set(parse_stroke_mask(steno) for steno in stenos)
 
     @define_plugin(prohibited_strokes)
     def plugin(get_plugin_api: GetPluginApi, **_):
@@ -14,7 +14,7 @@ def prohibited_strokes(stenos: str) -> Plugin[None]:
 
 
         @soph_trie_api.process_outline.listen(soph_trie)
-        def _(outline: tuple[Stroke, ...], **_):
+        def _(outline: tuple[StrokeMask, ...], **_):
             for stroke in outline:
                 if stroke in strokes:
                     return None
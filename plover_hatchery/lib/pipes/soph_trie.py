@@ -1,17 +1,27 @@
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from dataclasses import dataclass, field
+from functools import lru_cache
+from itertools import islice
+import heapq
 import json
-from typing import Any, Callable, Iterable, NamedTuple, Protocol, Sequence, final
+from threading import Lock
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Protocol, Sequence, final, overload
 
 from plover.steno import Stroke
 
-from plover_hatchery_lib_rs import DefView, DefViewCursor, add_soph_trie_entry, TriePath, TransitionCostKey, TransitionKey, Soph, TransitionFlagManager
+from plover_hatchery_lib_rs import DefView, DefViewCursor, add_soph_trie_entry, TriePath, TransitionCostKey, TransitionKey, Soph, TransitionFlagManager, PhonemeProvenanceTable
 from plover_hatchery.lib.pipes.Hook import Hook
 from plover_hatchery.lib.pipes.Plugin import GetPluginApi, Plugin, define_plugin
 from plover_hatchery.lib.pipes.floating_keys import floating_keys
 from plover_hatchery.lib.pipes.plugin_utils import iife, join_sophs_to_chords_dicts
-from plover_hatchery.lib.trie import KeyIdManager, LookupResult, NondeterministicTrie, TransitionSourceNode, Trie, JoinedTriePaths
+from plover_hatchery.lib.pipes.stroke_masks import StrokeMask, contains_all, key_masks, parse_outline_masks, to_stroke
+from plover_hatchery.lib.trie import KeyIdManager, LookupResult, NondeterministicTrie, TransitionSourceNode, Trie, JoinedTriePaths, SubtrieQuery
 from plover_hatchery.lib.pipes.compile_theory import TheoryHooks
+from plover_hatchery.lib.pipes.Theory import OutlineWithCost
+
+
+MAX_CHORD_SEQS_PER_SOPH_SEQ = 64
+"""The number of ways to assign chords to a soph sequence that reverse lookup tries before moving on to the next one"""
 
 
 
@@ -19,7 +29,7 @@ class SophChordAssociation(NamedTuple):
     sophs: tuple[Soph, ...]
     chord: Stroke
     chord_starts_new_stroke: bool
-    phonemes: tuple[DefViewCursor, ...]
+    phonemes: Sequence[DefViewCursor]
     transitions: Sequence[TransitionKey]
 
 class LookupResultWithAssociations(NamedTuple):
@@ -27,6 +37,35 @@ class LookupResultWithAssociations(NamedTuple):
     sophs_and_chords_used: tuple[SophChordAssociation, ...]
 
 
+@final
+class LazyPhonemes(Sequence[DefViewCursor]):
+    """The phonemes of an association, which are only rehydrated into cursors when first accessed."""
+
+    def __init__(self, api: "SophTrieApi", cost_keys: tuple[TransitionCostKey, ...]):
+        self.__api = api
+        self.__cost_keys = cost_keys
+        self.__cursors: tuple[DefViewCursor, ...] | None = None
+
+    def __resolve(self):
+        if self.__cursors is None:
+            self.__cursors = tuple(
+                cursor
+                for cursor in (self.__api.resolve_phoneme(cost_key) for cost_key in self.__cost_keys)
+                if cursor is not None
+            )
+        return self.__cursors
+
+    @overload
+    def __getitem__(self, index: int) -> DefViewCursor: ...
+    @overload
+    def __getitem__(self, index: slice) -> tuple[DefViewCursor, ...]: ...
+    def __getitem__(self, index: int | slice):
+        return self.__resolve()[index]
+
+    def __len__(self):
+        return len(self.__resolve())
+
+
 class SophChordAssociationWithUnresolvedPhonemes(NamedTuple):
     sophs: tuple[Soph, ...]
     chord: Stroke
@@ -70,19 +109,30 @@ class SophTrieApi:
             entry_id: int,
         ): ...
     class BeginLookup(Protocol):
-        def __call__(self, *, outline: tuple[Stroke, ...]) -> Any: ...
+        def __call__(self, *, outline: tuple[StrokeMask, ...]) -> Any: ...
     class ProcessOutline(Protocol):
-        def __call__(self, *, state: Any, outline: tuple[Stroke, ...]) -> tuple[Stroke, ...] | None: ...
+        def __call__(self, *, state: Any, outline: tuple[StrokeMask, ...]) -> tuple[StrokeMask, ...] | None: ...
+    class UnprocessOutline(Protocol):
+        def __call__(self, *, outline: tuple[StrokeMask, ...]) -> tuple[StrokeMask, ...] | None: ...
+    class ExtraLookupStrokes(Protocol):
+        def __call__(self) -> int: ...
     class ConsumeKey(Protocol):
         def __call__(
             self,
             *,
             state: Any,
-            key: str,
+            key: StrokeMask,
             key_index: int,
             is_new_stroke: bool,
             results: tuple[ChordToSophSearchResultWithSrcIndex, ...],
         ) -> Iterable[ChordToSophSearchResultWithSrcIndex]: ...
+    class ValidatePathExtension(Protocol):
+        def __call__(
+            self,
+            *,
+            state: Any,
+            associations: tuple[SophChordAssociationWithUnresolvedPhonemes, ...],
+        ) -> bool: ...
     class ValidateLookupResult(Protocol):
         def __call__(
             self,
@@ -90,8 +140,7 @@ class SophTrieApi:
             state: Any,
             result: LookupResultWithAssociations,
             trie: NondeterministicTrie,
-            original_outline: tuple[Stroke, ...],
-            outline: tuple[Stroke, ...],
+            outline: tuple[StrokeMask, ...],
         ) -> bool: ...
     class SelectTranslation(Protocol):
         def __call__(
@@ -101,8 +150,8 @@ class SophTrieApi:
             trie: NondeterministicTrie,
             choices: list[LookupResultWithAssociations],
             translations: list[str],
-            original_outline: tuple[Stroke, ...],
-            outline: tuple[Stroke, ...],
+            original_outline: tuple[StrokeMask, ...],
+            outline: tuple[StrokeMask, ...],
         ) -> str | None: ...
     class ModifyTranslation(Protocol):
         def __call__(
@@ -110,29 +159,47 @@ class SophTrieApi:
             *,
             state: Any,
             translation: str,
-            original_outline: tuple[Stroke, ...],
-            outline: tuple[Stroke, ...],
+            original_outline: tuple[StrokeMask, ...],
+            outline: tuple[StrokeMask, ...],
         ) -> str: ...
 
     
             
 
     trie: NondeterministicTrie
-    transition_data: dict[TransitionCostKey, DefViewCursor]
+    phoneme_provenance: PhonemeProvenanceTable
+    """The index stack of the phoneme that each (first transition, entry) pair was created from"""
     transition_flags: TransitionFlagManager
     key_id_manager: KeyIdManager[Soph]
+    rehydrate_view: Callable[[int], DefView] | None = None
+    """Rebuilds the processed view of an entry; only available once the build has completed"""
 
     def register_transition(self, transition: TransitionKey, entry_id: int, phoneme: DefViewCursor):
         cost_key = TransitionCostKey(transition, entry_id)
-        self.transition_data[cost_key] = phoneme
+        self.phoneme_provenance.record(cost_key, phoneme.index_stack)
+
+    def resolve_phoneme(self, cost_key: TransitionCostKey) -> DefViewCursor | None:
+        index_stack = self.phoneme_provenance.get_index_stack(cost_key)
+        if index_stack is None or self.rehydrate_view is None:
+            return None
+
+        return DefViewCursor(self.rehydrate_view(cost_key.translation_id), index_stack)
 
 
     begin_add_entry = Hook(BeginAddEntry)
     add_soph_transition = Hook(AddSophTransition)
     begin_lookup = Hook(BeginLookup)
     process_outline = Hook(ProcessOutline)
+    unprocess_outline = Hook(UnprocessOutline)
+    """The reverse of `process_outline`, used by reverse lookup to turn an outline of chords packed into strokes into the
+    outline a user would stroke"""
+    extra_lookup_strokes = Hook(ExtraLookupStrokes)
+    """How many strokes that `process_outline` strips from the end of an outline Plover should still look up after the
+    longest outline, such as presses of a conflict cycler stroke"""
     consume_key = Hook(ConsumeKey)
+    validate_path_extension = Hook(ValidatePathExtension)
     validate_lookup_result = Hook(ValidateLookupResult)
+    """Only given the processed outline, since the results it validates are cached by the processed outline alone"""
     select_translation = Hook(SelectTranslation)
     modify_translation = Hook(ModifyTranslation)
 
@@ -141,7 +208,14 @@ def soph_trie(
     *,
     map_to_sophs: Callable[[DefViewCursor], set[str]],
     sophs_to_chords_dicts: Iterable[dict[str, str]],
+    max_outline_strokes: int | None=None,
 ) -> Plugin[SophTrieApi]:
+    """Looks up outlines by matching their chords to sophs and following the sophs through a trie of every entry.
+
+    Outlines of more than `max_outline_strokes` strokes, not counting the strokes that `process_outline` strips, are not
+    translated. Along with the strokes that plugins may strip, this bounds how many strokes Plover looks up at once.
+    """
+
     sophs_to_chords = join_sophs_to_chords_dicts(sophs_to_chords_dicts)
 
 
@@ -150,10 +224,11 @@ def soph_trie(
         from plover_hatchery.Store import store
 
         floating_keys_api = get_plugin_api(floating_keys)
+        floaters_mask = int(floating_keys_api.floaters)
 
 
         trie = NondeterministicTrie()
-        transition_phonemes: dict[TransitionCostKey, DefViewCursor] = {}
+        phoneme_provenance = PhonemeProvenanceTable()
         transition_flags = TransitionFlagManager()
         key_id_manager = KeyIdManager[Soph]()
 
@@ -162,7 +237,7 @@ def soph_trie(
 
         store.trie = trie
 
-        api = SophTrieApi(trie, transition_phonemes, transition_flags, key_id_manager)
+        api = SophTrieApi(trie, phoneme_provenance, transition_flags, key_id_manager)
 
 
 
@@ -178,9 +253,6 @@ def soph_trie(
                 
             def get_key_ids_wrapper(sophs: set[Soph]):
                 return key_id_manager.get_key_ids_else_create(sophs)
-            
-            def register_transition_wrapper(transition: TransitionKey, entry_id: int, cursor: DefViewCursor):
-                api.register_transition(transition, entry_id, cursor)
                 
 
             add_soph_trie_entry(
@@ -189,8 +261,7 @@ def soph_trie(
                 view,
                 map_to_sophs_wrapper,
                 get_key_ids_wrapper,
-                register_transition_wrapper,
-                transition_flags,
+                phoneme_provenance,
                 skip_transition_flag,
                 api.begin_add_entry.emit_and_store_outputs,
                 api.add_soph_transition.emit_with_states
@@ -200,9 +271,27 @@ def soph_trie(
 
 
 
-        # @base_hooks.complete_build_lookup.listen(soph_trie)
-        # def _(**_):
-        #     print(trie)
+        @base_hooks.complete_build_lookup.listen(soph_trie)
+        def _(rehydrate_view: Callable[[int], DefView], **_):
+            trie.complete_build()
+            phoneme_provenance.complete_build()
+            api.rehydrate_view = rehydrate_view
+            translation_choices_cache.clear()
+            soph_sequence_finders.clear()
+
+
+        @base_hooks.longest_key.listen(soph_trie)
+        def _(**_):
+            # Floater-only strokes are never translated, so every stroke of a processed outline consumes at least one
+            # chord, and every chord follows at least one keyed transition. No processed outline can then have more
+            # strokes than the deepest path has keyed transitions. Since a theory may give every soph its own stroke,
+            # that is about as many strokes as the longest entry has sophs, so `max_outline_strokes` is what usually
+            # bounds it
+            bounds = tuple(bound for bound in (trie.max_keyed_depth(), max_outline_strokes) if bound is not None)
+            if len(bounds) == 0:
+                return None
+
+            return min(bounds) + sum(handler() for handler in api.extra_lookup_strokes.handlers())
 
 
 
@@ -214,7 +303,7 @@ def soph_trie(
 
         class ChordToSophSearcher:
             def __init__(self, sophs_to_chords_dicts: Iterable[dict[str, str]]):
-                self.__chords_to_sophs: Trie[str, list[ChordToSophSearchResult]] = Trie()
+                self.__chords_to_sophs: Trie[StrokeMask, list[ChordToSophSearchResult]] = Trie()
 
                 for sophs, chords in sophs_to_chords.items():
                     for chord in chords:
@@ -222,7 +311,7 @@ def soph_trie(
                         result = ChordToSophSearchResult(sophs, chord)
 
 
-                        dst_node = self.__chords_to_sophs.follow_chain(self.__chords_to_sophs.ROOT, chord_rest.keys())
+                        dst_node = self.__chords_to_sophs.follow_chain(self.__chords_to_sophs.ROOT, key_masks(int(chord_rest)))
                         existing_soph_seqs = self.__chords_to_sophs.get_translation(dst_node)
                         if existing_soph_seqs is None:
                             self.__chords_to_sophs.set_translation(dst_node, [result])
@@ -239,6 +328,28 @@ def soph_trie(
                 return self.__chords_to_sophs
 
 
+            def can_segment(self, keys: tuple[StrokeMask, ...]):
+                """Determines whether a stroke's keys can be split into consecutive chords. Every soph a lookup path
+                consumes comes from one chord (or from a plugin combining adjacent chords), so a stroke that cannot be
+                split this way cannot be matched by any path."""
+
+                segment_ends = [False] * (len(keys) + 1)
+                segment_ends[0] = True
+
+                for start_index in range(len(keys)):
+                    if not segment_ends[start_index]: continue
+
+                    node = self.__chords_to_sophs.ROOT
+                    for end_index in range(start_index, len(keys)):
+                        node = self.__chords_to_sophs.traverse(node, keys[end_index])
+                        if node is None: break
+
+                        if self.__chords_to_sophs.node_has_translations(node):
+                            segment_ends[end_index + 1] = True
+
+                return segment_ends[-1]
+
+
             class Session:
                 def __init__(self, chord_finder: "ChordToSophSearcher"):
                     self.__chord_finder = chord_finder
@@ -247,7 +358,7 @@ def soph_trie(
                     self.__key_starts_new_stroke = True
 
 
-                def possible_sophs_after_consuming(self, key: str):
+                def possible_sophs_after_consuming(self, key: StrokeMask):
                     # Add a root node to trigger a new traversal starting from the root
                     self.__node_data_for_chords_to_sophs_lookup.append(ChordToSophSearchNode(chord_finder.chords_to_sophs.ROOT, self.__current_key_index ))
 
@@ -284,6 +395,19 @@ def soph_trie(
         chord_finder = ChordToSophSearcher(sophs_to_chords_dicts)
 
 
+        @lru_cache(maxsize=65536)
+        def stroke_may_match(stroke: StrokeMask):
+            keys = stroke & ~floaters_mask
+            return keys != 0 and chord_finder.can_segment(key_masks(keys))
+
+        def outline_may_match(outline: tuple[StrokeMask, ...]):
+            """Cheaply rejects processed outlines that definitely have no translation, so that the many lookups that
+            miss do not have to run the full chord search and trie traversal. A stroke of only floaters consumes no
+            chord, so it is rejected too rather than being looked up as if it were not there."""
+
+            return all(stroke_may_match(stroke) for stroke in outline)
+
+
         ### Lookup ######################################################################
         # We go key by key in the user's outline. For each key, check all possible configurations of sophs that the
         # outline could represent, traversing the nondeterministic soph trie as soon as sophs are found.
@@ -302,32 +426,34 @@ def soph_trie(
             def __init__(self):
                 self.__possible_soph_paths: list[list[SophsToTranslationSearchPath]] = [[SophsToTranslationSearchPath()]]
                 self.__chord_search = chord_finder.begin_search()
-                self.__consumed_keys: list[str] = []
+                self.__consumed_keys: list[StrokeMask] = []
                 self.__is_new_stroke = True
 
 
-            def __stroke_has_required_floaters(self, result: ChordToSophSearchResultWithSrcIndex, stroke: Stroke):
-                return floating_keys_api.only_floaters(result.soph_result.chord) in stroke
+            def __stroke_has_required_floaters(self, result: ChordToSophSearchResultWithSrcIndex, stroke: StrokeMask):
+                return contains_all(stroke, int(result.soph_result.chord) & floaters_mask)
             
 
 
-            def __new_paths_ending_with_soph(self, result: ChordToSophSearchResultWithSrcIndex):
+            def __new_paths_ending_with_soph(self, result: ChordToSophSearchResultWithSrcIndex, states: dict[int, Any]):
                 for path in self.__possible_soph_paths[result.chord_start_key_index]:
                     for new_trie_path in trie.traverse_chain((path.trie_path,), key_id_manager.get_key_ids_else_create(result.soph_result.sophs)):
-                        yield SophsToTranslationSearchPath(
-                            new_trie_path,
-                            path.sophs_and_chords_used + (
-                                SophChordAssociationWithUnresolvedPhonemes(
-                                    result.soph_result.sophs,
-                                    result.soph_result.chord,
-                                    self.__is_new_stroke,
-                                    new_trie_path.transitions[len(path.trie_path.transitions):]
-                                ),
-                            )
+                        associations = path.sophs_and_chords_used + (
+                            SophChordAssociationWithUnresolvedPhonemes(
+                                result.soph_result.sophs,
+                                result.soph_result.chord,
+                                self.__is_new_stroke,
+                                new_trie_path.transitions[len(path.trie_path.transitions):]
+                            ),
                         )
 
+                        if not api.validate_path_extension.emit_and_validate_with_states(states, associations=associations):
+                            continue
+
+                        yield SophsToTranslationSearchPath(new_trie_path, associations)
+
             
-            def __all_sophs_after_consuming(self, key: str, states: dict[int, Any]):
+            def __all_sophs_after_consuming(self, key: StrokeMask, states: dict[int, Any]):
                 results = list(self.__chord_search.possible_sophs_after_consuming(key))
 
                 for state, handler in api.consume_key.states_handlers(states):
@@ -336,16 +462,16 @@ def soph_trie(
                 yield from results
 
 
-            def __consume_key(self, key: str, stroke: Stroke, states: dict[int, Any]):
-                new_possible_sophs: list[SophsToTranslationSearchPath] = []
-
-
+            def __new_paths_after_consuming(self, key: StrokeMask, stroke: StrokeMask, states: dict[int, Any]):
                 for result in self.__all_sophs_after_consuming(key, states):
                     if not self.__stroke_has_required_floaters(result, stroke): continue
 
-                    new_possible_sophs.extend(self.__new_paths_ending_with_soph(result))
+                    yield from self.__new_paths_ending_with_soph(result, states)
 
 
+            def __consume_key(self, key: StrokeMask, stroke: StrokeMask, states: dict[int, Any]):
+                new_possible_sophs = list(self.__new_paths_after_consuming(key, stroke, states))
+
                 self.__possible_soph_paths.append(new_possible_sophs)
                 self.__consumed_keys.append(key)
                 self.__is_new_stroke = False
@@ -361,17 +487,28 @@ def soph_trie(
 
 
             @staticmethod
-            def get_paths_from_outline(outline: tuple[Stroke, ...], states: dict[int, Any]):
+            def get_paths_from_outline(outline: tuple[StrokeMask, ...], states: dict[int, Any]) -> Iterator[SophsToTranslationSearchPath]:
+                """Generates the paths that the outline takes through the trie. Every key but the last has to be
+                consumed before any path is complete, but the final paths are generated as the last key extends them,
+                so a caller streaming them does not wait for the rest"""
+
                 soph_path_finder = SophsToTranslationPathFinder()
 
+                n_keys_left = sum(len(key_masks(stroke & ~floaters_mask)) for stroke in outline)
+                if n_keys_left == 0:
+                    yield from soph_path_finder.__get_final_paths()
+                    return
+
                 for stroke_index, stroke in enumerate(outline):
                     if stroke_index > 0:
                         soph_path_finder.__finish_stroke()
 
-                    for key in stroke - floating_keys_api.floaters:
-                        soph_path_finder.__consume_key(key, stroke, states)
-
-                return soph_path_finder.__get_final_paths()
+                    for key in key_masks(stroke & ~floaters_mask):
+                        n_keys_left -= 1
+                        if n_keys_left > 0:
+                            soph_path_finder.__consume_key(key, stroke, states)
+                        else:
+                            yield from soph_path_finder.__new_paths_after_consuming(key, stroke, states)
 
 
         @iife
@@ -380,17 +517,11 @@ def soph_trie(
 
 
             def resolve_phonemes(lookup_result: LookupResult, association: SophChordAssociationWithUnresolvedPhonemes):
-                phonemes: list[DefViewCursor] = []
-                for transition in association.transitions:
-                    cost_key = TransitionCostKey(transition, lookup_result.translation_id)
-                    if cost_key not in transition_phonemes: continue
-
-                    phonemes.append(transition_phonemes[cost_key])
-                
-                return tuple(phonemes)
+                cost_keys = phoneme_provenance.recorded_cost_keys(association.transitions, lookup_result.translation_id)
+                return LazyPhonemes(api, tuple(cost_keys))
 
 
-            def get_processed_lookup_results(outline: tuple[Stroke, ...], states: dict[int, Any]):
+            def get_processed_lookup_results(outline: tuple[StrokeMask, ...], states: dict[int, Any]):
                 for final_path in SophsToTranslationPathFinder.get_paths_from_outline(outline, states):
                     for lookup_result in trie.get_translations_and_costs((final_path.trie_path,)):
                         new_associations = tuple(
@@ -422,8 +553,7 @@ def soph_trie(
                 self,
                 lookup_result: LookupResult,
                 sophs_and_chords_used: Iterable[SophChordAssociation],
-                outline: tuple[Stroke, ...],
-                original_outline: tuple[Stroke, ...],
+                outline: tuple[StrokeMask, ...],
                 states: dict[int, Any],
             ):
                 if lookup_result.cost >= self.__min_costs_by_translation_id[lookup_result.translation_id]: return
@@ -435,7 +565,6 @@ def soph_trie(
                     result=result,
                     trie=trie,
                     outline=outline,
-                    original_outline=original_outline,
                 ):
                     return
 
@@ -448,23 +577,68 @@ def soph_trie(
 
 
             @staticmethod
-            def build(outline: tuple[Stroke, ...], original_outline: tuple[Stroke, ...], states: dict[int, Any]):
+            def build(outline: tuple[StrokeMask, ...]):
+                # The search gets lookup states of its own, so that nothing about the strokes that `process_outline`
+                # stripped can reach it and make the cached choices wrong for another outline
+                states = api.begin_lookup.emit_and_store_outputs(outline=outline)
+
                 builder = MinTranslationBuilder()
                 for lookup_result, associations in get_processed_lookup_results(outline, states):
-                    builder.__record_lookup_result_if_has_min_cost(lookup_result, associations, outline, original_outline, states)
+                    builder.__record_lookup_result_if_has_min_cost(lookup_result, associations, outline, states)
                 
                 return builder.__get_sorted_min_translations()
 
 
-        @base_hooks.lookup.listen(soph_trie)
-        def _(stroke_stenos: tuple[str, ...], translations: list[str], **_) -> str | None:
-            original_outline = tuple(Stroke.from_steno(steno) for steno in stroke_stenos)
+        class TranslationChoicesCache:
+            """Remembers the sorted translation choices of recently looked-up processed outlines. Outlines that only
+            differ in strokes stripped by `process_outline` (such as repeated presses of a conflict cycler stroke), and
+            the overlapping suffixes Plover looks up on every stroke, then reuse the same choices instead of rerunning
+            the search. Choices are built from the processed outline alone, so they cannot depend on the strokes that
+            `process_outline` strips."""
+
+            MAX_SIZE = 256
+
+            def __init__(self):
+                self.__choices: OrderedDict[tuple[StrokeMask, ...], list[LookupResultWithAssociations]] = OrderedDict()
+                self.__lock = Lock()
+
+            def get_else_build(self, outline: tuple[StrokeMask, ...]):
+                with self.__lock:
+                    choices = self.__choices.get(outline)
+                    if choices is not None:
+                        self.__choices.move_to_end(outline)
+                        return choices
+
+                choices = MinTranslationBuilder.build(outline)
+
+                with self.__lock:
+                    self.__choices[outline] = choices
+                    if len(self.__choices) > TranslationChoicesCache.MAX_SIZE:
+                        _ = self.__choices.popitem(last=False)
+
+                return choices
+
+            def clear(self):
+                with self.__lock:
+                    self.__choices.clear()
+
+
+        translation_choices_cache = TranslationChoicesCache()
+
+
+        class TranslationChoices(NamedTuple):
+            states: dict[int, Any]
+            outline: tuple[StrokeMask, ...]
+            choices: list[LookupResultWithAssociations]
+
 
+        def get_translation_choices(original_outline: tuple[StrokeMask, ...]) -> TranslationChoices | None:
+            """Finds the translations of an outline, cheapest first, or None if the outline cannot be looked up"""
 
             states = api.begin_lookup.emit_and_store_outputs(outline=original_outline)
 
 
-            if len(original_outline[0]) == 0: return None # TODO
+            if original_outline[0] == 0: return None # TODO
 
 
             outline = original_outline
@@ -472,9 +646,22 @@ def soph_trie(
                 outline = handler(state=state, outline=outline)
                 if outline is None:
                     return None
+
+            if max_outline_strokes is not None and len(outline) > max_outline_strokes: return None
+            if not outline_may_match(outline): return None
             
             
-            translation_choices = MinTranslationBuilder.build(outline, original_outline, states)
+            return TranslationChoices(states, outline, translation_choices_cache.get_else_build(outline))
+
+
+        @base_hooks.lookup.listen(soph_trie)
+        def _(stroke_stenos: tuple[str, ...], translations: list[str], **_) -> str | None:
+            original_outline = parse_outline_masks(stroke_stenos)
+
+            found = get_translation_choices(original_outline)
+            if found is None: return None
+
+            states, outline, translation_choices = found
             
             if len(translation_choices) == 0: return None
 
@@ -499,15 +686,17 @@ def soph_trie(
             return translation
 
 
-        @base_hooks.breakdown_lookup.listen(soph_trie)
-        def _(stroke_stenos: tuple[str, ...], translations: list[str], **_):
-            original_outline = tuple(Stroke.from_steno(steno) for steno in stroke_stenos)
+        def get_lookup_breakdown_paths(stroke_stenos: tuple[str, ...]):
+            """Finds the paths that an outline takes through the trie. Returns None if the outline cannot be looked up, or
+            else a generator that summarizes each path only once it is consumed."""
+
+            original_outline = parse_outline_masks(stroke_stenos)
 
 
             states = api.begin_lookup.emit_and_store_outputs(outline=original_outline)
 
 
-            if len(original_outline[0]) == 0: return None # TODO
+            if original_outline[0] == 0: return None # TODO
 
 
             outline = original_outline
@@ -515,10 +704,13 @@ def soph_trie(
                 outline = handler(state=state, outline=outline)
                 if outline is None:
                     return None
-            
-            
-            summaries: list[dict[str, Any]] = []
-            for final_path in SophsToTranslationPathFinder.get_paths_from_outline(outline, states):
+
+
+            return summarize_lookup_breakdown_paths(SophsToTranslationPathFinder.get_paths_from_outline(outline, states))
+
+
+        def summarize_lookup_breakdown_paths(final_paths: Iterable[SophsToTranslationSearchPath]):
+            for final_path in final_paths:
                 nodes_by_association: list[Sequence[int]] = []
 
                 for i, association in enumerate(final_path.sophs_and_chords_used):
@@ -533,7 +725,7 @@ def soph_trie(
                     ))
 
 
-                summaries.append({
+                yield {
                     "path": [
                         {
                             "sophs": [soph.value for soph in association.sophs],
@@ -542,91 +734,188 @@ def soph_trie(
                         }
                         for i, association in enumerate(final_path.sophs_and_chords_used)
                     ],
-                })
-                
+                }
+
+
+        @base_hooks.breakdown_lookup.listen(soph_trie)
+        def _(stroke_stenos: tuple[str, ...], translations: list[str], **_):
+            summaries = get_lookup_breakdown_paths(stroke_stenos)
+            if summaries is None:
+                return None
 
-            return json.dumps(summaries)
+            return json.dumps(list(summaries))
+
+
+        @base_hooks.breakdown_lookup_stream.listen(soph_trie)
+        def _(stroke_stenos: tuple[str, ...], translations: list[str], **_):
+            summaries = get_lookup_breakdown_paths(stroke_stenos)
+            if summaries is None:
+                return None
+
+            return (json.dumps(summary) for summary in summaries)
 
 
         ### Reverse lookup ##############################################################
 
-        subtrie_builders: dict[int, Callable[[int], dict[str, Any] | None]] = {}
+        subtrie_builders: dict[int, Callable[[int, SubtrieQuery | None], str | None]] = {}
 
         @base_hooks.breakdown_translation.listen(soph_trie)
-        def _(translation: str, entries: list[str], reverse_translations: dict[str, list[int]], **_):
+        def _(translation: str, query: SubtrieQuery, entries: Sequence[str], reverse_translations: dict[str, list[int]], **_):
             if id(trie) in subtrie_builders:
                 subtrie_builder = subtrie_builders[id(trie)]
             else:
-                subtrie_builder = trie.build_subtrie_builder(transition_flags, key_id_manager.get_key_str)
+                subtrie_builder = trie.build_subtrie_builder(transition_flags, key_id_manager.get_key_strs())
                 subtrie_builders[id(trie)] = subtrie_builder
 
-            return json.dumps([
-                {
-                    "entry": entries[entry_id],
-                    "subtrie": subtrie_builder(entry_id),
-                }
+            # The subtries are already serialized by the trie, so they are spliced in rather than parsed and re-dumped
+            return "[" + ", ".join(
+                f"""{{"entry": {json.dumps(entries[entry_id])}, "subtrie": {subtrie_builder(entry_id, query) or "null"}}}"""
                 for entry_id in reverse_translations[translation]
-            ])
+            ) + "]"
 
-        # reverse_lookups: dict[int, Callable[[int], Iterable[LookupResult[int]]]] = {}
+        # Every outline of a translation follows one of the soph sequences that the reverse index finds for its entries.
+        # Each sequence is split into runs of sophs that have chords, and the chords are packed into as few strokes as
+        # steno order allows. The candidates are then looked up like any other outline, so that their costs and whether
+        # they are valid at all come from the same plugins as in forward lookups
 
+        max_sophs_per_chord = max((len(sophs) for sophs in sophs_to_chords), default=0)
+        soph_sequence_finders: dict[int, Callable[[int], list[LookupResult]]] = {}
 
-        # @base_hooks.reverse_lookup.listen(soph_trie)
-        # def _(translation: str, reverse_translations: dict[str, list[EntryIndex]]):
-        #     if id(trie) in reverse_lookups:
-        #         reverse_lookup = reverse_lookups[id(trie)]
-        #     else:
-        #         reverse_lookup = trie.build_reverse_lookup()
-        #         reverse_lookups[id(trie)] = reverse_lookup
 
-            
-        #     for entry_id in reverse_translations[translation]:
-        #         for lookup_result in reverse_lookup(entry_id):
-        #             outline: list[Stroke] = []
-        #             latest_stroke: Stroke = Stroke.from_integer(0)
-        #             invalid = False
-        #             for transition in lookup_result.transitions:
-        #                 if transition.key_id is None: continue
-        #                 key = trie.get_key(transition.key_id)
+        def get_soph_sequences(entry_id: int):
+            if id(trie) in soph_sequence_finders:
+                get_sequences = soph_sequence_finders[id(trie)]
+            else:
+                get_sequences = trie.build_reverse_lookup()
+                soph_sequence_finders[id(trie)] = get_sequences
 
-        #                 if key == TRIE_STROKE_BOUNDARY_KEY:
-        #                     outline.append(latest_stroke)
-        #                     latest_stroke = Stroke.from_integer(0)
-        #                     continue
+            return get_sequences(entry_id)
 
-        #                 # if key == TRIE_LINKER_KEY:
-        #                 #     key_stroke = amphitheory.spec.LINKER_CHORD
-        #                 # else: 
-        #                 key_stroke = Stroke.from_steno(key)
 
-        #                 if banks_info.can_add_stroke_on(latest_stroke, key_stroke):
-        #                     latest_stroke += key_stroke
-        #                 else:
-        #                     invalid = True
-        #                     break
+        def chord_seqs_for_sophs(sophs: tuple[Soph, ...], start_index: int=0) -> Iterable[tuple[Stroke, ...]]:
+            if start_index == len(sophs):
+                yield ()
+                return
 
-        #             if invalid:
-        #                 continue
+            for end_index in range(start_index + 1, min(len(sophs), start_index + max_sophs_per_chord) + 1):
+                chords = sophs_to_chords.get(sophs[start_index:end_index])
+                if chords is None: continue
 
+                for chord in chords:
+                    for following_chords in chord_seqs_for_sophs(sophs, end_index):
+                        yield (chord, *following_chords)
 
-        #             outline.append(latest_stroke)
 
+        def pack_chords(chords: Iterable[Stroke]):
+            strokes: list[Stroke] = []
 
-        #             final_outline = tuple(outline)
+            for chord in chords:
+                if len(strokes) > 0 and floating_keys_api.can_add_stroke_on(strokes[-1], chord):
+                    strokes[-1] += chord
+                else:
+                    strokes.append(chord)
 
+            return tuple(int(stroke) for stroke in strokes)
 
-        #             states = api.begin_lookup.emit_and_store_outputs(outline=final_outline)
 
-        #             if not api.validate_lookup_result.emit_and_validate_with_states(
-        #                 states,
-        #                 result=result,
-        #                 trie=trie,
-        #                 outline=final_outline,
-        #                 original_outline=final_outline,
-        #             ):
-        #                 return
+        def unprocess_outline(outline: tuple[StrokeMask, ...]):
+            for handler in api.unprocess_outline.handlers():
+                maybe_outline = handler(outline=outline)
+                if maybe_outline is None:
+                    return None
+                outline = maybe_outline
 
-        #             yield tuple(stroke.rtfcre for stroke in outline)
+            return outline
+
+
+        def get_outline_cost(outline: tuple[StrokeMask, ...], entry_ids: set[int]):
+            """Looks up an outline and finds the cost of its cheapest choice among the given entries, if any"""
+
+            found = get_translation_choices(outline)
+            if found is None: return None
+
+            return min(
+                (choice.lookup_result.cost for choice in found.choices if choice.lookup_result.translation_id in entry_ids),
+                default=None,
+            )
+
+
+        def find_outlines_with_costs(
+            translation: str,
+            max_cost: float | None,
+            max_outlines: int | None,
+            reverse_translations: dict[str, list[int]],
+        ):
+            if max_outlines == 0: return []
+
+            entry_ids = set(reverse_translations.get(translation, ()))
+
+            soph_sequences = sorted(
+                (sequence for entry_id in entry_ids for sequence in get_soph_sequences(entry_id)),
+                key=lambda sequence: sequence.cost,
+            )
+
+
+            costs: dict[tuple[StrokeMask, ...], float | None] = {}
+
+            # The negated costs of the cheapest `max_outlines` outlines found so far, so the most expensive is on top
+            cheapest_negated_costs: list[float] = []
+
+            for sequence in soph_sequences:
+                if max_cost is not None and sequence.cost > max_cost: break
+
+                if (
+                    max_outlines is not None
+                    and len(cheapest_negated_costs) >= max_outlines
+                    and sequence.cost > -cheapest_negated_costs[0]
+                ):
+                    break
+
+
+                sophs = tuple(
+                    key_id_manager.get_key(transition.key_id)
+                    for transition in sequence.transitions
+                    if transition.key_id is not None
+                )
+                if len(sophs) == 0: continue
+
+                for chords in islice(chord_seqs_for_sophs(sophs), MAX_CHORD_SEQS_PER_SOPH_SEQ):
+                    outline = unprocess_outline(pack_chords(chords))
+                    if outline is None or outline in costs: continue
+
+                    cost = get_outline_cost(outline, entry_ids)
+                    costs[outline] = cost
+
+                    if cost is None or max_outlines is None or (max_cost is not None and cost > max_cost): continue
+
+                    if len(cheapest_negated_costs) < max_outlines:
+                        heapq.heappush(cheapest_negated_costs, -cost)
+                    elif cost < -cheapest_negated_costs[0]:
+                        _ = heapq.heapreplace(cheapest_negated_costs, -cost)
+
+
+            return sorted(
+                (
+                    OutlineWithCost(tuple(to_stroke(stroke).rtfcre for stroke in outline), cost)
+                    for outline, cost in costs.items()
+                    if cost is not None and (max_cost is None or cost <= max_cost)
+                ),
+                key=lambda result: result.cost,
+            )[:max_outlines]
+
+
+        # Only offline tools enumerate outlines. Each one takes many forward lookups, so the `reverse_lookup` that Plover
+        # calls live on every translation it shows suggestions for is deliberately left unanswered
+
+        @base_hooks.reverse_lookup_with_costs.listen(soph_trie)
+        def _(
+            translation: str,
+            max_cost: float | None,
+            max_outlines: int | None,
+            reverse_translations: dict[str, list[int]],
+            **_,
+        ):
+            return find_outlines_with_costs(translation, max_cost, max_outlines, reverse_translations)
         
 
         return api
@@ -0,0 +1,115 @@
+from functools import cache
+
+from plover_hatchery_lib_rs import DefViewCursor, DefViewItem
+
+from .compile_theory import compile_theory
+from .conflict_cycler_stroke import conflict_cycler_stroke
+from .debug_stroke import debug_stroke
+from .floating_keys import floating_keys
+from .soph_trie import soph_trie
+from .Theory import TheoryLookup
+
+
+_MAX_OUTLINE_STROKES = 3
+_MAX_CYCLER_PRESSES = 2
+
+
+def _map_to_sophs(cursor: DefViewCursor):
+    match cursor.tip():
+        case DefViewItem.Keysymbol(keysymbol):
+            return {keysymbol.base_symbol.upper()}
+
+        case _:
+            return set()
+
+
+def _plugins():
+    yield floating_keys("*")
+
+    yield soph_trie(
+        map_to_sophs=_map_to_sophs,
+        sophs_to_chords_dicts=({
+            "K": "K -BG",
+            "T": "T -T",
+            "S": "S -S",
+            "P": "P -P",
+            "A": "A",
+            "O": "O",
+        },),
+        max_outline_strokes=_MAX_OUTLINE_STROKES,
+    )
+
+    yield debug_stroke("-Z")
+    yield conflict_cycler_stroke("-D", max_presses=_MAX_CYCLER_PRESSES)
+
+
+_theory = compile_theory(_plugins)
+
+
+@cache
+def _lookup():
+    return _theory.build_lookup(entry_lines=(
+        ("cat", "c.k a.a!1 t.t"),
+        ("cats", "c.k a.a!1 t.t s.s"),
+        ("pot", "p.p o.o!1 t.t"),
+    ))
+
+
+def test__soph_trie__longest_key_covers_stripped_strokes_after_longest_outline():
+    lookup = _lookup()
+
+    longest_outline = ("KA", "-T", "-S")
+    assert len(longest_outline) == _MAX_OUTLINE_STROKES
+    assert lookup.lookup(longest_outline) == "cats"
+    assert lookup.lookup(("K", "A", "-T", "-S")) is None
+
+    cycled_outline = (*longest_outline, *("-D",) * _MAX_CYCLER_PRESSES)
+    debugged_outline = (*cycled_outline, "-Z")
+    assert lookup.longest_key >= len(debugged_outline)
+    assert lookup.lookup(cycled_outline) == "cats"
+    assert lookup.lookup(debugged_outline) is not None
+
+
+def test__soph_trie__prefilter_keeps_known_outlines_and_rejects_impossible_ones():
+    lookup = _lookup()
+
+    assert lookup.lookup(("KA-T",)) == "cat"
+    assert lookup.lookup(("PO-T",)) == "pot"
+    assert lookup.lookup(("KA", "-T", "-S")) == "cats"
+
+    # No chord uses `W`, so no stroke with it in can be segmented into chords
+    assert lookup.lookup(("KWA-T",)) is None
+    assert lookup.lookup(("KA-T", "W")) is None
+
+    # A stroke of only floaters consumes no chord
+    assert lookup.lookup(("KA-T", "*")) is None
+
+
+def _cycle(lookup: TheoryLookup, outline: tuple[str, ...], n_lookups: int):
+    return [lookup.lookup((*outline, *("-D",) * n_presses)) for n_presses in range(n_lookups)]
+
+
+def test__soph_trie__cycler_presses_cycle_through_cached_choices():
+    # Building adds to the theory's trie, so this test gets a theory of its own
+    lookup = compile_theory(_plugins).build_lookup(entry_lines=(
+        ("cat", "c.k a.a!1 t.t"),
+        ("kat", "k.k a.a!1 t.t"),
+    ))
+
+    # Every press after the first reuses the choices cached for `KA-T`, and pressing again gives the same translations
+    translations = _cycle(lookup, ("KA-T",), 3)
+    assert set(translations) == {"cat", "kat"}
+    assert translations[0] != translations[1]
+    assert translations[2] == translations[0]
+    assert _cycle(lookup, ("KA-T",), 3) == translations
+
+
+def test__soph_trie__complete_build_clears_cached_choices():
+    theory = compile_theory(_plugins)
+
+    lookup = theory.build_lookup(entry_lines=(("cat", "c.k a.a!1 t.t"),))
+    assert _cycle(lookup, ("KA-T",), 2) == ["cat", "cat"]
+
+    # The choices cached for `KA-T` before this build do not include `kat`
+    lookup = theory.build_lookup(entry_lines=(("kat", "k.k a.a!1 t.t"),))
+    assert set(_cycle(lookup, ("KA-T",), 2)) == {"cat", "kat"}
@@ -0,0 +1,46 @@
+from collections.abc import Iterable
+from functools import lru_cache
+
+from plover import system
+from plover.steno import Stroke
+
+
+StrokeMask = int
+"""A stroke as an integer whose i-th bit is set iff the stroke contains the i-th key in steno order. This is the same
+integer that Plover's `Stroke` wraps, so set operations on strokes become plain bitwise operations."""
+
+
+def parse_stroke_mask(steno: str) -> StrokeMask:
+    """Parses a steno string into a stroke mask. Repeated stenos are only parsed once per steno system."""
+    return _parse_stroke_mask(system.NAME, steno)
+
+
+@lru_cache(maxsize=4096)
+def _parse_stroke_mask(system_name: str, steno: str) -> StrokeMask:
+    # The same steno can name different keys in another system, so the system is part of the key
+    return int(Stroke.from_steno(steno))
+
+
+def parse_outline_masks(stenos: Iterable[str]) -> tuple[StrokeMask, ...]:
+    return tuple(parse_stroke_mask(steno) for steno in stenos)
+
+
+@lru_cache(maxsize=4096)
+def key_masks(mask: StrokeMask) -> tuple[StrokeMask, ...]:
+    """Splits a stroke mask into the masks of each of its keys, in steno order."""
+
+    keys: list[StrokeMask] = []
+    while mask != 0:
+        lowest_key = mask & -mask
+        keys.append(lowest_key)
+        mask ^= lowest_key
+
+    return tuple(keys)
+
+
+def contains_all(mask: StrokeMask, submask: StrokeMask):
+    return submask & ~mask == 0
+
+
+def to_stroke(mask: StrokeMask):
+    return Stroke.from_integer(mask)
@@ -1,4 +1,5 @@
 from collections.abc import Iterable, Generator
+import copyreg
 import re
 
 from plover_hatchery_lib_rs import Keysymbol
@@ -71,4 +72,15 @@ def adjust_keysymbol_stress(keysymbols: "tuple[Keysymbol, ...]", max_stress: int
 def normalize_stress(keysymbols: "tuple[Keysymbol, ...]") -> "tuple[tuple[Keysymbol, ...], int]":
     max_stress = max_stress_value(keysymbol.stress for keysymbol in keysymbols)
     new_keysymbols = tuple(adjust_keysymbol_stress(keysymbols, max_stress))
-    return (new_keysymbols, max_stress)
\ No newline at end of file
+    return (new_keysymbols, max_stress)
+
+
+def _rebuild_keysymbol(symbol: str, base_symbol: str, stress: int, optional: bool):
+    return Keysymbol.new_with_known_base_symbol(symbol, base_symbol, stress, optional)
+
+def _reduce_keysymbol(keysymbol: Keysymbol):
+    return _rebuild_keysymbol, (keysymbol.symbol, keysymbol.base_symbol, keysymbol.stress, keysymbol.optional)
+
+# The Rust class cannot be pickled on its own, but keysymbols are handed back from worker processes (such as in the
+# normalized keys of a parsed Unilex line), so they are pickled as their plain fields instead
+copyreg.pickle(Keysymbol, _reduce_keysymbol)
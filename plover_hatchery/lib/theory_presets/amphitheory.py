@@ -326,6 +326,7 @@ def theory():
     yield soph_trie(
         map_to_sophs=lambda cursor: set(map_phoneme_to_soph_values(cursor)),
         sophs_to_chords_dicts=(sophs_to_main_chords, sophs_to_alternate_chords),
+        max_outline_strokes=8,
     )
 
 
@@ -1,22 +1,30 @@
 from collections.abc import Iterable
+from threading import Lock
 
 
 class KeyIdManager[K]:
     def __init__(self):
         self.__keys_to_ids: dict[K, int] = {}
         self.__keys_list: list[K] = []
+        self.__create_lock = Lock()
 
     def get_key_id_else_create(self, key: K | None):
         if key is None:
             return None
 
-        if key in self.__keys_to_ids:
-            return self.__keys_to_ids[key]
-        
-        new_key_id = len(self.__keys_to_ids)
-        self.__keys_to_ids[key] = new_key_id
-        self.__keys_list.append(key)
-        return new_key_id
+        key_id = self.__keys_to_ids.get(key)
+        if key_id is not None:
+            return key_id
+
+        # Lookups on different threads may both create ids for keys that are not in the trie
+        with self.__create_lock:
+            if key in self.__keys_to_ids:
+                return self.__keys_to_ids[key]
+
+            new_key_id = len(self.__keys_to_ids)
+            self.__keys_list.append(key)
+            self.__keys_to_ids[key] = new_key_id
+            return new_key_id
 
         
     def get_key(self, key_id: int):
@@ -29,5 +37,8 @@ class KeyIdManager[K]:
 
         return str(self.__keys_list[key_id])
 
+    def get_key_strs(self):
+        return [str(key) for key in self.__keys_list]
+
     def get_key_ids_else_create(self, keys: Iterable[K]):
         return tuple(self.get_key_id_else_create(key) for key in keys)
\ No newline at end of file
@@ -16,6 +16,7 @@ from plover_hatchery_lib_rs import (
     JoinedTransitionSeq,
     TransitionFlag,
     TransitionFlagManager,
+    SubtrieQuery,
 )
 from typing import Callable, Generator, final, override
 
@@ -168,6 +169,22 @@ class NondeterministicTrie:
         return self.rs.link_chain(src_node_id, dst_node_id, key_ids, cost_info.cost, cost_info.translation_id)
     
 
+    def complete_build(self):
+        """
+        Drops bookkeeping that is only used while entries are being added. No more entries should be added to the trie
+        afterward
+        """
+        self.rs.complete_build()
+
+
+    def max_keyed_depth(self):
+        """
+        Gets the largest number of keyed transitions along any path from the root, or None if a cycle makes paths
+        unbounded
+        """
+        return self.rs.max_keyed_depth()
+
+
     def set_translation(self, node_id: int, translation_id: int):
         self.rs.set_translation(node_id, translation_id)
         
@@ -186,6 +203,12 @@ class NondeterministicTrie:
     
     def transition_has_key(self, transition: TransitionKey, key_id: int | None):
         return self.rs.transition_has_key(transition, key_id)
+
+    def flag_transition(self, transition: TransitionKey, translation_id: int, flag_index: int):
+        return self.rs.flag_transition(TransitionCostKey(transition, translation_id), flag_index)
+
+    def get_transition_flags(self, transition: TransitionKey, translation_id: int):
+        return self.rs.get_transition_flags(transition, translation_id)
     
     @override
     def __str__(self) -> str:
@@ -202,41 +225,16 @@ class NondeterministicTrie:
         
         return get_sequences
 
-    def build_subtrie_builder(self, transition_flags: TransitionFlagManager, get_key_str: Callable[[int | None], str]):
+    def build_subtrie_builder(self, transition_flags: TransitionFlagManager, key_labels: Sequence[str]):
+        """
+        Creates a function that serializes the subtrie of a given translation to JSON, optionally limited to the part
+        selected by a `SubtrieQuery`. `key_labels` holds the label of each key id that is in the trie
+        """
         reverse_index = self.rs.create_reverse_index()
+        reverse_index.set_labels(key_labels, transition_flags.labels())
 
-        def build_subtrie(translation_id: int):
-            raw_data = reverse_index.get_subtrie_data(self.rs, translation_id)
-            if raw_data is None: return None
-            
-            processed_transitions = []
-            for t in raw_data["transitions"]:
-                src = t["src_node_id"]
-                dst = t["dst_node_id"]
-                keys_costs = []
-                for key_id, idx, cost in t["key_infos"]:
-                   key_str = get_key_str(key_id)
-                   py_key = TransitionKey(src, key_id, idx)
-                   cost_key = TransitionCostKey(py_key, translation_id)
-                   flags = [transition_flags.get_label(flag) for flag in transition_flags.get_flags(cost_key)]
-                   
-                   keys_costs.append({
-                       "key": key_str,
-                       "cost": cost,
-                       "flags": flags
-                   })
-                
-                processed_transitions.append({
-                    "src_node_id": src,
-                    "dst_node_id": dst,
-                    "keys_costs": keys_costs
-                })
-            
-            return {
-                "nodes": tuple(raw_data["nodes"]),
-                "transitions": processed_transitions,
-                "translation_nodes": raw_data["translation_nodes"]
-            }
+        def build_subtrie(translation_id: int, query: SubtrieQuery | None=None):
+            return reverse_index.get_subtrie_json(self.rs, translation_id, query)
         
         return build_subtrie
 
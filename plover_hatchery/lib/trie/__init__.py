@@ -9,6 +9,7 @@ from plover_hatchery_lib_rs import (
     TransitionSourceNode,
     TransitionFlag,
     TransitionFlagManager,
+    SubtrieQuery,
 )
 from .Trie import Trie, ReadonlyTrie
 from .NondeterministicTrie import NondeterministicTrie
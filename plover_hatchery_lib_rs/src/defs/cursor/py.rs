@@ -35,6 +35,10 @@ impl PyDefViewCursor {
         }
     }
 
+    pub fn index_stack_slice(&self) -> &[usize] {
+        &self.index_stack
+    }
+
     pub fn with_rs<T>(&self, py: Python, func: impl Fn(super::DefViewCursor) -> T) -> Result<T, PyErr> {
         self.view.borrow(py).with_rs(py, |view_rs| {
             let cursor_rs = super::DefViewCursor::with_index_stack(&view_rs, self.index_stack.clone().into_iter().map(Some))
@@ -24,6 +24,7 @@ use pipes::{
     optionalize_keysymbols,
     add_diphthong_keysymbols,
     add_soph_trie_entry,
+    PhonemeProvenanceTable,
     Soph,
 };
 
@@ -44,6 +45,7 @@ use trie::{
     TransitionCostInfo,
     TransitionFlag,
     TransitionFlagManager,
+    SubtrieQuery,
     TriePath,
     LookupResult,
     TransitionSourceNode,
@@ -84,8 +86,10 @@ pub fn plover_hatchery_lib_rs(m: &Bound<'_, PyModule>) -> PyResult<()> {
     m.add_class::<TriePath>()?;
     m.add_class::<LookupResult>()?;
     m.add_class::<PyReverseTrieIndex>()?;
+    m.add_class::<SubtrieQuery>()?;
 
     m.add_class::<Soph>()?;
+    m.add_class::<PhonemeProvenanceTable>()?;
     m.add_class::<TransitionSourceNode>()?;
     m.add_class::<JoinedTriePaths>()?;
     m.add_class::<JoinedTransitionSeq>()?;
@@ -7,7 +7,7 @@ mod diphthongs;
 pub use diphthongs::add_diphthong_keysymbols;
 
 mod soph_trie;
-pub use soph_trie::add_soph_trie_entry;
+pub use soph_trie::{add_soph_trie_entry, PhonemeProvenanceTable};
 
 mod soph;
 pub use soph::Soph;
\ No newline at end of file
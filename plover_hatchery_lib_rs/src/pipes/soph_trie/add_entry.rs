@@ -6,11 +6,12 @@ use crate::trie::{
     TransitionSourceNode,
     JoinedTriePaths,
     TransitionCostKey,
-    TransitionFlagManager,
     py::PyNondeterministicTrie,
 };
 use crate::defs::py::{PyDefView, PyDefViewCursor, PyDefViewItem};
 
+use super::provenance::PhonemeProvenanceTable;
+
 
 /// Stack item for tracking cursor position and source nodes during entry building.
 struct SourceNodePositionStackItem {
@@ -29,9 +30,9 @@ struct SourceNodePositionStackItem {
 /// * `view` - The DefView containing the sophemes and keysymbols
 /// * `map_to_sophs` - Callback to get sophs from a cursor position
 /// * `get_key_ids_else_create` - Callback to get or create key IDs for a set of sophs
-/// * `register_transition` - Callback to register a transition with phoneme data
-/// * `transition_flags` - The transition flag manager
-/// * `skip_transition_flag_id` - The flag ID for skip transitions
+/// * `phoneme_provenance` - The table recording which phoneme each entry's first transitions were created from
+/// * `skip_transition_flag_id` - The flag ID for skip transitions; the trie attaches it to the first transition out of
+///   every source node that skipped an optional keysymbol
 /// * `emit_begin_add_entry` - Hook callback for begin_add_entry event
 /// * `emit_add_soph_transition` - Hook callback for add_soph_transition event
 #[pyfunction]
@@ -41,8 +42,7 @@ pub fn add_soph_trie_entry(
     view: Py<PyDefView>,
     map_to_sophs: Py<PyAny>,
     get_key_ids_else_create: Py<PyAny>,
-    register_transition: Py<PyAny>,
-    transition_flags: Py<TransitionFlagManager>,
+    phoneme_provenance: Py<PhonemeProvenanceTable>,
     skip_transition_flag_id: usize,
     emit_begin_add_entry: Py<PyAny>,
     emit_add_soph_transition: Py<PyAny>,
@@ -89,8 +89,7 @@ pub fn add_soph_trie_entry(
         entry_id: usize,
         map_to_sophs: &Py<PyAny>,
         get_key_ids_else_create: &Py<PyAny>,
-        register_transition: &Py<PyAny>,
-        transition_flags: &Py<TransitionFlagManager>,
+        phoneme_provenance: &Py<PhonemeProvenanceTable>,
         skip_transition_flag_id: usize,
         emit_add_soph_transition: &Py<PyAny>,
         states: &Py<PyAny>,
@@ -163,21 +162,8 @@ pub fn add_soph_trie_entry(
 
             for seq in &paths.transition_seqs {
                 if !seq.transitions.is_empty() {
-                    let first_transition = seq.transitions[0];
-                    register_transition.call1(py, (first_transition, entry_id, old_cursor.clone()))?;
-                }
-
-                for transition in &seq.transitions {
-                    // # TODO could optimize this linear search
-                    let should_add_flag = old_source_nodes.iter().any(|old_src_node| {
-                        old_src_node.src_node_index == transition.src_node_index
-                            && old_src_node.outgoing_transition_flags.contains(&skip_transition_flag_id)
-                    });
-
-                    if should_add_flag {
-                        let cost_key = TransitionCostKey::new(*transition, entry_id);
-                        transition_flags.borrow_mut(py).flag_transition(cost_key, skip_transition_flag_id);
-                    }
+                    let cost_key = TransitionCostKey::new(seq.transitions[0], entry_id);
+                    phoneme_provenance.borrow_mut(py).record(cost_key, old_cursor.index_stack_slice())?;
                 }
             }
 
@@ -224,8 +210,7 @@ pub fn add_soph_trie_entry(
                     entry_id,
                     &map_to_sophs,
                     &get_key_ids_else_create,
-                    &register_transition,
-                    &transition_flags,
+                    &phoneme_provenance,
                     skip_transition_flag_id,
                     &emit_add_soph_transition,
                     &states,
@@ -255,8 +240,7 @@ pub fn add_soph_trie_entry(
             entry_id,
             &map_to_sophs,
             &get_key_ids_else_create,
-            &register_transition,
-            &transition_flags,
+            &phoneme_provenance,
             skip_transition_flag_id,
             &emit_add_soph_transition,
             &states,
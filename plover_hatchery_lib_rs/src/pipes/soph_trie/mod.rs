@@ -1,2 +1,5 @@
 mod add_entry;
-pub use add_entry::add_soph_trie_entry;
\ No newline at end of file
+pub use add_entry::add_soph_trie_entry;
+
+mod provenance;
+pub use provenance::PhonemeProvenanceTable;
@@ -0,0 +1,140 @@
+use std::collections::HashMap;
+
+use pyo3::prelude::*;
+use pyo3::exceptions::PyValueError;
+
+use crate::trie::{TransitionCostKey, TransitionKey};
+
+
+/// The location of a packed index stack within the table's arena.
+#[derive(Clone, Copy, Debug)]
+struct IndexStackSpan {
+    start: u32,
+    len: u8,
+}
+
+/// Records which phoneme (as the index stack of a cursor into the entry's processed view) each
+/// (first transition, entry) pair was created from.
+///
+/// Index stacks are packed into a single arena, and consecutive records that share the same stack share the same span,
+/// so no Python objects are allocated per transition. Cursors are rebuilt on demand from the index stack and a view of
+/// the entry, whose id is the translation id of the cost key.
+#[pyclass]
+pub struct PhonemeProvenanceTable {
+    spans: HashMap<TransitionCostKey, IndexStackSpan>,
+    index_stacks: Vec<u16>,
+    last_span: Option<IndexStackSpan>,
+}
+
+impl PhonemeProvenanceTable {
+    fn stack_at(&self, span: IndexStackSpan) -> &[u16] {
+        &self.index_stacks[span.start as usize..span.start as usize + span.len as usize]
+    }
+
+    fn push_stack(&mut self, index_stack: &[usize]) -> Result<IndexStackSpan, PyErr> {
+        let packed = index_stack.iter()
+            .map(|&index| u16::try_from(index))
+            .collect::<Result<Vec<_>, _>>()
+            .map_err(|_| PyValueError::new_err("index stack contains an index too large to record"))?;
+
+        if let Some(last_span) = self.last_span {
+            if self.stack_at(last_span) == packed.as_slice() {
+                return Ok(last_span);
+            }
+        }
+
+        let span = IndexStackSpan {
+            start: u32::try_from(self.index_stacks.len())
+                .map_err(|_| PyValueError::new_err("too many index stacks recorded"))?,
+            len: u8::try_from(packed.len())
+                .map_err(|_| PyValueError::new_err("index stack is too deep to record"))?,
+        };
+
+        self.index_stacks.extend(packed);
+        self.last_span = Some(span);
+
+        Ok(span)
+    }
+
+    pub fn record(&mut self, cost_key: TransitionCostKey, index_stack: &[usize]) -> Result<(), PyErr> {
+        let span = self.push_stack(index_stack)?;
+        self.spans.insert(cost_key, span);
+        Ok(())
+    }
+}
+
+#[pymethods]
+impl PhonemeProvenanceTable {
+    #[new]
+    pub fn new() -> Self {
+        Self {
+            spans: HashMap::new(),
+            index_stacks: Vec::new(),
+            last_span: None,
+        }
+    }
+
+    #[pyo3(name = "record")]
+    pub fn record_py(&mut self, cost_key: TransitionCostKey, index_stack: Vec<usize>) -> Result<(), PyErr> {
+        self.record(cost_key, &index_stack)
+    }
+
+    pub fn get_index_stack(&self, cost_key: TransitionCostKey) -> Option<Vec<usize>> {
+        self.spans.get(&cost_key)
+            .map(|&span| self.stack_at(span).iter().map(|&index| index as usize).collect())
+    }
+
+    pub fn __contains__(&self, cost_key: TransitionCostKey) -> bool {
+        self.spans.contains_key(&cost_key)
+    }
+
+    pub fn __len__(&self) -> usize {
+        self.spans.len()
+    }
+
+    /// Gets the cost keys of the given transitions that have a recorded phoneme for the given entry.
+    pub fn recorded_cost_keys(&self, transitions: Vec<TransitionKey>, entry_id: usize) -> Vec<TransitionCostKey> {
+        transitions.into_iter()
+            .map(|transition| TransitionCostKey::new(transition, entry_id))
+            .filter(|cost_key| self.spans.contains_key(cost_key))
+            .collect()
+    }
+
+    /// Releases excess capacity once no more records will be added.
+    pub fn complete_build(&mut self) {
+        self.spans.shrink_to_fit();
+        self.index_stacks.shrink_to_fit();
+        self.last_span = None;
+    }
+}
+
+
+#[cfg(test)]
+mod test {
+    use super::*;
+
+    fn cost_key(src_node_index: usize, entry_id: usize) -> TransitionCostKey {
+        TransitionCostKey::new(TransitionKey::new(src_node_index, Some(0), 0), entry_id)
+    }
+
+    #[test]
+    fn records_and_reads_index_stacks() {
+        let mut table = PhonemeProvenanceTable::new();
+        table.record(cost_key(0, 0), &[0, 1, 2]).unwrap();
+        table.record(cost_key(1, 0), &[0, 3]).unwrap();
+
+        assert_eq!(table.get_index_stack(cost_key(0, 0)), Some(vec![0, 1, 2]));
+        assert_eq!(table.get_index_stack(cost_key(1, 0)), Some(vec![0, 3]));
+        assert_eq!(table.get_index_stack(cost_key(0, 1)), None);
+    }
+
+    #[test]
+    fn shares_consecutive_identical_stacks() {
+        let mut table = PhonemeProvenanceTable::new();
+        table.record(cost_key(0, 0), &[0, 1]).unwrap();
+        table.record(cost_key(1, 0), &[0, 1]).unwrap();
+
+        assert_eq!(table.index_stacks.len(), 2);
+        assert_eq!(table.get_index_stack(cost_key(1, 0)), Some(vec![0, 1]));
+    }
+}
@@ -13,6 +13,12 @@ pub use transition::TransitionCostInfo;
 
 mod transition_flag;
 pub use transition_flag::TransitionFlag;
+pub use transition_flag::TransitionFlagSet;
+
+mod subtrie_json;
+
+mod subtrie_query;
+pub use subtrie_query::SubtrieQuery;
 
 mod transition_flag_manager;
 pub use transition_flag_manager::TransitionFlagManager;
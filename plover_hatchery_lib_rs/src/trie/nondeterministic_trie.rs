@@ -1,8 +1,10 @@
-use std::collections::{HashMap, HashSet};
+use std::collections::{HashMap, HashSet, VecDeque};
 
 use pyo3::prelude::*;
 
 use super::transition::{TransitionCostInfo, TransitionCostKey, TransitionKey};
+use super::transition_flag::TransitionFlagSet;
+use super::subtrie_query::SubtrieQuery;
 
 /// A path through the trie, tracking the destination node and transitions taken.
 #[derive(Clone, Debug)]
@@ -64,7 +66,8 @@ pub type ReverseTranslations = HashMap<usize, Vec<usize>>;
 pub struct SubtrieTransition {
     pub src_node_id: usize,
     pub dst_node_id: usize,
-    pub key_infos: Vec<(Option<usize>, usize, f64)>,
+    /// (key id, transition index, cost, flag indices) for each transition between the two nodes
+    pub key_infos: Vec<(Option<usize>, usize, f64, Vec<usize>)>,
 }
 
 #[derive(Clone, Debug)]
@@ -74,6 +77,23 @@ pub struct SubtrieData {
     pub translation_nodes: Vec<usize>,
 }
 
+/// One page of a subtrie, as selected by a `SubtrieQuery`.
+#[derive(Clone, Debug)]
+pub struct SubtriePage {
+    pub data: SubtrieData,
+    /// The number of nodes across all pages
+    pub total_nodes: usize,
+    /// The cursor of the next page, if there is one
+    pub next_cursor: Option<usize>,
+}
+
+/// The cost of a (transition, translation) pair, along with the flags attached to it.
+#[derive(Clone, Copy, Debug)]
+pub struct TransitionCostRecord {
+    pub cost: f64,
+    pub flags: TransitionFlagSet,
+}
+
 /// A nondeterministic trie that can be in multiple states at once.
 /// Used for efficient lookup of stenographic translations.
 pub struct NondeterministicTrie {
@@ -81,14 +101,15 @@ pub struct NondeterministicTrie {
     transitions: Vec<HashMap<Option<usize>, Vec<usize>>>,
     /// Mapping from each node's id to its list of translation ids
     node_translations: HashMap<usize, Vec<usize>>,
-    /// Costs associated with each (transition, translation) pair
-    transition_costs: HashMap<TransitionCostKey, f64>,
+    /// Costs and flags associated with each (transition, translation) pair
+    transition_costs: HashMap<TransitionCostKey, TransitionCostRecord>,
     /// Tracks which nodes have been used by each translation during construction
     used_nodes_by_translation: HashMap<usize, HashSet<usize>>,
 }
 
 /// A source node with associated cost and outgoing transition flags.
-/// Used for building trie entries from multiple starting points.
+/// Used for building trie entries from multiple starting points. The outgoing cost and flags are applied to the first
+/// transition of every chain that a join creates from this node.
 #[derive(Clone, Debug)]
 #[pyclass]
 pub struct TransitionSourceNode {
@@ -96,29 +117,40 @@ pub struct TransitionSourceNode {
     pub src_node_index: usize,
     #[pyo3(get, set)]
     pub outgoing_cost: f64,
-    #[pyo3(get, set)]
-    pub outgoing_transition_flags: Vec<usize>,
+    pub outgoing_transition_flags: TransitionFlagSet,
 }
 
-#[pymethods]
 impl TransitionSourceNode {
-    #[new]
-    #[pyo3(signature = (src_node_index, outgoing_cost=0.0, outgoing_transition_flags=vec![]))]
-    pub fn new(src_node_index: usize, outgoing_cost: f64, outgoing_transition_flags: Vec<usize>) -> Self {
+    pub fn with_flags(src_node_index: usize, outgoing_cost: f64, outgoing_transition_flags: TransitionFlagSet) -> Self {
         Self {
             src_node_index,
             outgoing_cost,
             outgoing_transition_flags,
         }
     }
+}
+
+#[pymethods]
+impl TransitionSourceNode {
+    #[new]
+    #[pyo3(signature = (src_node_index, outgoing_cost=0.0, outgoing_transition_flags=vec![]))]
+    pub fn new(src_node_index: usize, outgoing_cost: f64, outgoing_transition_flags: Vec<usize>) -> Self {
+        Self::with_flags(src_node_index, outgoing_cost, TransitionFlagSet::from_indices(outgoing_transition_flags))
+    }
+
+    #[getter(outgoing_transition_flags)]
+    pub fn outgoing_transition_flags_py(&self) -> Vec<usize> {
+        self.outgoing_transition_flags.indices()
+    }
+
+    #[setter(outgoing_transition_flags)]
+    pub fn set_outgoing_transition_flags_py(&mut self, flag_indices: Vec<usize>) {
+        self.outgoing_transition_flags = TransitionFlagSet::from_indices(flag_indices);
+    }
 
     #[staticmethod]
     pub fn root() -> Self {
-        Self {
-            src_node_index: 0,
-            outgoing_cost: 0.0,
-            outgoing_transition_flags: vec![],
-        }
+        Self::with_flags(0, 0.0, TransitionFlagSet::EMPTY)
     }
 
     /// Creates copies of source nodes with incremented costs.
@@ -136,15 +168,12 @@ impl TransitionSourceNode {
     /// Creates copies of source nodes with additional flags.
     #[staticmethod]
     pub fn add_flags(srcs: Vec<TransitionSourceNode>, flags: Vec<usize>) -> Vec<TransitionSourceNode> {
+        let flags = TransitionFlagSet::from_indices(flags);
         srcs.into_iter()
-            .map(|src| {
-                let mut new_flags = src.outgoing_transition_flags.clone();
-                new_flags.extend(flags.iter());
-                TransitionSourceNode {
-                    src_node_index: src.src_node_index,
-                    outgoing_cost: src.outgoing_cost,
-                    outgoing_transition_flags: new_flags,
-                }
+            .map(|src| TransitionSourceNode {
+                src_node_index: src.src_node_index,
+                outgoing_cost: src.outgoing_cost,
+                outgoing_transition_flags: src.outgoing_transition_flags.union(flags),
             })
             .collect()
     }
@@ -218,8 +247,45 @@ impl NondeterministicTrie {
             TransitionKey::new(src_node_id, key_id, transition_index),
             cost_info.translation_id,
         );
-        let existing_cost = self.transition_costs.get(&cost_key).copied().unwrap_or(f64::INFINITY);
-        self.transition_costs.insert(cost_key, cost_info.cost.min(existing_cost));
+        self.transition_costs.entry(cost_key)
+            .and_modify(|record| record.cost = record.cost.min(cost_info.cost))
+            .or_insert(TransitionCostRecord {
+                cost: cost_info.cost,
+                flags: TransitionFlagSet::EMPTY,
+            });
+    }
+
+    /// Attaches flags to a (transition, translation) pair that has already been assigned a cost.
+    /// Returns whether the pair was found.
+    pub fn add_transition_flags(&mut self, cost_key: &TransitionCostKey, flags: TransitionFlagSet) -> bool {
+        if flags.is_empty() {
+            return self.transition_costs.contains_key(cost_key);
+        }
+
+        match self.transition_costs.get_mut(cost_key) {
+            Some(record) => {
+                record.flags = record.flags.union(flags);
+                true
+            },
+
+            None => false,
+        }
+    }
+
+    /// Attaches flags to every transition in the given joined paths for a translation.
+    pub fn add_joined_paths_flags(&mut self, paths: &JoinedTriePaths, translation_id: usize, flags: TransitionFlagSet) {
+        for seq in &paths.transition_seqs {
+            for transition in &seq.transitions {
+                self.add_transition_flags(&TransitionCostKey::new(*transition, translation_id), flags);
+            }
+        }
+    }
+
+    /// Gets the flags attached to a (transition, translation) pair.
+    pub fn get_transition_flags(&self, transition: &TransitionKey, translation_id: usize) -> TransitionFlagSet {
+        self.transition_costs.get(&TransitionCostKey::new(*transition, translation_id))
+            .map(|record| record.flags)
+            .unwrap_or_default()
     }
 
     /// Gets the destination node by following an existing transition or creates it if it doesn't exist.
@@ -432,6 +498,7 @@ impl NondeterministicTrie {
             let (first_src, first_keys) = pairs[0];
             let cost_info = TransitionCostInfo::new(first_src.outgoing_cost, translation_id);
             let first_path = self.follow_chain(first_src.src_node_index, first_keys, &cost_info);
+            self.add_outgoing_flags(first_src, &first_path.transitions, translation_id);
             transition_seqs.push(JoinedTransitionSeq {
                 transitions: first_path.transitions,
             });
@@ -439,6 +506,7 @@ impl NondeterministicTrie {
             for (src, keys) in pairs.iter().skip(1) {
                 let cost_info = TransitionCostInfo::new(src.outgoing_cost, translation_id);
                 let transitions = self.link_chain(src.src_node_index, first_path.dst_node_id, keys, &cost_info);
+                self.add_outgoing_flags(src, &transitions, translation_id);
                 transition_seqs.push(JoinedTransitionSeq { transitions });
             }
             return JoinedTriePaths {
@@ -451,6 +519,7 @@ impl NondeterministicTrie {
         for (src, keys) in pairs {
             let cost_info = TransitionCostInfo::new(src.outgoing_cost, translation_id);
             let transitions = self.link_chain(src.src_node_index, actual_dst_node_id, keys, &cost_info);
+            self.add_outgoing_flags(src, &transitions, translation_id);
             transition_seqs.push(JoinedTransitionSeq { transitions });
         }
 
@@ -460,6 +529,37 @@ impl NondeterministicTrie {
         }
     }
 
+    /// Attaches a source node's outgoing flags to the first transition of a chain created from it.
+    fn add_outgoing_flags(&mut self, src: &TransitionSourceNode, transitions: &[TransitionKey], translation_id: usize) {
+        if let Some(first_transition) = transitions.first() {
+            self.add_transition_flags(
+                &TransitionCostKey::new(*first_transition, translation_id),
+                src.outgoing_transition_flags,
+            );
+        }
+    }
+
+    /// Drops bookkeeping that is only needed while entries are being added, and releases excess capacity from the
+    /// remaining structures. Nodes may be reused incorrectly if entries are added after this is called.
+    pub fn complete_build(&mut self) {
+        self.used_nodes_by_translation = HashMap::new();
+
+        for node_transitions in self.transitions.iter_mut() {
+            for dst_node_ids in node_transitions.values_mut() {
+                dst_node_ids.shrink_to_fit();
+            }
+            node_transitions.shrink_to_fit();
+        }
+        self.transitions.shrink_to_fit();
+
+        for translation_ids in self.node_translations.values_mut() {
+            translation_ids.shrink_to_fit();
+        }
+        self.node_translations.shrink_to_fit();
+
+        self.transition_costs.shrink_to_fit();
+    }
+
     /// Sets a translation at a node.
     pub fn set_translation(&mut self, node_id: usize, translation_id: usize) {
         self.node_translations
@@ -559,8 +659,8 @@ impl NondeterministicTrie {
 
             for transition in transitions {
                 let key = TransitionCostKey::new(*transition, translation_id);
-                if let Some(&cost) = self.transition_costs.get(&key) {
-                    cumsum_cost += cost;
+                if let Some(record) = self.transition_costs.get(&key) {
+                    cumsum_cost += record.cost;
                 } else {
                     is_valid_path = false;
                     break;
@@ -596,7 +696,7 @@ impl NondeterministicTrie {
         translation_id: usize,
     ) -> Option<f64> {
         let cost_key = TransitionCostKey::new(*transition, translation_id);
-        self.transition_costs.get(&cost_key).copied()
+        self.transition_costs.get(&cost_key).map(|record| record.cost)
     }
 
     /// Checks if a transition has a specific key.
@@ -647,6 +747,62 @@ impl NondeterministicTrie {
         self.transitions.len()
     }
 
+    /// Gets the largest number of keyed (non-empty) transitions along any path from the root, or None if a cycle of
+    /// transitions makes paths unbounded.
+    pub fn max_keyed_depth(&self) -> Option<usize> {
+        #[derive(Clone, Copy, PartialEq)]
+        enum VisitState {
+            Unvisited,
+            InProgress,
+            Done(usize),
+        }
+
+        let mut visit_states = vec![VisitState::Unvisited; self.transitions.len()];
+        // (node, whether its children have all been visited)
+        let mut stack: Vec<(usize, bool)> = vec![(Self::ROOT, false)];
+
+        while let Some((node_id, children_visited)) = stack.pop() {
+            if children_visited {
+                let depth = self.transitions[node_id].iter()
+                    .flat_map(|(key_id, dst_node_ids)| dst_node_ids.iter().map(move |&dst_node_id| (key_id, dst_node_id)))
+                    .map(|(key_id, dst_node_id)| match visit_states[dst_node_id] {
+                        VisitState::Done(dst_depth) => dst_depth + usize::from(key_id.is_some()),
+                        _ => 0,
+                    })
+                    .max()
+                    .unwrap_or(0);
+
+                visit_states[node_id] = VisitState::Done(depth);
+                continue;
+            }
+
+            match visit_states[node_id] {
+                VisitState::Done(_) => continue,
+                // The node is an ancestor on the current path
+                VisitState::InProgress => return None,
+                VisitState::Unvisited => {},
+            }
+
+            visit_states[node_id] = VisitState::InProgress;
+            stack.push((node_id, true));
+
+            for dst_node_ids in self.transitions[node_id].values() {
+                for &dst_node_id in dst_node_ids {
+                    match visit_states[dst_node_id] {
+                        VisitState::Done(_) => {},
+                        VisitState::InProgress => return None,
+                        VisitState::Unvisited => stack.push((dst_node_id, false)),
+                    }
+                }
+            }
+        }
+
+        match visit_states[Self::ROOT] {
+            VisitState::Done(depth) => Some(depth),
+            _ => None,
+        }
+    }
+
     /// Gets all translation IDs that have been set.
     pub fn get_all_translation_ids(&self) -> Vec<usize> {
         let mut ids: HashSet<usize> = HashSet::new();
@@ -754,7 +910,7 @@ impl NondeterministicTrie {
 
                     let transition_key = TransitionKey::new(src_node_id, key_id, transition_index);
                     let cost_key = TransitionCostKey::new(transition_key, translation_id);
-                    let transition_cost = *self.transition_costs.get(&cost_key).unwrap_or(&0.0);
+                    let transition_cost = self.transition_costs.get(&cost_key).map_or(0.0, |record| record.cost);
 
                     transitions_reversed.push(transition_key);
                     visited_nodes.insert(src_node_id);
@@ -782,51 +938,104 @@ impl NondeterministicTrie {
         reverse_translations: &ReverseTranslations,
         translation_id: usize,
     ) -> Option<SubtrieData> {
-        if !reverse_translations.contains_key(&translation_id) {
-            return None;
-        }
+        self.get_subtrie_page(
+            reverse_nodes,
+            reverse_translations,
+            translation_id,
+            &SubtrieQuery::default(),
+            TransitionFlagSet::EMPTY,
+        ).map(|page| page.data)
+    }
 
-        let mut visited_nodes = HashSet::new();
-        let mut nodes_toposort = Vec::new();
-        // (src, dst) -> list of key, transition_index
-        let mut visited_transitions: HashMap<(usize, usize), Vec<(Option<usize>, usize)>> =
+    /// Gets one page of the subtrie of a translation.
+    ///
+    /// Transitions that the query does not admit are pruned during the search, so nodes that are only reachable through
+    /// them are never visited. Without a `max_depth`, the subtrie is searched backward from the translation's nodes.
+    /// With one, it is searched forward from the root instead, so that the search stops `max_depth` transitions in. The
+    /// nodes are then paged in topological order. Each transition is part of the page of whichever of its endpoints
+    /// comes later.
+    pub fn get_subtrie_page(
+        &self,
+        reverse_nodes: &ReverseNodes,
+        reverse_translations: &ReverseTranslations,
+        translation_id: usize,
+        query: &SubtrieQuery,
+        excluded_flags: TransitionFlagSet,
+    ) -> Option<SubtriePage> {
+        let translation_nodes = reverse_translations.get(&translation_id)?;
+
+        // (src, dst) -> list of key, transition_index, cost record
+        let mut visited_transitions: HashMap<(usize, usize), Vec<(Option<usize>, usize, TransitionCostRecord)>> =
             HashMap::new();
 
-        if let Some(nodes) = reverse_translations.get(&translation_id) {
-            for &node in nodes {
-                self.dfs_subtrie(
-                    node,
-                    translation_id,
-                    &mut visited_nodes,
-                    reverse_nodes,
-                    &mut visited_transitions,
-                    &mut nodes_toposort,
-                );
-            }
-        }
+        let nodes: Vec<usize> = match query.max_depth {
+            Some(max_depth) => self.bfs_subtrie(translation_id, query, excluded_flags, max_depth, &mut visited_transitions),
 
-        let mut transitions = Vec::new();
-        for ((src_node_id, dst_node_id), key_indices) in visited_transitions {
-            let mut key_infos = Vec::new();
-            for (key_id, transition_index) in key_indices {
-                let cost_key = TransitionCostKey::new(
-                    TransitionKey::new(src_node_id, key_id, transition_index),
-                    translation_id,
-                );
-                let cost = *self.transition_costs.get(&cost_key).unwrap_or(&0.0);
-                key_infos.push((key_id, transition_index, cost));
+            None => {
+                let mut visited_nodes = HashSet::new();
+                let mut nodes_toposort = Vec::new();
+
+                for &node in translation_nodes {
+                    self.dfs_subtrie(
+                        node,
+                        translation_id,
+                        query,
+                        excluded_flags,
+                        &mut visited_nodes,
+                        reverse_nodes,
+                        &mut visited_transitions,
+                        &mut nodes_toposort,
+                    );
+                }
+
+                let reachable_nodes = Self::nodes_reachable_from_root(&visited_transitions);
+                nodes_toposort.into_iter()
+                    .filter(|node| reachable_nodes.contains(node))
+                    .collect()
+            },
+        };
+        let positions: HashMap<usize, usize> = nodes.iter()
+            .enumerate()
+            .map(|(position, &node)| (node, position))
+            .collect();
+
+        let total_nodes = nodes.len();
+        let page_start = query.cursor.min(total_nodes);
+        let page_end = query.max_nodes
+            .map_or(total_nodes, |max_nodes| page_start.saturating_add(max_nodes).min(total_nodes));
+
+        let mut page_transitions = Vec::new();
+        for ((src_node_id, dst_node_id), key_infos) in visited_transitions {
+            let (Some(&src_position), Some(&dst_position)) = (positions.get(&src_node_id), positions.get(&dst_node_id)) else {
+                continue;
+            };
+
+            let position = src_position.max(dst_position);
+            if position < page_start || position >= page_end {
+                continue;
             }
-            transitions.push(SubtrieTransition {
+
+            page_transitions.push((position, SubtrieTransition {
                 src_node_id,
                 dst_node_id,
-                key_infos,
-            });
+                key_infos: key_infos.into_iter()
+                    .map(|(key_id, transition_index, record)| (key_id, transition_index, record.cost, record.flags.indices()))
+                    .collect(),
+            }));
         }
-
-        Some(SubtrieData {
-            nodes: nodes_toposort,
-            transitions,
-            translation_nodes: reverse_translations.get(&translation_id).cloned().unwrap_or_default(),
+        page_transitions.sort_by_key(|(position, transition)| (*position, transition.src_node_id));
+
+        Some(SubtriePage {
+            data: SubtrieData {
+                nodes: nodes[page_start..page_end].to_vec(),
+                transitions: page_transitions.into_iter().map(|(_, transition)| transition).collect(),
+                translation_nodes: translation_nodes.iter()
+                    .copied()
+                    .filter(|node| positions.contains_key(node))
+                    .collect(),
+            },
+            total_nodes,
+            next_cursor: (page_end < total_nodes).then_some(page_end),
         })
     }
 
@@ -834,9 +1043,11 @@ impl NondeterministicTrie {
         &self,
         node: usize,
         translation_id: usize,
+        query: &SubtrieQuery,
+        excluded_flags: TransitionFlagSet,
         visited_nodes: &mut HashSet<usize>,
         reverse_nodes: &ReverseNodes,
-        visited_transitions: &mut HashMap<(usize, usize), Vec<(Option<usize>, usize)>>,
+        visited_transitions: &mut HashMap<(usize, usize), Vec<(Option<usize>, usize, TransitionCostRecord)>>,
         nodes_toposort: &mut Vec<usize>,
     ) {
         if visited_nodes.contains(&node) {
@@ -847,18 +1058,22 @@ impl NondeterministicTrie {
         if let Some(src_nodes_map) = reverse_nodes.get(&node) {
             for (&key_id, src_nodes) in src_nodes_map {
                 for &(src_node_id, transition_index) in src_nodes {
-                    if !self.transition_has_cost_for_translation(
-                        src_node_id,
-                        key_id,
-                        transition_index,
+                    let cost_key = TransitionCostKey::new(
+                        TransitionKey::new(src_node_id, key_id, transition_index),
                         translation_id,
-                    ) {
+                    );
+                    let Some(record) = self.transition_costs.get(&cost_key) else {
+                        continue;
+                    };
+                    if !query.admits(record, excluded_flags) {
                         continue;
                     }
 
                     self.dfs_subtrie(
                         src_node_id,
                         translation_id,
+                        query,
+                        excluded_flags,
                         visited_nodes,
                         reverse_nodes,
                         visited_transitions,
@@ -868,7 +1083,7 @@ impl NondeterministicTrie {
                     visited_transitions
                         .entry((src_node_id, node))
                         .or_insert_with(Vec::new)
-                        .push((key_id, transition_index));
+                        .push((key_id, transition_index, *record));
                 }
             }
         }
@@ -876,6 +1091,107 @@ impl NondeterministicTrie {
         nodes_toposort.push(node);
     }
 
+    /// Searches the subtrie of a translation forward from the root, visiting only the nodes within `max_depth`
+    /// transitions of it. Returns the visited nodes in topological order.
+    fn bfs_subtrie(
+        &self,
+        translation_id: usize,
+        query: &SubtrieQuery,
+        excluded_flags: TransitionFlagSet,
+        max_depth: usize,
+        visited_transitions: &mut HashMap<(usize, usize), Vec<(Option<usize>, usize, TransitionCostRecord)>>,
+    ) -> Vec<usize> {
+        let mut depths = HashMap::from([(Self::ROOT, 0)]);
+        let mut queue = VecDeque::from([Self::ROOT]);
+
+        while let Some(node) = queue.pop_front() {
+            let depth = depths[&node];
+
+            for (&key_id, dst_node_ids) in &self.transitions[node] {
+                for (transition_index, &dst_node_id) in dst_node_ids.iter().enumerate() {
+                    // Nodes at the maximum depth keep their transitions to nodes that were already visited
+                    if depth >= max_depth && !depths.contains_key(&dst_node_id) {
+                        continue;
+                    }
+
+                    let cost_key = TransitionCostKey::new(
+                        TransitionKey::new(node, key_id, transition_index),
+                        translation_id,
+                    );
+                    let Some(record) = self.transition_costs.get(&cost_key) else {
+                        continue;
+                    };
+                    if !query.admits(record, excluded_flags) {
+                        continue;
+                    }
+
+                    visited_transitions
+                        .entry((node, dst_node_id))
+                        .or_insert_with(Vec::new)
+                        .push((key_id, transition_index, *record));
+
+                    if !depths.contains_key(&dst_node_id) {
+                        depths.insert(dst_node_id, depth + 1);
+                        queue.push_back(dst_node_id);
+                    }
+                }
+            }
+        }
+
+        Self::toposort(depths.into_keys(), visited_transitions)
+    }
+
+    /// Orders nodes so that every transition between them goes from an earlier node to a later one.
+    fn toposort<V>(nodes: impl Iterator<Item = usize>, transitions: &HashMap<(usize, usize), V>) -> Vec<usize> {
+        let mut n_incoming: HashMap<usize, usize> = nodes.map(|node| (node, 0)).collect();
+        let mut dst_nodes_by_src: HashMap<usize, Vec<usize>> = HashMap::new();
+        for &(src_node_id, dst_node_id) in transitions.keys() {
+            dst_nodes_by_src.entry(src_node_id).or_default().push(dst_node_id);
+            *n_incoming.entry(dst_node_id).or_default() += 1;
+        }
+
+        let mut ready: Vec<usize> = n_incoming.iter()
+            .filter(|(_, count)| **count == 0)
+            .map(|(&node, _)| node)
+            .collect();
+        let mut nodes_toposort = Vec::with_capacity(n_incoming.len());
+
+        while let Some(node) = ready.pop() {
+            nodes_toposort.push(node);
+
+            for &dst_node_id in dst_nodes_by_src.get(&node).into_iter().flatten() {
+                let count = n_incoming.get_mut(&dst_node_id).unwrap();
+                *count -= 1;
+                if *count == 0 {
+                    ready.push(dst_node_id);
+                }
+            }
+        }
+
+        nodes_toposort
+    }
+
+    /// Finds the nodes of a subtrie that can be reached from the root at all.
+    fn nodes_reachable_from_root<V>(transitions: &HashMap<(usize, usize), V>) -> HashSet<usize> {
+        let mut dst_nodes_by_src: HashMap<usize, Vec<usize>> = HashMap::new();
+        for &(src_node_id, dst_node_id) in transitions.keys() {
+            dst_nodes_by_src.entry(src_node_id).or_default().push(dst_node_id);
+        }
+
+        let mut reachable_nodes = HashSet::from([Self::ROOT]);
+        let mut stack = vec![Self::ROOT];
+
+        while let Some(node) = stack.pop() {
+            for &dst_node_id in dst_nodes_by_src.get(&node).into_iter().flatten() {
+                if reachable_nodes.insert(dst_node_id) {
+                    stack.push(dst_node_id);
+                }
+            }
+        }
+
+        reachable_nodes
+    }
+
     /// Checks if a transition has a cost for a specific translation.
     pub fn transition_has_cost_for_translation(
         &self,
@@ -928,4 +1244,87 @@ mod test {
         assert_eq!(results.len(), 1);
         assert_eq!(results[0], (42, 1.0));
     }
+
+    #[test]
+    fn test_complete_build_keeps_lookups() {
+        let mut trie = NondeterministicTrie::new();
+        let cost_info = TransitionCostInfo::new(1.0, 0);
+        let path = trie.follow(0, Some(1), &cost_info);
+        trie.set_translation(path.dst_node_id, 0);
+
+        trie.complete_build();
+        assert!(trie.used_nodes_by_translation.is_empty());
+
+        let results: Vec<_> = trie.get_translations_and_costs_single(path.dst_node_id, &path.transitions);
+        assert_eq!(results, vec![(0, 1.0)]);
+    }
+
+    #[test]
+    fn test_max_keyed_depth_skips_empty_transitions() {
+        let mut trie = NondeterministicTrie::new();
+        let cost_info = TransitionCostInfo::new(0.0, 0);
+        let path = trie.follow_chain(0, &[Some(1), None, Some(2)], &cost_info);
+        let _ = trie.follow(0, Some(3), &cost_info);
+        trie.set_translation(path.dst_node_id, 0);
+
+        assert_eq!(trie.max_keyed_depth(), Some(2));
+    }
+
+    #[test]
+    fn test_join_applies_outgoing_flags_to_first_transitions() {
+        let mut trie = NondeterministicTrie::new();
+        let srcs = vec![
+            TransitionSourceNode::with_flags(0, 0.0, TransitionFlagSet::single(2)),
+        ];
+        let paths = trie.link_join_chain(&srcs, None, &[vec![Some(1), Some(2)]], 0);
+        let transitions = &paths.transition_seqs[0].transitions;
+
+        assert!(trie.get_transition_flags(&transitions[0], 0).contains(2));
+        assert!(trie.get_transition_flags(&transitions[1], 0).is_empty());
+        assert!(trie.get_transition_flags(&transitions[0], 1).is_empty());
+
+        trie.add_joined_paths_flags(&paths, 0, TransitionFlagSet::single(5));
+        assert_eq!(trie.get_transition_flags(&transitions[1], 0).indices(), vec![5]);
+        assert_eq!(trie.get_transition_flags(&transitions[0], 0).indices(), vec![2, 5]);
+    }
+
+    #[test]
+    fn test_subtrie_page_prunes_and_pages() {
+        let mut trie = NondeterministicTrie::new();
+        let cheap = TransitionCostInfo::new(0.0, 0);
+        let costly = TransitionCostInfo::new(5.0, 0);
+        let path = trie.follow_chain(0, &[Some(1), Some(2), Some(3)], &cheap);
+        let _ = trie.link(0, path.dst_node_id, Some(4), &costly);
+        trie.set_translation(path.dst_node_id, 0);
+
+        let reverse_nodes = trie.reversed_nodes();
+        let reverse_translations = trie.reversed_translations();
+        let page = |query: &SubtrieQuery| {
+            trie.get_subtrie_page(&reverse_nodes, &reverse_translations, 0, query, TransitionFlagSet::EMPTY).unwrap()
+        };
+
+        let full = page(&SubtrieQuery::default());
+        assert_eq!(full.total_nodes, 4);
+        assert_eq!(full.data.transitions.len(), 4);
+        assert_eq!(full.next_cursor, None);
+
+        let shallow = page(&SubtrieQuery { max_depth: Some(1), ..Default::default() });
+        assert_eq!(shallow.total_nodes, 3);
+        assert_eq!(shallow.data.nodes[0], NondeterministicTrie::ROOT);
+        assert_eq!(shallow.data.transitions.len(), 2);
+        assert_eq!(shallow.data.translation_nodes, vec![path.dst_node_id]);
+
+        let root_only = page(&SubtrieQuery { max_depth: Some(0), ..Default::default() });
+        assert_eq!(root_only.data.nodes, vec![NondeterministicTrie::ROOT]);
+        assert!(root_only.data.transitions.is_empty());
+
+        let cheap_only = page(&SubtrieQuery { max_transition_cost: Some(1.0), ..Default::default() });
+        assert_eq!(cheap_only.data.transitions.len(), 3);
+
+        let first = page(&SubtrieQuery { max_nodes: Some(2), ..Default::default() });
+        let second = page(&SubtrieQuery { max_nodes: Some(2), cursor: first.next_cursor.unwrap(), ..Default::default() });
+        assert_eq!(first.data.nodes.len() + second.data.nodes.len(), 4);
+        assert_eq!(first.data.transitions.len() + second.data.transitions.len(), 4);
+        assert_eq!(second.next_cursor, None);
+    }
 }
\ No newline at end of file
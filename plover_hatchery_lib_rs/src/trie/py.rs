@@ -1,10 +1,16 @@
 use pyo3::prelude::*;
 
 use super::nondeterministic_trie::{LookupResult, NondeterministicTrie, TriePath, TransitionSourceNode, JoinedTriePaths};
-use super::transition::{TransitionCostInfo, TransitionKey};
+use super::transition::{TransitionCostInfo, TransitionCostKey, TransitionKey};
+use super::transition_flag::TransitionFlagSet;
+use super::subtrie_query::SubtrieQuery;
 
 
-/// Python wrapper for NondeterministicTrie
+/// Python wrapper for NondeterministicTrie.
+///
+/// Read-only queries release the GIL while they run, so that heavy queries from one thread (such as breakdowns for the
+/// web server) do not hold up lookups on another. The trie itself is only borrowed immutably during those queries, and
+/// `NondeterministicTrie` holds no Python objects, so it is `Sync`.
 #[pyclass]
 #[pyo3(name = "NondeterministicTrie")]
 pub struct PyNondeterministicTrie {
@@ -97,43 +103,57 @@ impl PyNondeterministicTrie {
         self.trie.link_join_chain(&rs_src_nodes, dst_node_id, &key_id_chains, translation_id)
     }
 
+    /// Drop construction-only bookkeeping once all entries have been added.
+    pub fn complete_build(&mut self) {
+        self.trie.complete_build();
+    }
+
     /// Set a translation at a node.
     pub fn set_translation(&mut self, node_id: usize, translation_id: usize) {
         self.trie.set_translation(node_id, translation_id);
     }
 
     /// Traverse from source paths following a key.
-    pub fn traverse(&self, src_node_paths: Vec<TriePath>, key_id: Option<usize>) -> Vec<TriePath> {
-        self.trie
-            .traverse(src_node_paths.into_iter(), key_id)
-            .collect()
+    pub fn traverse(&self, py: Python<'_>, src_node_paths: Vec<TriePath>, key_id: Option<usize>) -> Vec<TriePath> {
+        let trie = self.trie.as_ref();
+        py.detach(|| {
+            trie.traverse(src_node_paths.into_iter(), key_id)
+                .collect()
+        })
     }
 
     /// Traverse from source paths following a chain of keys.
     pub fn traverse_chain(
         &self,
+        py: Python<'_>,
         src_node_paths: Vec<TriePath>,
         key_ids: Vec<Option<usize>>,
     ) -> Vec<TriePath> {
-        self.trie
-            .traverse_chain(src_node_paths.into_iter(), &key_ids)
-            .collect()
+        let trie = self.trie.as_ref();
+        py.detach(|| {
+            trie.traverse_chain(src_node_paths.into_iter(), &key_ids)
+                .collect()
+        })
     }
 
     /// Get translations and costs for a single node.
     pub fn get_translations_and_costs_single(
         &self,
+        py: Python<'_>,
         node_id: usize,
         transitions: Vec<TransitionKey>,
     ) -> Vec<(usize, f64)> {
-        self.trie.get_translations_and_costs_single(node_id, &transitions)
+        let trie = self.trie.as_ref();
+        py.detach(|| trie.get_translations_and_costs_single(node_id, &transitions))
     }
 
     /// Get translations and costs for multiple paths.
-    pub fn get_translations_and_costs(&self, node_paths: Vec<TriePath>) -> Vec<LookupResult> {
-        self.trie
-            .get_translations_and_costs(node_paths.into_iter())
-            .collect()
+    pub fn get_translations_and_costs(&self, py: Python<'_>, node_paths: Vec<TriePath>) -> Vec<LookupResult> {
+        let trie = self.trie.as_ref();
+        py.detach(|| {
+            trie.get_translations_and_costs(node_paths.into_iter())
+                .collect()
+        })
     }
 
     /// Get the cost of a specific transition for a translation.
@@ -145,14 +165,30 @@ impl PyNondeterministicTrie {
         self.trie.get_transition_cost(&transition, translation_id)
     }
 
+    /// Attach a flag to a (transition, translation) pair. Returns whether the pair exists in the trie.
+    pub fn flag_transition(&mut self, cost_key: TransitionCostKey, flag_index: usize) -> bool {
+        self.trie.add_transition_flags(&cost_key, TransitionFlagSet::single(flag_index))
+    }
+
+    /// Attach a flag to every transition in the given joined paths for a translation.
+    pub fn flag_joined_paths(&mut self, paths: &JoinedTriePaths, translation_id: usize, flag_index: usize) {
+        self.trie.add_joined_paths_flags(paths, translation_id, TransitionFlagSet::single(flag_index));
+    }
+
+    /// Get the indices of the flags attached to a transition for a translation.
+    pub fn get_transition_flags(&self, transition: &TransitionKey, translation_id: usize) -> Vec<usize> {
+        self.trie.get_transition_flags(transition, translation_id).indices()
+    }
+
     /// Check if a transition has a specific key.
     pub fn transition_has_key(&self, transition: &TransitionKey, key_id: Option<usize>) -> bool {
         self.trie.transition_has_key(transition, key_id)
     }
 
     /// Get translations with minimum costs for each translation_id.
-    pub fn get_translations_and_min_costs(&self, node_paths: Vec<TriePath>) -> Vec<LookupResult> {
-        self.trie.get_translations_and_min_costs(node_paths.into_iter())
+    pub fn get_translations_and_min_costs(&self, py: Python<'_>, node_paths: Vec<TriePath>) -> Vec<LookupResult> {
+        let trie = self.trie.as_ref();
+        py.detach(|| trie.get_translations_and_min_costs(node_paths.into_iter()))
     }
 
     /// Get all translation IDs that have been set.
@@ -165,6 +201,11 @@ impl PyNondeterministicTrie {
         self.trie.n_nodes()
     }
 
+    /// Get the largest number of keyed transitions along any path, or None if paths are unbounded.
+    pub fn max_keyed_depth(&self) -> Option<usize> {
+        self.trie.max_keyed_depth()
+    }
+
     /// Check if a transition has a cost for a specific translation.
     pub fn transition_has_cost_for_translation(
         &self,
@@ -181,11 +222,14 @@ impl PyNondeterministicTrie {
     const ROOT: usize = NondeterministicTrie::ROOT;
 
     /// Create a reverse index for efficient reverse lookups.
-    pub fn create_reverse_index(&self) -> PyReverseTrieIndex {
-        PyReverseTrieIndex {
-            reverse_nodes: self.trie.reversed_nodes(),
-            reverse_translations: self.trie.reversed_translations(),
-        }
+    pub fn create_reverse_index(&self, py: Python<'_>) -> PyReverseTrieIndex {
+        let trie = self.trie.as_ref();
+        py.detach(|| PyReverseTrieIndex {
+            reverse_nodes: trie.reversed_nodes(),
+            reverse_translations: trie.reversed_translations(),
+            key_labels: Vec::new(),
+            flag_labels: Vec::new(),
+        })
     }
 }
 
@@ -195,28 +239,67 @@ impl PyNondeterministicTrie {
 pub struct PyReverseTrieIndex {
     reverse_nodes: crate::trie::nondeterministic_trie::ReverseNodes,
     reverse_translations: crate::trie::nondeterministic_trie::ReverseTranslations,
+    /// Labels used when serializing subtries, indexed by key id
+    key_labels: Vec<String>,
+    /// Labels used when serializing subtries, indexed by flag index
+    flag_labels: Vec<String>,
 }
 
 #[pymethods]
 impl PyReverseTrieIndex {
     #[pyo3(signature = (trie, translation_id))]
-    fn get_sequences(&self, trie: &PyNondeterministicTrie, translation_id: usize) -> Vec<LookupResult> {
-        trie.trie.get_reverse_lookup_results(&self.reverse_nodes, &self.reverse_translations, translation_id)
+    fn get_sequences(&self, py: Python<'_>, trie: &PyNondeterministicTrie, translation_id: usize) -> Vec<LookupResult> {
+        let trie = trie.trie.as_ref();
+        py.detach(|| trie.get_reverse_lookup_results(&self.reverse_nodes, &self.reverse_translations, translation_id))
     }
 
-    #[pyo3(signature = (trie, translation_id))]
+    /// Sets the labels of keys and flags used by `get_subtrie_json`.
+    #[pyo3(signature = (key_labels, flag_labels))]
+    fn set_labels(&mut self, key_labels: Vec<String>, flag_labels: Vec<String>) {
+        self.key_labels = key_labels;
+        self.flag_labels = flag_labels;
+    }
+
+    /// Serializes (a page of) the subtrie of a translation straight to JSON, without holding the GIL.
+    #[pyo3(signature = (trie, translation_id, query=None))]
+    fn get_subtrie_json(
+        &self,
+        py: Python<'_>,
+        trie: &PyNondeterministicTrie,
+        translation_id: usize,
+        query: Option<PyRef<'_, SubtrieQuery>>,
+    ) -> Option<String> {
+        let query = query.map(|query| (*query).clone()).unwrap_or_default();
+        let excluded_flags = query.excluded_flag_set(&self.flag_labels);
+
+        let rs_trie = trie.trie.as_ref();
+        py.detach(|| {
+            rs_trie.get_subtrie_page(&self.reverse_nodes, &self.reverse_translations, translation_id, &query, excluded_flags)
+                .map(|page| page.to_json(&self.key_labels, &self.flag_labels))
+        })
+    }
+
+    #[pyo3(signature = (trie, translation_id, query=None))]
     fn get_subtrie_data(
         &self,
         py: Python<'_>,
         trie: &PyNondeterministicTrie,
         translation_id: usize,
+        query: Option<PyRef<'_, SubtrieQuery>>,
     ) -> Option<Py<PyAny>> {
-        // First get the raw data from Rust
-        let subtrie_data = trie.trie.get_subtrie_data(
+        let query = query.map(|query| (*query).clone()).unwrap_or_default();
+        let excluded_flags = query.excluded_flag_set(&self.flag_labels);
+
+        // First get the raw data from Rust, without holding the GIL
+        let rs_trie = trie.trie.as_ref();
+        let page = py.detach(|| rs_trie.get_subtrie_page(
             &self.reverse_nodes,
             &self.reverse_translations,
-            translation_id
-        )?;
+            translation_id,
+            &query,
+            excluded_flags,
+        ))?;
+        let subtrie_data = page.data;
 
         // Now convert to Python objects
         let result_dict = pyo3::types::PyDict::new(py);
@@ -236,6 +319,9 @@ impl PyReverseTrieIndex {
              transitions_list.append(t_dict).ok()?;
         }
         result_dict.set_item("transitions", transitions_list).ok()?;
+
+        result_dict.set_item("total_nodes", page.total_nodes).ok()?;
+        result_dict.set_item("next_cursor", page.next_cursor).ok()?;
         
         Some(result_dict.into())
     }
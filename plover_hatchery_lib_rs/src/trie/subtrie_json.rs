@@ -0,0 +1,164 @@
+use std::fmt::Write;
+
+use super::nondeterministic_trie::{SubtrieData, SubtriePage};
+
+
+/// Label used for transitions that do not consume a key.
+const EMPTY_KEY_LABEL: &str = "(ε)";
+
+
+fn write_json_str(out: &mut String, value: &str) {
+    out.push('"');
+    for c in value.chars() {
+        match c {
+            '"' => out.push_str("\\\""),
+            '\\' => out.push_str("\\\\"),
+            '\n' => out.push_str("\\n"),
+            '\r' => out.push_str("\\r"),
+            '\t' => out.push_str("\\t"),
+            c if (c as u32) < 0x20 => {
+                let _ = write!(out, "\\u{:04x}", c as u32);
+            },
+            c => out.push(c),
+        }
+    }
+    out.push('"');
+}
+
+/// Writes a float the same way Python's `json.dumps` does, including its non-standard infinities.
+fn write_json_f64(out: &mut String, value: f64) {
+    if value.is_nan() {
+        out.push_str("NaN");
+    } else if value == f64::INFINITY {
+        out.push_str("Infinity");
+    } else if value == f64::NEG_INFINITY {
+        out.push_str("-Infinity");
+    } else if value.fract() == 0.0 && value.abs() < 1e16 {
+        let _ = write!(out, "{:.1}", value);
+    } else {
+        let _ = write!(out, "{}", value);
+    }
+}
+
+fn write_json_usizes(out: &mut String, values: &[usize]) {
+    out.push('[');
+    for (i, value) in values.iter().enumerate() {
+        if i > 0 {
+            out.push_str(", ");
+        }
+        let _ = write!(out, "{}", value);
+    }
+    out.push(']');
+}
+
+
+impl SubtrieData {
+    /// Serializes the subtrie into the JSON shape served by the breakdown API, without building any intermediate Python
+    /// objects.
+    ///
+    /// # Arguments
+    /// * `key_labels` - The label of each key id
+    /// * `flag_labels` - The label of each transition flag index
+    pub fn to_json(&self, key_labels: &[String], flag_labels: &[String]) -> String {
+        let mut out = String::new();
+
+        out.push('{');
+        self.write_json_fields(&mut out, key_labels, flag_labels);
+        out.push('}');
+
+        out
+    }
+
+    fn write_json_fields(&self, out: &mut String, key_labels: &[String], flag_labels: &[String]) {
+        out.push_str("\"nodes\": ");
+        write_json_usizes(out, &self.nodes);
+
+        out.push_str(", \"transitions\": [");
+        for (i, transition) in self.transitions.iter().enumerate() {
+            if i > 0 {
+                out.push_str(", ");
+            }
+
+            let _ = write!(
+                out,
+                "{{\"src_node_id\": {}, \"dst_node_id\": {}, \"keys_costs\": [",
+                transition.src_node_id,
+                transition.dst_node_id,
+            );
+
+            for (j, (key_id, _, cost, flag_indices)) in transition.key_infos.iter().enumerate() {
+                if j > 0 {
+                    out.push_str(", ");
+                }
+
+                let key_label = match key_id {
+                    Some(key_id) => key_labels.get(*key_id).map(String::as_str).unwrap_or(""),
+                    None => EMPTY_KEY_LABEL,
+                };
+
+                out.push_str("{\"key\": ");
+                write_json_str(out, key_label);
+                out.push_str(", \"cost\": ");
+                write_json_f64(out, *cost);
+                out.push_str(", \"flags\": [");
+                for (k, &flag_index) in flag_indices.iter().enumerate() {
+                    if k > 0 {
+                        out.push_str(", ");
+                    }
+                    write_json_str(out, flag_labels.get(flag_index).map(String::as_str).unwrap_or(""));
+                }
+                out.push_str("]}");
+            }
+
+            out.push_str("]}");
+        }
+
+        out.push_str("], \"translation_nodes\": ");
+        write_json_usizes(out, &self.translation_nodes);
+    }
+}
+
+impl SubtriePage {
+    /// Serializes the page in the same shape as a whole subtrie, along with the fields needed to fetch the next page.
+    pub fn to_json(&self, key_labels: &[String], flag_labels: &[String]) -> String {
+        let mut out = String::new();
+
+        out.push('{');
+        self.data.write_json_fields(&mut out, key_labels, flag_labels);
+        let _ = write!(out, ", \"total_nodes\": {}, \"next_cursor\": ", self.total_nodes);
+        match self.next_cursor {
+            Some(next_cursor) => {
+                let _ = write!(out, "{}", next_cursor);
+            },
+            None => out.push_str("null"),
+        }
+        out.push('}');
+
+        out
+    }
+}
+
+
+#[cfg(test)]
+mod test {
+    use super::*;
+    use super::super::nondeterministic_trie::SubtrieTransition;
+
+    #[test]
+    fn serializes_subtrie() {
+        let data = SubtrieData {
+            nodes: vec![0, 1],
+            transitions: vec![SubtrieTransition {
+                src_node_id: 0,
+                dst_node_id: 1,
+                key_infos: vec![(Some(0), 0, 1.5, vec![0]), (None, 0, 0.0, vec![])],
+            }],
+            translation_nodes: vec![1],
+        };
+
+        assert_eq!(
+            data.to_json(&["\"K\"".to_string()], &["skip".to_string()]),
+            r#"{"nodes": [0, 1], "transitions": [{"src_node_id": 0, "dst_node_id": 1, "keys_costs": [{"key": "\"K\"", "cost": 1.5, "flags": ["skip"]}, {"key": "(ε)", "cost": 0.0, "flags": []}]}], "translation_nodes": [1]}"#,
+        );
+    }
+}
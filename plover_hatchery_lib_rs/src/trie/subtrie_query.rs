@@ -0,0 +1,65 @@
+use pyo3::prelude::*;
+
+use super::nondeterministic_trie::TransitionCostRecord;
+use super::transition_flag::TransitionFlagSet;
+
+
+/// Limits on which part of a translation's subtrie to fetch, so that large subtries can be fetched a page at a time.
+#[derive(Clone, Debug, Default)]
+#[pyclass]
+pub struct SubtrieQuery {
+    /// The maximum number of transitions between the root and any returned node
+    #[pyo3(get)]
+    pub max_depth: Option<usize>,
+    /// The maximum number of nodes in a page
+    #[pyo3(get)]
+    pub max_nodes: Option<usize>,
+    /// Transitions that cost more than this are pruned
+    #[pyo3(get)]
+    pub max_transition_cost: Option<f64>,
+    /// Labels of the flags whose transitions are pruned
+    #[pyo3(get)]
+    pub excluded_flags: Vec<String>,
+    /// The position of the first node of the page, as given by the previous page's `next_cursor`
+    #[pyo3(get)]
+    pub cursor: usize,
+}
+
+#[pymethods]
+impl SubtrieQuery {
+    #[new]
+    #[pyo3(signature = (*, max_depth=None, max_nodes=None, max_transition_cost=None, excluded_flags=Vec::new(), cursor=0))]
+    pub fn new(
+        max_depth: Option<usize>,
+        max_nodes: Option<usize>,
+        max_transition_cost: Option<f64>,
+        excluded_flags: Vec<String>,
+        cursor: usize,
+    ) -> Self {
+        Self {
+            max_depth,
+            max_nodes,
+            max_transition_cost,
+            excluded_flags,
+            cursor,
+        }
+    }
+}
+
+impl SubtrieQuery {
+    /// Resolves the excluded flag labels against the labels of each flag index. Unknown labels are ignored.
+    pub fn excluded_flag_set(&self, flag_labels: &[String]) -> TransitionFlagSet {
+        TransitionFlagSet::from_indices(
+            flag_labels.iter()
+                .enumerate()
+                .filter(|(_, label)| self.excluded_flags.contains(label))
+                .map(|(flag_index, _)| flag_index)
+        )
+    }
+
+    /// Checks whether a (transition, translation) pair passes the cost threshold and flag filter.
+    pub fn admits(&self, record: &TransitionCostRecord, excluded_flags: TransitionFlagSet) -> bool {
+        self.max_transition_cost.map_or(true, |max_cost| record.cost <= max_cost)
+            && !record.flags.intersects(excluded_flags)
+    }
+}
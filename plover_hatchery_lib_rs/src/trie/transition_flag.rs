@@ -15,4 +15,66 @@ impl TransitionFlag {
             label,
         }
     }
-}
\ No newline at end of file
+}
+
+/// A set of transition flags, stored as a bitmask over the indices handed out by a `TransitionFlagManager`.
+#[derive(Clone, Copy, Debug, Default, PartialEq, Eq, Hash)]
+pub struct TransitionFlagSet(u32);
+
+impl TransitionFlagSet {
+    /// The maximum number of distinct flags that a set can hold.
+    pub const CAPACITY: usize = u32::BITS as usize;
+
+    pub const EMPTY: TransitionFlagSet = TransitionFlagSet(0);
+
+    pub fn single(flag_index: usize) -> Self {
+        Self(1u32.checked_shl(flag_index as u32).unwrap_or(0))
+    }
+
+    pub fn from_indices(flag_indices: impl IntoIterator<Item = usize>) -> Self {
+        flag_indices.into_iter()
+            .fold(Self::EMPTY, |set, flag_index| set.union(Self::single(flag_index)))
+    }
+
+    pub fn union(self, other: Self) -> Self {
+        Self(self.0 | other.0)
+    }
+
+    pub fn intersects(self, other: Self) -> bool {
+        self.0 & other.0 != 0
+    }
+
+    pub fn contains(self, flag_index: usize) -> bool {
+        self.0 & Self::single(flag_index).0 != 0
+    }
+
+    pub fn is_empty(self) -> bool {
+        self.0 == 0
+    }
+
+    pub fn indices(self) -> Vec<usize> {
+        (0..Self::CAPACITY)
+            .filter(|&flag_index| self.contains(flag_index))
+            .collect()
+    }
+}
+
+
+#[cfg(test)]
+mod test {
+    use super::*;
+
+    #[test]
+    fn flag_set_round_trips_indices() {
+        let set = TransitionFlagSet::from_indices([0, 3, 31]);
+        assert!(set.contains(3));
+        assert!(!set.contains(1));
+        assert_eq!(set.indices(), vec![0, 3, 31]);
+    }
+
+    #[test]
+    fn flag_set_ignores_out_of_range_indices() {
+        assert!(TransitionFlagSet::single(TransitionFlagSet::CAPACITY).is_empty());
+        assert!(!TransitionFlagSet::from_indices([1]).contains(TransitionFlagSet::CAPACITY + 1));
+    }
+}
@@ -46,12 +46,21 @@ class Transclusion:
 
 class Entity:
     class Sopheme(Entity):
+        __match_args__ = ("__sopheme",)
+
+        __sopheme: Sopheme
         def __init__(self, sopheme: Sopheme, /) -> None: ...
 
     class Transclusion(Entity):
+        __match_args__ = ("__transclusion",)
+
+        __transclusion: Transclusion
         def __init__(self, transclusion: Transclusion, /) -> None: ...
 
     class RawDef(Entity):
+        __match_args__ = ("__definition",)
+
+        __definition: Def
         def __init__(self, definition: Def, /) -> None: ...
 
 class Def:
@@ -181,14 +190,23 @@ def add_soph_trie_entry(
     view: DefView,
     map_to_sophs: Callable[[DefViewCursor], set[Soph]],
     get_key_ids_else_create: Callable[[DefViewCursor], Sequence[int]],
-    register_transition: Callable[[TransitionKey, int, DefViewCursor], None],
-    transition_flags: TransitionFlagManager,
+    phoneme_provenance: PhonemeProvenanceTable,
     skip_transition_flag_id: int,
     emit_begin_add_entry: Callable[[int], None],
     emit_add_soph_transition: Callable[[int, int, int], None],
 ) -> None: ...
 
 
+class PhonemeProvenanceTable:
+    def __init__(self, /) -> None: ...
+    def record(self, cost_key: TransitionCostKey, index_stack: Sequence[int], /) -> None: ...
+    def get_index_stack(self, cost_key: TransitionCostKey, /) -> list[int] | None: ...
+    def __contains__(self, cost_key: TransitionCostKey, /) -> bool: ...
+    def __len__(self, /) -> int: ...
+    def recorded_cost_keys(self, transitions: Sequence[TransitionKey], entry_id: int, /) -> list[TransitionCostKey]: ...
+    def complete_build(self, /) -> None: ...
+
+
 class NondeterministicTrie:
     ROOT: int
 
@@ -250,6 +268,8 @@ class NondeterministicTrie:
         /,
     ) -> JoinedTriePaths: ...
 
+    def complete_build(self, /) -> None: ...
+
     def set_translation(self, node_id: int, translation_id: int, /) -> None: ...
 
     def traverse(
@@ -286,6 +306,28 @@ class NondeterministicTrie:
         /,
     ) -> float | None: ...
 
+    def flag_transition(
+        self,
+        cost_key: TransitionCostKey,
+        flag_index: int,
+        /,
+    ) -> bool: ...
+
+    def flag_joined_paths(
+        self,
+        paths: JoinedTriePaths,
+        translation_id: int,
+        flag_index: int,
+        /,
+    ) -> None: ...
+
+    def get_transition_flags(
+        self,
+        transition: TransitionKey,
+        translation_id: int,
+        /,
+    ) -> list[int]: ...
+
     def transition_has_key(
         self,
         transition: TransitionKey,
@@ -303,6 +345,8 @@ class NondeterministicTrie:
 
     def n_nodes(self, /) -> int: ...
 
+    def max_keyed_depth(self, /) -> int | None: ...
+
     def transition_has_cost_for_translation(
         self,
         src_node_id: int,
@@ -392,7 +436,32 @@ class LookupResult:
 
 class ReverseTrieIndex:
     def get_sequences(self, trie: NondeterministicTrie, translation_id: int, /) -> list[LookupResult]: ...
-    def get_subtrie_data(self, trie: NondeterministicTrie, translation_id: int, /) -> dict[str, Any] | None: ...
+    def get_subtrie_data(self, trie: NondeterministicTrie, translation_id: int, query: SubtrieQuery | None=None, /) -> dict[str, Any] | None: ...
+    def set_labels(self, key_labels: Sequence[str], flag_labels: Sequence[str], /) -> None: ...
+    def get_subtrie_json(self, trie: NondeterministicTrie, translation_id: int, query: SubtrieQuery | None=None, /) -> str | None: ...
+
+
+class SubtrieQuery:
+    @property
+    def max_depth(self) -> int | None: ...
+    @property
+    def max_nodes(self) -> int | None: ...
+    @property
+    def max_transition_cost(self) -> float | None: ...
+    @property
+    def excluded_flags(self) -> list[str]: ...
+    @property
+    def cursor(self) -> int: ...
+
+    def __init__(
+        self,
+        *,
+        max_depth: int | None=None,
+        max_nodes: int | None=None,
+        max_transition_cost: float | None=None,
+        excluded_flags: Sequence[str]=(),
+        cursor: int=0,
+    ) -> None: ...
 
 
 class Soph:
@@ -448,4 +517,4 @@ class TransitionFlagManager:
     def __init__(self, /) -> None: ...
     def new_flag(self, label: str, /) -> int: ...
     def get_label(self, flag: int, /) -> str: ...
-    def get_flags(self, cost_key: TransitionCostKey, /) -> list[int]: ...
+    def labels(self, /) -> list[str]: ...